@@ -0,0 +1,169 @@
+"""This module benchmarks the processing and generation stages on synthetic activity exports.
+
+Run it from the project root:
+
+    python -m benchmarks.run_benchmarks [--sizes 1000,100000,1000000] [--engine columnar]
+                                        [--compare benchmarks/results/<previous>.json] [--pdf-limit 100000]
+
+For every size a synthetic export is generated and each step is timed: loading, every step of
+``transform_data``, ``save_processed_data``, reading the processed CSV and its binary sidecar
+back, ``build_pdf_tables`` and ``doc.build``. Results are stored as JSON in ``benchmarks/results/``
+so runs of different versions can be compared.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from unittest import mock
+from datetime import datetime
+from rich.console import Console
+from rich.table import Table
+from configs.config import config
+from benchmarks.synthetic_export import generate_export
+
+# Initialize the console for rich output
+console = Console()
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), "results")
+DEFAULT_SIZES = [1000, 100000, 1000000]
+
+def git_revision():
+    """Return the current git revision, or None outside of a git checkout."""
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def timed(timings, name, func, *args, **kwargs):
+    """Call a function and record its wall time under ``name``."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[name] = time.perf_counter() - start
+    return result
+
+def benchmark_size(rows, work_dir, engine=None, pdf_limit=None, trainers=5):
+    """Time every stage for one export size and return a mapping of stage name to seconds.
+
+    The PDF steps run for every size unless ``pdf_limit`` is given, in which case they are
+    skipped for exports with more rows than that.
+    """
+    from modules import processing, columnar, generation, sidecar
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate
+
+    for module in (processing, columnar, generation):
+        module.console.quiet = True
+
+    input_file = generate_export(os.path.join(work_dir, f"aktivitaetsbericht-{rows}.csv"), rows,
+                                 trainers=trainers)
+    timings = {}
+
+    # Write the processed files into the working directory and restore the setting afterwards
+    with mock.patch.dict(config.config["processing"], {"output_directory": work_dir}):
+        data = timed(timings, "load_and_validate_csv", processing.load_and_validate_csv, input_file,
+                     engine=engine)
+        for transform in processing.transformations_for(data):
+            data = timed(timings, transform.__name__, transform, data)
+        csv_path = timed(timings, "save_processed_data", processing.save_processed_data, data, input_file)
+
+    if pdf_limit is None or rows <= pdf_limit:
+        dataframe = timed(timings, "load_dataframe", generation.load_dataframe, csv_path)
+        timed(timings, "load_sidecar", sidecar.load_sidecar, csv_path)
+        doc = SimpleDocTemplate(os.path.join(work_dir, f"invoice-{rows}.pdf"), pagesize=A4)
+        first_page_rows, rows_per_page = generation.page_capacity(doc, [])
+        tables = timed(timings, "build_pdf_tables", generation.build_pdf_tables, dataframe,
+                       first_page_rows=first_page_rows, rows_per_page=rows_per_page)
+        # SimpleDocTemplate takes a list, so the page tables are created within doc.build
+        timed(timings, "doc.build", lambda: doc.build(list(tables)))
+
+    timings["total"] = sum(timings.values())
+    return timings
+
+def run_benchmarks(sizes, engine=None, pdf_limit=None, trainers=5):
+    """Run the benchmark for all sizes and return the result document."""
+    import numpy
+    import pandas
+
+    engine = engine or config.processing_engine
+    results = {}
+    for rows in sizes:
+        console.print(f"⏱ [yellow]Benchmarking {rows} rows ({engine} engine)...[/yellow]")
+        with tempfile.TemporaryDirectory() as work_dir:
+            results[str(rows)] = benchmark_size(rows, work_dir, engine=engine,
+                                                pdf_limit=pdf_limit, trainers=trainers)
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "engine": engine,
+        "results": results,
+    }
+
+def save_results(document, directory=RESULTS_DIRECTORY):
+    """Store a result document as JSON and return its path."""
+    os.makedirs(directory, exist_ok=True)
+    stamp = document["timestamp"].replace(":", "").replace("-", "")
+    path = os.path.join(directory, f"benchmark-{stamp}-{document['git_revision'] or 'local'}.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(document, file, indent=2)
+    return path
+
+def print_results(document, baseline=None):
+    """Print the timings per stage and size, with the change against a baseline if given."""
+    sizes = list(document["results"])
+    stages = list(dict.fromkeys(stage for timings in document["results"].values() for stage in timings))
+
+    table = Table(title=f"Benchmark ({document['engine']} engine, revision {document['git_revision']})")
+    table.add_column("Stage", style="cyan")
+    for rows in sizes:
+        table.add_column(f"{int(rows):,} rows (s)", justify="right")
+
+    for stage in stages:
+        cells = []
+        for rows in sizes:
+            seconds = document["results"][rows].get(stage)
+            cell = "-" if seconds is None else f"{seconds:.3f}"
+            previous = (baseline or {}).get("results", {}).get(rows, {}).get(stage)
+            if seconds is not None and previous:
+                cell += f" ({seconds / previous:.2f}x)"
+            cells.append(cell)
+        table.add_row(stage, *cells)
+    console.print(table)
+
+def main(argv=None):
+    """Run the benchmark suite from the command line."""
+    parser = argparse.ArgumentParser(description="Benchmark the Rechenmeister stages.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated export sizes in rows.")
+    parser.add_argument("--engine", choices=["columnar", "rows"], default=None)
+    parser.add_argument("--trainers", type=int, default=5)
+    parser.add_argument("--pdf-limit", type=int, default=None,
+                        help="Skip the PDF steps for exports with more rows than this (default: never skip).")
+    parser.add_argument("--compare", help="Result file of a previous run to compare against.")
+    parser.add_argument("--no-save", action="store_true", help="Do not store the results.")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    document = run_benchmarks(sizes, engine=args.engine, pdf_limit=args.pdf_limit, trainers=args.trainers)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_results(document, baseline)
+
+    if not args.no_save:
+        console.print(f"Results stored in {save_results(document)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
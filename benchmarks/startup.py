@@ -0,0 +1,93 @@
+"""This module benchmarks the cold-start import time of the Rechenmeister CLI.
+
+Run it from the project root:
+
+    python -m benchmarks.startup [--budget-ms 400] [--runs 5]
+
+The CLI is imported in fresh interpreters with ``-X importtime``. The benchmark fails (exit
+status 1) when the median import time exceeds the budget or when a heavy library is loaded
+before the menu is shown.
+"""
+import sys
+import argparse
+import statistics
+import subprocess
+from rich.console import Console
+from rich.table import Table
+
+# Initialize the console for rich output
+console = Console()
+
+# Entry point whose import cost is measured
+CLI_MODULE = "modules.rechenmeister"
+
+# Libraries that must only be loaded when their stage runs
+HEAVY_MODULES = ("pandas", "numpy", "reportlab", "openpyxl")
+
+# Default budget for the median import time of the CLI module
+DEFAULT_BUDGET_MS = 400
+
+def parse_importtime(stderr):
+    """Parse ``-X importtime`` output into a list of (module, self_us, cumulative_us)."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        imports.append((module.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+def measure_import(module=CLI_MODULE):
+    """Import a module in a fresh interpreter and return its import timings."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True)
+    return parse_importtime(result.stderr)
+
+def loaded_heavy_modules(module=CLI_MODULE):
+    """Return the heavy libraries that are loaded by importing a module."""
+    check = (f"import sys, {module}; "
+             f"print(' '.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+def run_benchmark(runs=5, module=CLI_MODULE):
+    """Return the median cumulative import time in milliseconds and the last run's timings."""
+    totals = []
+    imports = []
+    for _ in range(runs):
+        imports = measure_import(module)
+        totals.append(next(cumulative for name, _, cumulative in imports if name == module) / 1000)
+    return statistics.median(totals), imports
+
+def main(argv=None):
+    """Run the startup benchmark and enforce the budget."""
+    parser = argparse.ArgumentParser(description="Benchmark the cold-start import time of the CLI.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to show.")
+    args = parser.parse_args(argv)
+
+    median_ms, imports = run_benchmark(args.runs)
+    heavy = loaded_heavy_modules()
+
+    table = Table(title=f"Slowest imports of {CLI_MODULE}")
+    table.add_column("Module", style="cyan")
+    # Units in parentheses: rich reads "[ms]" as a markup tag and drops it from the header
+    table.add_column("Self (ms)", justify="right")
+    table.add_column("Cumulative (ms)", justify="right")
+    for name, self_us, cumulative_us in sorted(imports, key=lambda entry: entry[2], reverse=True)[:args.top]:
+        table.add_row(name, f"{self_us / 1000:.1f}", f"{cumulative_us / 1000:.1f}")
+    console.print(table)
+    console.print(f"Median import time over {args.runs} runs: {median_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if median_ms > args.budget_ms:
+        console.print("[bold red]Startup budget exceeded.[/bold red]")
+        failed = True
+    if heavy:
+        console.print(f"[bold red]Heavy libraries loaded at startup:[/bold red] {', '.join(heavy)}")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""This module generates synthetic "Aktivitätsbericht" activity exports for benchmarks and tests.
+
+Run it from the project root:
+
+    python -m benchmarks.synthetic_export OUTPUT_FILE --rows 100000 --trainers 10
+
+Every column the processing stage reads is filled with realistic values (dates within one
+month, quarter-hour start times, 45 to 90 minute classes, registrations up to capacity, a share
+of cancelled classes), and no session is listed twice. The first trainer is the configured billing trainer.
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from configs.config import config
+
+# Column layout of the studio software's activity export
+EXPORT_COLUMNS = ["Typ", "Datum", "Startzeit", "Endzeit", "Name", "Angemeldet", "Anwesend",
+                  "Max. Teilnehmer", "Warteliste", "Trainer", "Ort", "Status", "Sport",
+                  "Aktivitätsgruppe", "Kommentar zur Einheit", "Veröffentlicht",
+                  "Einheit archiviert", "Aktivität archiviert", "Einheit abgesagt"]
+
+CLASS_NAMES = ["Hatha Yoga", "Vinyasa Flow", "Yin Yoga", "Pilates Mat", "Power Yoga",
+               "Rückenfit", "Meditation", "Yoga; Basics", "Faszien \"Release\"", "Aerial Yoga"]
+CAPACITIES = [6, 8, 10, 12, 16]
+DURATIONS = [45, 60, 75, 90]
+STATUSES = ["buchbar", "voll", "Storniert", "Abgesagt"]
+STATUS_WEIGHTS = [0.75, 0.15, 0.06, 0.04]
+
+def trainer_names(count):
+    """Return the trainer names, starting with the configured billing trainer."""
+    return [config.trainer] + [f"Trainer{index:02d}" for index in range(2, count + 1)]
+
+def build_export(rows, trainers=5, seed=42, year=2025, month=8):
+    """Build a synthetic activity export as a DataFrame of strings."""
+    rng = np.random.default_rng(seed)
+
+    days = rng.integers(1, 29, size=rows)
+    start = rng.integers(6 * 4, 21 * 4, size=rows) * 15
+    end = start + rng.choice(DURATIONS, size=rows)
+    capacity = rng.choice(CAPACITIES, size=rows)
+    registered = np.minimum((rng.random(size=rows) * (capacity + 1)).astype(int), capacity)
+    attended = registered - rng.binomial(registered, 0.1)
+    status = rng.choice(STATUSES, size=rows, p=STATUS_WEIGHTS)
+    cancelled = np.isin(status, ["Storniert", "Abgesagt"])
+
+    names = np.array(CLASS_NAMES, dtype=object)
+    trainer = np.array(trainer_names(trainers), dtype=object)
+    groups = np.array([f"activity_group_{index:02d}" for index in range(1, len(CLASS_NAMES) + 1)], dtype=object)
+    class_index = rng.integers(0, len(CLASS_NAMES), size=rows)
+
+    # Lookup tables instead of formatting every value
+    clock = np.array([f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(24 * 60)], dtype=object)
+    dates = np.array([f"{day:02d}.{month:02d}.{year % 100:02d}" for day in range(32)], dtype=object)
+    numbers = np.array([str(number) for number in range(max(CAPACITIES) + 1)], dtype=object)
+
+    export = pd.DataFrame({
+        "Typ": "Klasse",
+        "Datum": dates[days],
+        "Startzeit": clock[start],
+        "Endzeit": clock[end],
+        "Name": names[class_index],
+        "Angemeldet": np.where(cancelled, "", numbers[registered]),
+        "Anwesend": np.where(cancelled, "", numbers[attended]),
+        "Max. Teilnehmer": numbers[capacity],
+        "Warteliste": numbers[rng.integers(0, 3, size=rows)],
+        "Trainer": trainer[rng.integers(0, len(trainer), size=rows)],
+        "Ort": "",
+        "Status": status,
+        "Sport": "Yoga",
+        "Aktivitätsgruppe": groups[class_index],
+        "Kommentar zur Einheit": "",
+        "Veröffentlicht": "",
+        "Einheit archiviert": np.where(cancelled, "ja", "nein"),
+        "Aktivität archiviert": "nein",
+        "Einheit abgesagt": np.where(cancelled, "ja", "nein"),
+    }, columns=EXPORT_COLUMNS)
+
+    # A real export lists every session once: number repeated draws of the same session apart
+    repeat = export.groupby(["Datum", "Startzeit", "Endzeit", "Name", "Trainer"], sort=False).cumcount().to_numpy()
+    export["Name"] = np.where(repeat > 0, export["Name"] + " " + (repeat + 1).astype(str), export["Name"])
+    return export
+
+def generate_export(path, rows, trainers=5, seed=42, year=2025, month=8):
+    """Write a synthetic activity export to ``path`` and return the path."""
+    export = build_export(rows, trainers=trainers, seed=seed, year=year, month=month)
+    export.to_csv(path, sep=";", index=False, encoding="utf-8", lineterminator="\r\n")
+    return path
+
+def main(argv=None):
+    """Write a synthetic export from the command line."""
+    parser = argparse.ArgumentParser(description="Generate a synthetic activity export.")
+    parser.add_argument("output_file")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--trainers", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--year", type=int, default=2025)
+    parser.add_argument("--month", type=int, default=8)
+    args = parser.parse_args(argv)
+    generate_export(args.output_file, args.rows, trainers=args.trainers, seed=args.seed,
+                    year=args.year, month=args.month)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,156 @@
-"""Configuration loader for Rechenmeister."""
+"""Configuration loader for Rechenmeister.
+
+Besides the live ``Config`` properties, ``Config.snapshot()`` resolves and validates the settings
+the processing stages need into a frozen ``Settings`` object once per run. Long-running modes call
+``Config.reload_if_changed()`` to pick up edits of the YAML file; a new file only replaces the
+current settings once it loaded and validated completely.
+"""
 import yaml
 import os
+import logging
+from dataclasses import dataclass, fields
 from pathlib import Path
 
+PROCESSING_ENGINES = ("rows", "columnar")
+INVOICE_LAYOUTS = ("sessions", "day", "class")
+PAGE_SIZES = ("A3", "A4", "A5", "LETTER", "LEGAL")
+
+class FrozenDict(dict):
+    """A read-only dict for the nested sections of a settings snapshot."""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Settings snapshots are read-only.")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+def freeze(value):
+    """Return a read-only copy of a nested YAML value (dicts become FrozenDicts, lists tuples)."""
+    if isinstance(value, dict):
+        return FrozenDict({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+@dataclass(frozen=True)
+class Settings:
+    """Validated, read-only settings of one run, resolved once and passed to the stages."""
+    trainer: str
+    trainers: tuple
+    base_hourly_rate: float
+    processing_engine: str
+    streaming: bool
+    incremental: bool
+    chunk_size: int
+    fanout_workers: int
+    processing_output_directory: str
+    excel_friendly_format: bool
+    binary_sidecar: bool
+    xlsx_export: bool
+    extra_fields: tuple
+    tariff: FrozenDict
+    history_enabled: bool
+    history_database: str
+    generation_output_directory: str
+    pdf_filename_format: str
+    invoice_layout: str
+    invoice_columns: tuple
+    page_size: str
+    merge_invoices: bool
+    allowed_statuses: tuple
+    quarantine: bool
+    archive_enabled: bool
+    archive_codec: str
+    archive_level: int
+    archive_min_age_days: float
+    archive_retention_days: float
+    metrics_enabled: bool
+    metrics_track_memory: bool
+    metrics_filename: str
+    logs_directory: str
+
+    def __post_init__(self):
+        """Reject settings the stages cannot work with."""
+        problems = []
+        for field in fields(self):
+            value = getattr(self, field.name)
+            if field.type is bool and not isinstance(value, bool):
+                problems.append(f"{field.name} must be true or false, got {value!r}")
+        if not self.trainer:
+            problems.append("processing.trainer must not be empty")
+        if self.base_hourly_rate <= 0:
+            problems.append(f"processing.base_hourly_rate must be positive, got {self.base_hourly_rate}")
+        if self.processing_engine not in PROCESSING_ENGINES:
+            problems.append(f"processing.engine must be one of {', '.join(PROCESSING_ENGINES)}, "
+                            f"got '{self.processing_engine}'")
+        if self.chunk_size <= 0:
+            problems.append(f"processing.chunk_size must be positive, got {self.chunk_size}")
+        if self.fanout_workers is not None and self.fanout_workers <= 0:
+            problems.append(f"processing.fanout_workers must be positive, got {self.fanout_workers}")
+        if not self.allowed_statuses:
+            problems.append("validation.allowed_statuses must not be empty")
+        if self.invoice_layout not in INVOICE_LAYOUTS:
+            problems.append(f"generation.layout must be one of {', '.join(INVOICE_LAYOUTS)}, "
+                            f"got '{self.invoice_layout}'")
+        if not self.invoice_columns:
+            problems.append("generation.table_columns must not be empty")
+        if self.page_size.upper() not in PAGE_SIZES:
+            problems.append(f"generation.page_size must be one of {', '.join(PAGE_SIZES)}, got '{self.page_size}'")
+        if problems:
+            raise ValueError(f"Invalid configuration: {'; '.join(problems)}.")
+
+def optional(convert):
+    """Return a conversion that keeps an unset (None) value."""
+    return lambda value: None if value is None else convert(value)
+
+# Section, key and default of every snapshot field in the YAML file, and the conversion of its
+# value (flags are taken as they are and validated); a key of None reads the whole section
+SETTINGS_TYPES = {
+    "trainer": ("processing", "trainer", "Victoria", str),
+    "trainers": ("processing", "trainers", [], freeze),
+    "base_hourly_rate": ("processing", "base_hourly_rate", 20.0, float),
+    "processing_engine": ("processing", "engine", "columnar", str),
+    "streaming": ("processing", "streaming", False, None),
+    "incremental": ("processing", "incremental", False, None),
+    "chunk_size": ("processing", "chunk_size", 50000, int),
+    "fanout_workers": ("processing", "fanout_workers", None, optional(int)),
+    "processing_output_directory": ("processing", "output_directory", None, lambda value: value or "output_csv"),
+    "excel_friendly_format": ("processing", "excel_friendly_format", True, None),
+    "binary_sidecar": ("processing", "binary_sidecar", True, None),
+    "xlsx_export": ("processing", "xlsx_export", False, None),
+    "extra_fields": ("processing", "extra_fields", [], freeze),
+    "tariff": ("tariff", None, {}, lambda value: freeze(value or {})),
+    "history_enabled": ("history", "enabled", True, None),
+    "history_database": ("history", "database", "history.sqlite3", str),
+    "generation_output_directory": ("generation", "output_directory", None, lambda value: value or "output_pdf"),
+    "pdf_filename_format": ("generation", "filename_format", None,
+                            lambda value: value or "invoice-{month:02d}-{year}.pdf"),
+    "invoice_layout": ("generation", "layout", "sessions", str),
+    "invoice_columns": ("generation", "table_columns", None,
+                        lambda value: freeze(value or ["Datum", "Name", "Stundenbetrag"])),
+    "page_size": ("generation", "page_size", None, lambda value: str(value or "A4")),
+    "merge_invoices": ("generation", "merge_invoices", False, None),
+    "allowed_statuses": ("validation", "allowed_statuses", ["buchbar", "voll", "Storniert", "Abgesagt"], freeze),
+    "quarantine": ("validation", "quarantine", False, None),
+    "archive_enabled": ("archive", "enabled", False, None),
+    "archive_codec": ("archive", "codec", "auto", str),
+    "archive_level": ("archive", "level", None, optional(int)),
+    "archive_min_age_days": ("archive", "min_age_days", 0, float),
+    "archive_retention_days": ("archive", "retention_days", None, optional(float)),
+    "metrics_enabled": ("metrics", "enabled", False, None),
+    "metrics_track_memory": ("metrics", "track_memory", False, None),
+    "metrics_filename": ("metrics", "filename", "metrics.jsonl", str),
+    "logs_directory": ("logging", "directory", None, lambda value: value or "logs"),
+}
+
+def setting_value(raw, name):
+    """Return the unconverted value of a snapshot field in a loaded YAML file (or its default)."""
+    section, key, default, _ = SETTINGS_TYPES[name]
+    values = raw.get(section) or {}
+    return values if key is None else values.get(key, default)
+
 class Config:
     """Configuration manager for Rechenmeister settings."""
     
@@ -10,8 +158,16 @@ class Config:
         """Load configuration from YAML file."""
         config_path = config_path or Path(__file__).parent / "config.yaml"
         self.config_path = config_path
+        self.loaded_mtime = self._config_mtime()
         self.config = self._load_config()
         self.testing_mode = os.getenv("TESTING_MODE", "false").lower() == "true"
+
+    def _config_mtime(self):
+        """Return the modification time of the YAML file, or None if it cannot be read."""
+        try:
+            return os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return None
     
     def _load_config(self):
         """Load configuration from YAML file."""
@@ -27,6 +183,51 @@ class Config:
         if self.testing_mode and section == "ingestion":
             section = "ingestion_testing"
         return self.config.get(section, {}).get(key, default)
+
+    def snapshot(self, raw=None):
+        """Resolve and validate the settings of one run into a frozen ``Settings`` object.
+
+        The values are read from ``raw`` (a loaded YAML file), by default the current one.
+        """
+        raw = self.config if raw is None else raw
+        values = {}
+        for field in fields(Settings):
+            value = setting_value(raw, field.name)
+            convert = SETTINGS_TYPES[field.name][3]
+            try:
+                values[field.name] = convert(value) if convert else value
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid configuration value for '{field.name}': {value!r}") from e
+        return Settings(**values)
+
+    def setting(self, name):
+        """Return the current value of a snapshot field, converted as in a snapshot."""
+        convert = SETTINGS_TYPES[name][3]
+        value = setting_value(self.config, name)
+        return convert(value) if convert else value
+
+    def reload_if_changed(self):
+        """Reload the YAML file if it changed since it was loaded; return whether new settings apply.
+
+        An edited file that cannot be parsed or validated is logged and ignored, the previous
+        settings stay in effect until the next change.
+        """
+        mtime = self._config_mtime()
+        if mtime is None or mtime == self.loaded_mtime:
+            return False
+        self.loaded_mtime = mtime
+
+        try:
+            raw = self._load_config()
+            self.snapshot(raw)
+        except (OSError, yaml.YAMLError, ValueError) as e:
+            logging.error("Ignoring changed configuration file '%s': %s", self.config_path, e)
+            return False
+
+        # A single reference swap: every run resolves its snapshot from either the old or the new file
+        self.config = raw
+        logging.info("Reloaded configuration file '%s'.", self.config_path)
+        return True
     
     # Ingestion settings
     @property
@@ -48,37 +249,224 @@ class Config:
     @property
     def auto_create_directories(self):
         return self.get('ingestion', 'auto_create_directories', True)
+
+    @property
+    def ingestion_transfer_mode(self):
+        return self.get('ingestion', 'transfer_mode', 'move')
+
+    @property
+    def ingestion_workers(self):
+        return self.get('ingestion', 'workers', None)
     
     # Processing settings
     @property
     def base_hourly_rate(self):
-        return self.get('processing', 'base_hourly_rate', 20.0)
+        return self.setting('base_hourly_rate')
     
+    @property
+    def processing_engine(self):
+        return self.setting('processing_engine')
+
+    @property
+    def trainer(self):
+        return self.setting('trainer')
+
+    @property
+    def trainers(self):
+        return self.setting('trainers')
+
+    @property
+    def fanout_workers(self):
+        return self.setting('fanout_workers')
+
+    @property
+    def batch_workers(self):
+        return self.get('processing', 'batch_workers', None)
+
+    @property
+    def streaming(self):
+        return self.setting('streaming')
+
+    @property
+    def incremental(self):
+        return self.setting('incremental')
+
+    @property
+    def chunk_size(self):
+        return self.setting('chunk_size')
+
     @property
     def processing_output_directory(self):
-        return self.get('processing', 'output_directory')
+        return self.setting('processing_output_directory')
     
+    @property
+    def excel_friendly_format(self):
+        return self.setting('excel_friendly_format')
+
+    @property
+    def binary_sidecar(self):
+        return self.setting('binary_sidecar')
+
+    @property
+    def xlsx_export(self):
+        return self.setting('xlsx_export')
+
     @property
     def extra_fields(self):
-        return self.get('processing', 'extra_fields', [])
+        return self.setting('extra_fields')
+
+    # Tariff settings
+    @property
+    def tariff(self):
+        return self.setting('tariff')
 
     # Generation settings
     @property
     def generation_output_directory(self):
-        return self.get('generation', 'output_directory')
+        return self.setting('generation_output_directory')
     
     @property
     def pdf_filename_format(self):
-        return self.get('generation', 'filename_format')
+        return self.setting('pdf_filename_format')
+
+    @property
+    def invoice_layout(self):
+        return self.setting('invoice_layout')
+
+    @property
+    def invoice_columns(self):
+        return self.setting('invoice_columns')
+
+    @property
+    def page_size(self):
+        return self.setting('page_size')
+
+    @property
+    def merge_invoices(self):
+        return self.setting('merge_invoices')
     
+    # History settings
+    @property
+    def history_enabled(self):
+        return self.setting('history_enabled')
+
+    @property
+    def history_database(self):
+        return self.setting('history_database')
+
+    # Validation settings
+    @property
+    def allowed_statuses(self):
+        return self.setting('allowed_statuses')
+
+    @property
+    def quarantine(self):
+        return self.setting('quarantine')
+
+    # Archive settings
+    @property
+    def archive_enabled(self):
+        return self.setting('archive_enabled')
+
+    @property
+    def archive_codec(self):
+        return self.setting('archive_codec')
+
+    @property
+    def archive_level(self):
+        return self.setting('archive_level')
+
+    @property
+    def archive_min_age_days(self):
+        return self.setting('archive_min_age_days')
+
+    @property
+    def archive_retention_days(self):
+        return self.setting('archive_retention_days')
+
+    # Daemon settings
+    @property
+    def daemon_workers(self):
+        return self.get('daemon', 'workers', 2)
+
+    @property
+    def daemon_queue_size(self):
+        return self.get('daemon', 'queue_size', 16)
+
+    @property
+    def daemon_debounce_seconds(self):
+        return self.get('daemon', 'debounce_seconds', 2.0)
+
+    @property
+    def daemon_poll_interval(self):
+        return self.get('daemon', 'poll_interval', 5.0)
+
+    @property
+    def daemon_backend(self):
+        return self.get('daemon', 'backend', 'auto')
+
+    # Server settings
+    @property
+    def server_host(self):
+        return self.get('server', 'host', '127.0.0.1')
+
+    @property
+    def server_port(self):
+        return self.get('server', 'port', 8080)
+
+    @property
+    def server_workers(self):
+        return self.get('server', 'workers', 2)
+
+    @property
+    def server_queue_size(self):
+        return self.get('server', 'queue_size', 32)
+
+    @property
+    def server_max_upload_mb(self):
+        return self.get('server', 'max_upload_mb', 50)
+
+    @property
+    def server_jobs_directory(self):
+        return self.get('server', 'jobs_directory', 'output_jobs')
+
+    @property
+    def server_job_ttl_hours(self):
+        return self.get('server', 'job_ttl_hours', 24)
+
+    # Metrics settings
+    @property
+    def metrics_enabled(self):
+        return self.setting('metrics_enabled')
+
+    @property
+    def metrics_filename(self):
+        return self.setting('metrics_filename')
+
+    @property
+    def metrics_track_memory(self):
+        return self.setting('metrics_track_memory')
+
     # Logging settings
     @property
     def logs_directory(self):
-        return self.get('logging', 'directory')
+        return self.setting('logs_directory')
     
     @property
     def log_filename(self):
         return self.get('logging', 'filename')
 
+    @property
+    def audit_filename(self):
+        return self.get('logging', 'audit_filename', 'audit.jsonl')
+
+    @property
+    def log_max_bytes(self):
+        return self.get('logging', 'max_bytes', 5 * 1024 * 1024)
+
+    @property
+    def log_backup_count(self):
+        return self.get('logging', 'backup_count', 5)
+
 # Global config instance
 config = Config()
@@ -0,0 +1,194 @@
+"""This module archives ingested exports and processed CSV files of the Rechenmeister tool.
+
+Exports in ``input_csv/`` and processed CSV files that were not modified for
+``archive.min_age_days`` are compressed in place (``processed-aktivitaetsbericht-08-2025.csv`` ->
+``processed-aktivitaetsbericht-08-2025.csv.gz``) with gzip or xz from the standard library, or
+with zstd when the optional ``zstandard`` package is installed. Readers open files through
+``open_text``, which decompresses while reading, so an archived month is processed or invoiced
+without unpacking it to disk. Archived files older than ``archive.retention_days`` are deleted.
+"""
+import os
+import io
+import glob
+import gzip
+import lzma
+import time
+import shutil
+import logging
+from rich.console import Console
+from configs.config import config
+
+# Initialize the console for rich output
+console = Console()
+
+# File name suffix of every codec
+SUFFIXES = {"gzip": ".gz", "xz": ".xz", "zstd": ".zst"}
+
+# Compression level used when archive.level is not set
+DEFAULT_LEVELS = {"gzip": 6, "xz": 6, "zstd": 10}
+
+# Bytes copied at a time while compressing
+COPY_BLOCK_SIZE = 1 << 20
+
+def zstandard():
+    """Return the zstandard module, or None when it is not installed."""
+    try:
+        import zstandard as module
+    except ImportError:
+        return None
+    return module
+
+def resolve_codec(codec=None, settings=None):
+    """Return the codec to archive with ("auto" picks zstd when available, else gzip)."""
+    codec = codec or (settings or config).archive_codec
+    if codec == "auto":
+        return "zstd" if zstandard() is not None else "gzip"
+    if codec not in SUFFIXES:
+        raise ValueError(f"Unknown archive codec '{codec}', use one of auto, {', '.join(SUFFIXES)}.")
+    if codec == "zstd" and zstandard() is None:
+        logging.warning("The zstandard package is not installed, archiving with gzip instead.")
+        return "gzip"
+    return codec
+
+def codec_of(path):
+    """Return the codec of an archived file, or None for a plain file."""
+    return next((codec for codec, suffix in SUFFIXES.items() if path.endswith(suffix)), None)
+
+def plain_path(path):
+    """Return the path of a file without its compression suffix."""
+    codec = codec_of(path)
+    return path[:-len(SUFFIXES[codec])] if codec else path
+
+def open_binary(path):
+    """Open a plain or archived file for reading, decompressing while reading."""
+    codec = codec_of(path)
+    if codec == "gzip":
+        return gzip.open(path, "rb")
+    if codec == "xz":
+        return lzma.open(path, "rb")
+    if codec == "zstd":
+        module = zstandard()
+        if module is None:
+            raise ValueError(f"Reading '{path}' needs the zstandard package.")
+        return module.ZstdDecompressor().stream_reader(open(path, "rb"))
+    return open(path, "rb")
+
+def open_text(path, encoding="utf-8", errors=None):
+    """Open a plain or archived CSV file for reading as text (with newline='' for the csv module)."""
+    if codec_of(path) is None:
+        return open(path, newline='', encoding=encoding, errors=errors)
+    return io.TextIOWrapper(open_binary(path), encoding=encoding, errors=errors, newline='')
+
+def open_writer(path, codec, level=None):
+    """Open a file for writing compressed data."""
+    level = level or DEFAULT_LEVELS[codec]
+    if codec == "gzip":
+        return gzip.open(path, "wb", compresslevel=level)
+    if codec == "xz":
+        return lzma.open(path, "wb", preset=level)
+    return zstandard().ZstdCompressor(level=level).stream_writer(open(path, "wb"))
+
+def find(directory, pattern):
+    """Return the files matching a pattern, plain or archived (the plain file wins if both exist)."""
+    paths = set(glob.glob(os.path.join(directory, pattern)))
+    for suffix in SUFFIXES.values():
+        paths.update(path for path in glob.glob(os.path.join(directory, pattern + suffix))
+                     if plain_path(path) not in paths)
+    return sorted(paths)
+
+def compress_file(path, codec, level=None):
+    """Compress a file next to itself, remove the original and return the archived path.
+
+    The archive keeps the modification time of the original, which the retention policy uses.
+    """
+    target = f"{path}{SUFFIXES[codec]}"
+    partial = f"{target}.part"
+    try:
+        with open(path, "rb") as source, open_writer(partial, codec, level) as archived:
+            shutil.copyfileobj(source, archived, COPY_BLOCK_SIZE)
+        shutil.copystat(path, partial)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, target)
+    os.remove(path)
+
+    # The binary sidecar of a processed CSV only applies to the plain file
+    from modules.sidecar import remove_sidecar
+    if os.path.basename(path).startswith("processed-"):
+        remove_sidecar(path)
+    return target
+
+def archive_directories(settings=None):
+    """Return the directories and file patterns the archive manages."""
+    from modules.processing import TRAINER_DIRECTORY
+
+    output_directory = (settings or config).processing_output_directory
+    return [("input_csv", "aktivitaetsbericht-*.csv"),
+            (output_directory, "processed-*.csv"),
+            (os.path.join(output_directory, TRAINER_DIRECTORY), "processed-*.csv")]
+
+def compress_files(paths, codec, level=None, min_age_days=0, now=None):
+    """Compress the plain files among ``paths`` that are old enough.
+
+    Returns the archived paths and a mapping of failed paths to their error.
+    """
+    now = time.time() if now is None else now
+    archived, failures = [], {}
+    for path in paths:
+        if codec_of(path) or not os.path.exists(path) or now - os.path.getmtime(path) < min_age_days * 86400:
+            continue
+        try:
+            archived.append(compress_file(path, codec, level))
+            logging.info("Archived '%s' as '%s'.", path, archived[-1])
+        except Exception as e:
+            failures[path] = e
+            logging.error("Archiving '%s' failed: %s", path, e)
+    return archived, failures
+
+def expired_files(retention_days, directories=None, now=None):
+    """Return the archived files older than the retention period."""
+    now = time.time() if now is None else now
+    return [path for directory, pattern in directories or archive_directories()
+            for suffix in SUFFIXES.values()
+            for path in sorted(glob.glob(os.path.join(directory, pattern + suffix)))
+            if now - os.path.getmtime(path) >= retention_days * 86400]
+
+def archive_files(codec=None, min_age_days=None, retention_days=None, level=None, directories=None, now=None):
+    """Compress every used CSV file and apply the retention policy.
+
+    Returns the archived paths, the deleted paths and a mapping of failed paths to their error.
+    """
+    settings = config.snapshot()
+    codec = resolve_codec(codec, settings)
+    min_age_days = settings.archive_min_age_days if min_age_days is None else min_age_days
+    retention_days = settings.archive_retention_days if retention_days is None else retention_days
+
+    directories = directories or archive_directories(settings)
+    paths = [path for directory, pattern in directories
+             for path in sorted(glob.glob(os.path.join(directory, pattern)))]
+    archived, failures = compress_files(paths, codec, level or settings.archive_level, min_age_days, now)
+
+    deleted = []
+    if retention_days is not None:
+        for path in expired_files(retention_days, directories, now):
+            os.remove(path)
+            deleted.append(path)
+            logging.info("Deleted '%s' after %d days (retention policy).", path, retention_days)
+
+    console.print(f"🗜  [green]Archived {len(archived)} files ({codec}), deleted {len(deleted)} expired files, "
+                  f"{len(failures)} failures.[/green]")
+    return archived, deleted, failures
+
+def archive_after_run(paths, settings):
+    """Compress the files a run used when its settings enable automatic archiving; never fails the run."""
+    if not settings.archive_enabled:
+        return []
+    try:
+        archived, _ = compress_files(paths, resolve_codec(settings=settings), settings.archive_level,
+                                     settings.archive_min_age_days)
+        return archived
+    except Exception as e:
+        logging.error("Archiving failed: %s", e)
+        return []
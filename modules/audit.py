@@ -0,0 +1,310 @@
+"""This module keeps the structured audit log of the Rechenmeister tool and inspects it.
+
+Every log record is also appended as one JSON line (time, run ID, level, module, message) to the
+audit log in the logs directory. When the file reaches ``logging.max_bytes`` it is rotated
+(``audit.jsonl`` -> ``audit.1.jsonl`` -> ...), keeping ``logging.backup_count`` old files.
+
+Next to every audit file a small index records the byte offset at which each block of records
+of the same run and day starts. Filtering by run or date range reads the index, seeks straight to
+the matching blocks and parses only those; tailing reads backwards from the end of the file.
+Records are written under a file lock, so worker processes can share the log and every block in
+the index holds exactly one run and day. Each handler keeps its files open and remembers where its
+last block ends; the index is only read again when another process wrote to or rotated the log.
+
+The plain action log uses ``LockedRotatingFileHandler``, which rotates under the same kind of lock.
+"""
+import os
+import json
+import bisect
+import logging
+import logging.handlers
+from contextlib import contextmanager
+from datetime import datetime
+from rich.console import Console
+from rich.table import Table
+from configs.config import config
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Initialize the console for rich output
+console = Console()
+
+# Bytes read at a time when reading the log backwards
+TAIL_BLOCK_SIZE = 64 * 1024
+
+def audit_path():
+    """Return the path of the current audit log."""
+    return os.path.join(config.logs_directory or "logs", config.audit_filename)
+
+def index_path(path):
+    """Return the path of the offset index belonging to an audit log file."""
+    return f"{path}.idx"
+
+def segment_path(path, number):
+    """Return the path of a rotated audit log file (number 0 is the current file)."""
+    if not number:
+        return path
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.{number}{extension}"
+
+def segments(path=None):
+    """Return the existing audit log files, oldest first."""
+    path = path or audit_path()
+    found = []
+    number = 0
+    while os.path.exists(segment_path(path, number)):
+        found.append(segment_path(path, number))
+        number += 1
+    return found[::-1]
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on ``<path>.lock`` (a no-op where fcntl is not available)."""
+    with open(f"{path}.lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+class AuditHandler(logging.Handler):
+    """Append log records as JSON lines, with size-based rotation and an offset index."""
+
+    def __init__(self, path=None, max_bytes=None, backup_count=None, level=logging.NOTSET):
+        super().__init__(level)
+        self.path = path or audit_path()
+        self.max_bytes = config.log_max_bytes if max_bytes is None else max_bytes
+        self.backup_count = config.log_backup_count if backup_count is None else backup_count
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.log_file = self.index_file = self.inode = None
+        # Where this handler's last record ends and the run and day of its block
+        self.end = self.block = None
+
+    def emit(self, record):
+        """Write one record under the file lock, so worker processes can share the log."""
+        try:
+            from modules import metrics
+
+            created = datetime.fromtimestamp(record.created)
+            entry = {
+                "time": created.isoformat(timespec="milliseconds"),
+                "run": metrics.run_id,
+                "level": record.levelname,
+                "module": record.module,
+                "message": record.getMessage(),
+            }
+            line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+            with file_lock(self.path):
+                self.write(line, entry["run"], created.date().isoformat())
+        except Exception:
+            self.handleError(record)
+
+    def open_files(self):
+        """(Re)open the current audit file and its index for appending."""
+        self.close_files()
+        self.log_file = open(self.path, "ab")
+        self.index_file = open(index_path(self.path), "ab")
+        self.inode = os.fstat(self.log_file.fileno()).st_ino
+
+    def close_files(self):
+        """Close the open audit file and index, if any."""
+        for file in (self.log_file, self.index_file):
+            if file is not None:
+                file.close()
+        self.log_file = self.index_file = self.inode = None
+
+    def write(self, line, run, day):
+        """Append a line and, when it starts a new block of run and day, its index entry."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if stat is None or stat.st_ino != self.inode:
+            # First record of this handler, or another process rotated the files
+            self.open_files()
+        size = stat.st_size if stat else 0
+        if self.max_bytes and size and size + len(line) > self.max_bytes:
+            self.rotate()
+            self.open_files()
+            size = 0
+        if not size:
+            # A new file starts without blocks
+            self.end, self.block = 0, None
+
+        if size != self.end:
+            # Another process wrote since this handler's last record, so its block may have ended
+            last = last_index_entry(self.path)
+            self.block = tuple(last[1:]) if last else None
+        self.log_file.write(line)
+        self.log_file.flush()
+        if self.block != (run, day):
+            self.index_file.write((json.dumps([size, run, day]) + "\n").encode("utf-8"))
+            self.index_file.flush()
+            self.block = (run, day)
+        self.end = size + len(line)
+
+    def close(self):
+        """Close the audit files along with the handler."""
+        self.close_files()
+        super().close()
+
+    def rotate(self):
+        """Shift the audit files (and their indexes) by one, dropping the oldest."""
+        self.close_files()
+        for number in range(self.backup_count, 0, -1):
+            source = segment_path(self.path, number - 1)
+            target = segment_path(self.path, number)
+            for source_file, target_file in ((source, target), (index_path(source), index_path(target))):
+                if os.path.exists(source_file):
+                    if number == self.backup_count and os.path.exists(target_file):
+                        os.remove(target_file)
+                    os.replace(source_file, target_file)
+        if not self.backup_count:
+            for file in (self.path, index_path(self.path)):
+                if os.path.exists(file):
+                    os.remove(file)
+
+class LockedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """A size-rotated log file that worker processes can share.
+
+    Every record is written under a file lock, and a handler whose file was rotated by another
+    process reopens the new file instead of writing on into the rotated one.
+    """
+
+    def emit(self, record):
+        """Write one record, rotating first if the file is full."""
+        try:
+            with file_lock(self.baseFilename):
+                if self.stream is not None and self.rotated_elsewhere():
+                    self.stream.close()
+                    self.stream = None
+                super().emit(record)
+        except Exception:
+            self.handleError(record)
+
+    def rotated_elsewhere(self):
+        """Return whether the open file is no longer the file at the log path."""
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+def last_index_entry(path):
+    """Return the last index entry of an audit file, reading only the end of the index."""
+    try:
+        with open(index_path(path), "rb") as index:
+            size = index.seek(0, os.SEEK_END)
+            index.seek(max(size - 512, 0))
+            lines = index.read().splitlines()
+    except FileNotFoundError:
+        return None
+    return json.loads(lines[-1]) if lines else None
+
+def read_index(path):
+    """Return the index entries [offset, run, day] of an audit file, with the file size as end marker."""
+    try:
+        with open(index_path(path), encoding="utf-8") as index:
+            entries = [json.loads(line) for line in index if line.strip()]
+    except FileNotFoundError:
+        entries = []
+    return entries, os.path.getsize(path)
+
+def read_block(path, start, end):
+    """Parse the records between two byte offsets of an audit file."""
+    with open(path, "rb") as log:
+        log.seek(start)
+        content = log.read(end - start)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+def search(run=None, start=None, end=None, level=None, path=None):
+    """Return the records of a run and/or date range, reading only the matching blocks."""
+    start = start.isoformat() if start else None
+    end = end.isoformat() if end else None
+    results = []
+    for segment in segments(path):
+        entries, size = read_index(segment)
+        days = [entry[2] for entry in entries]
+        # Blocks are in time order, so the date range is a contiguous slice of the index
+        first = bisect.bisect_left(days, start) if start else 0
+        last = bisect.bisect_right(days, end) if end else len(entries)
+        for position in range(first, last):
+            offset, block_run, _ = entries[position]
+            if run is not None and block_run != run:
+                continue
+            block_end = entries[position + 1][0] if position + 1 < len(entries) else size
+            results.extend(read_block(segment, offset, block_end))
+    if level:
+        results = [record for record in results if record["level"] == level.upper()]
+    return results
+
+def tail(count=20, path=None, level=None):
+    """Return the last ``count`` records (of a level), reading the newest files backwards."""
+    level = level.upper() if level else None
+    records = []  # newest first
+    for segment in reversed(segments(path)):
+        with open(segment, "rb") as log:
+            position = log.seek(0, os.SEEK_END)
+            remainder = b""
+            while position and len(records) < count:
+                step = min(TAIL_BLOCK_SIZE, position)
+                position -= step
+                log.seek(position)
+                parts = (log.read(step) + remainder).split(b"\n")
+                # The first part may be the end of a line that starts further back
+                remainder = parts.pop(0) if position else b""
+                for part in reversed(parts):
+                    if part.strip():
+                        record = json.loads(part)
+                        if level is None or record["level"] == level:
+                            records.append(record)
+        if len(records) >= count:
+            break
+    return records[:count][::-1]
+
+def runs(path=None):
+    """Return (run, first day, last day, blocks) per run, from the indexes alone."""
+    summary = {}
+    for segment in segments(path):
+        for _, run, day in read_index(segment)[0]:
+            first, _, blocks = summary.get(run, (day, day, 0))
+            summary[run] = (first, day, blocks + 1)
+    return [(run, *values) for run, values in summary.items()]
+
+def print_records(records, title):
+    """Print audit records as a table."""
+    table = Table(title=title)
+    for column in ("Time", "Run", "Level", "Module", "Message"):
+        table.add_column(column, style="cyan" if column == "Time" else None, overflow="fold")
+    for record in records:
+        style = {"WARNING": "yellow", "ERROR": "red", "CRITICAL": "red"}.get(record["level"])
+        table.add_row(record["time"], record["run"], record["level"], record["module"], record["message"],
+                      style=style)
+    console.print(table)
+
+def inspect_logs(run=None, start=None, end=None, level=None, count=20, list_runs=False):
+    """Print runs, the last records or the records matching a run, date range or level."""
+    if list_runs:
+        table = Table(title="Runs in the audit log")
+        for column in ("Run", "First day", "Last day", "Blocks"):
+            table.add_column(column)
+        rows = runs()
+        for run_id, first, last, blocks in rows:
+            table.add_row(run_id, first, last, str(blocks))
+        console.print(table)
+        return rows
+
+    if run or start or end:
+        records = search(run=run, start=start, end=end, level=level)
+        title = f"Audit log: {len(records)} records"
+    else:
+        records = tail(count, level=level)
+        title = f"Audit log: last {len(records)} records"
+    print_records(records, title)
+    return records
+
+def install(level=logging.NOTSET):
+    """Add the audit handler to the root logger (once)."""
+    root = logging.getLogger()
+    if not any(isinstance(handler, AuditHandler) for handler in root.handlers):
+        root.addHandler(AuditHandler(level=level))
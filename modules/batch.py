@@ -0,0 +1,66 @@
+"""This module processes and invoices every pending export of the input directory in one run.
+
+Each export in ``input_csv/`` is processed and invoiced on its own worker of a process pool.
+Outputs are named after the month of their export, so a batch produces the same files no matter
+when or in which order it runs, and an export that fails is reported without stopping the others.
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from rich.console import Console
+from configs.config import config
+from modules import processing
+
+# Initialize the console for rich output
+console = Console()
+
+def bill_file(input_file):
+    """Process a single export and render its invoice (runs in a worker process)."""
+    from modules import generation, metrics
+
+    # Every export is a run of its own in the audit log
+    settings = config.snapshot()
+    metrics.new_run(settings=settings)
+    csv_path = processing.process_file(input_file=input_file, settings=settings)
+    pdf_path = generation.generate_invoice(csv_path=csv_path, source=input_file, settings=settings)
+    return csv_path, pdf_path
+
+def process_batch(input_files=None, max_workers=None, executor=None):
+    """Process and invoice every pending export, returning the results and failures per file."""
+    from modules.pipeline import warm_worker
+
+    console.print("🗂  [green]Batch processing selected.[/green]")
+    logging.info("Started batch processing.")
+    settings = config.snapshot()
+
+    input_files = sorted(input_files) if input_files else processing.discover_input_files()
+    console.print(f"🗂  [yellow]Processing {len(input_files)} exports...[/yellow]")
+
+    results, failures = {}, {}
+    pool = executor or ProcessPoolExecutor(max_workers=max_workers or config.batch_workers,
+                                           initializer=warm_worker)
+    try:
+        futures = {pool.submit(bill_file, input_file): input_file for input_file in input_files}
+        for future in as_completed(futures):
+            input_file = futures[future]
+            try:
+                results[input_file] = future.result()
+                logging.info("Billed export '%s': %s, %s", input_file, *results[input_file])
+            except Exception as e:
+                failures[input_file] = e
+                logging.error("Billing export '%s' failed: %s", input_file, e)
+                console.print(f"[bold red]Error:[/bold red] Billing {input_file} failed: {e}")
+    finally:
+        if executor is None:
+            pool.shutdown(wait=True)
+
+    from modules.archive import archive_after_run
+    # Failed exports stay pending for the next batch
+    archive_after_run([path for input_file, (csv_path, _) in sorted(results.items())
+                       for path in (input_file, csv_path)], settings)
+
+    # Report in file order, not in completion order
+    results = dict(sorted(results.items()))
+    failures = dict(sorted(failures.items()))
+    console.print(f"🗂  [green]Batch completed: {len(results)} invoices, {len(failures)} failures.[/green]")
+    logging.info("Batch completed: %d invoices, %d failures.", len(results), len(failures))
+    return results, failures
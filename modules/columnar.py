@@ -0,0 +1,229 @@
+"""This module provides the columnar (vectorized) processing engine for the Rechenmeister tool.
+
+The stages mirror the row-based transformations in ``processing.py`` one to one, but operate on
+whole columns instead of a list of session records: the raw export stays in a pandas frame of
+strings and the billing values are kept in integer NumPy arrays (minutes, cents, per mille).
+Per-value conversions and the output formatting are evaluated once per distinct value (exports
+repeat the same start times, capacities and amounts thousands of times) with the same helpers as
+the row-based engine, so the written CSV is byte-identical.
+"""
+import csv
+import pandas as pd
+import numpy as np
+from rich.console import Console
+from modules import archive
+from modules.records import (COMPUTED_FIELDS, time_to_minutes, format_hours, format_rate,
+                             format_bonus, format_money, format_summary_row)
+from modules.tariff import current_tariff, weekday
+
+# Initialize the console for rich output
+console = Console()
+
+# Typed value and formatter behind each computed billing column (Anmeldequote is derived)
+FORMATTERS = {
+    "Dauer-in-Stunden": ("minutes", format_hours),
+    "Stundensatz-Basis": ("base_rate_cents", format_rate),
+    "Bonus-Faktor": ("bonus_permille", format_bonus),
+    "Stundensatz-Final": ("final_rate_cents", format_money),
+    "Stundenbetrag": ("amount_cents", format_money),
+}
+
+def map_unique(series, func):
+    """Apply a scalar function once per distinct value and broadcast the results to the column."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    mapped = np.array([func(value) for value in uniques], dtype=object)
+    return pd.Series(mapped[codes], index=series.index, dtype=object)
+
+def column_or_default(frame, column, default):
+    """Return a column, or a constant column when the export does not contain it."""
+    if column in frame.columns:
+        return frame[column]
+    return pd.Series(default, index=frame.index, dtype=object)
+
+def read_header(csvfile):
+    """Read the (stripped) header row, leaving the file at the first data row.
+
+    The file is never rewound, so compressed streams can be read in one pass.
+    """
+    header = next(csv.reader([csvfile.readline()], delimiter=";"), None)
+    if not header:
+        raise ValueError("Input CSV file is empty or missing header row.")
+    return [head.strip() for head in header]
+
+def read_export(input_file):
+    """Parse the activity export once into string columns, returning the header and the frame."""
+    with archive.open_text(input_file) as csvfile:
+        fieldnames = read_header(csvfile)
+        try:
+            frame = pd.read_csv(csvfile, delimiter=";", header=None, names=fieldnames,
+                                dtype=str, na_filter=False)
+        except pd.errors.EmptyDataError:
+            frame = pd.DataFrame({key: pd.Series(dtype=object) for key in fieldnames})
+
+    return fieldnames, frame
+
+def iter_export(input_file, chunk_size):
+    """Parse the activity export in chunks of at most ``chunk_size`` rows, yielding the header and each frame."""
+    with archive.open_text(input_file) as csvfile:
+        fieldnames = read_header(csvfile)
+        try:
+            reader = pd.read_csv(csvfile, delimiter=";", header=None, names=fieldnames,
+                                 dtype=str, na_filter=False, chunksize=chunk_size)
+        except pd.errors.EmptyDataError:
+            return
+        with reader:
+            for frame in reader:
+                yield fieldnames, frame
+
+def filter_sessions(frame, excluded_statuses, trainer):
+    """Keep the sessions of the given trainer that were not cancelled."""
+    mask = np.ones(len(frame), dtype=bool)
+    if "Status" in frame.columns:
+        mask &= ~frame["Status"].isin(excluded_statuses).to_numpy()
+    if "Trainer" in frame.columns:
+        mask &= (frame["Trainer"] == trainer).to_numpy()
+    else:
+        mask[:] = False
+    return frame.loc[mask].reset_index(drop=True)
+
+def minutes_of_day(series):
+    """Convert a column of HH:MM strings to minutes after midnight."""
+    return map_unique(series, time_to_minutes).to_numpy(dtype=np.int64)
+
+def add_duration_calculations(data):
+    """Add the class duration in minutes to each row."""
+    console.print("⚙️ [yellow]Calculating class durations...[/yellow]")
+
+    frame = data["frame"]
+    data.setdefault("values", {})
+    data["values"]["minutes"] = minutes_of_day(frame["Endzeit"]) - minutes_of_day(frame["Startzeit"])
+
+    return data
+
+def add_base_rates(data):
+    """Add base hourly rates (in cents) to each row."""
+    console.print("⚙️ [yellow]Applying base hourly rates...[/yellow]")
+
+    frame = data["frame"]
+    data["values"]["base_rate_cents"] = current_tariff(data["settings"]).base_rate_cents_batch(
+        column_or_default(frame, "Trainer", ""), column_or_default(frame, "Name", ""))
+
+    return data
+
+def add_attendance_metrics(data):
+    """Add registrations and capacity, which make up the attendance rate, to each row."""
+    console.print("⚙️ [yellow]Calculating attendance metrics...[/yellow]")
+
+    frame = data["frame"]
+    registered = map_unique(column_or_default(frame, "Angemeldet", "0"), int).to_numpy(dtype=np.int64)
+    capacity = map_unique(column_or_default(frame, "Max. Teilnehmer", "8"), int).to_numpy(dtype=np.int64)
+    if not capacity.all():
+        date = frame["Datum"].iloc[int(np.argmin(capacity != 0))]
+        raise ValueError(f"Invalid 'Max. Teilnehmer' of 0 for class on {date}.")
+
+    data["values"]["registered"] = registered
+    data["values"]["capacity"] = capacity
+
+    return data
+
+def apply_bonus_factors(data):
+    """Apply bonus factors based on attendance rates."""
+    console.print("⚙️ [yellow]Applying bonus factors...[/yellow]")
+
+    data["values"]["bonus_permille"] = current_tariff(data["settings"]).bonus_permille_batch(
+        data["values"]["registered"], data["values"]["capacity"])
+
+    return data
+
+def calculate_final_amounts(data):
+    """Calculate final hourly rates and total amounts in cents."""
+    console.print("⚙️ [yellow]Calculating final payment amounts...[/yellow]")
+
+    frame = data["frame"]
+    values = data["values"]
+    tariff = current_tariff(data["settings"])
+    # Final hourly rate with bonus and surcharges, rounded half up to whole cents
+    if tariff.has_surcharges:
+        weekdays = map_unique(frame["Datum"], weekday).to_numpy(dtype=np.int64)
+        values["final_rate_cents"] = tariff.final_rate_cents_batch(
+            values["base_rate_cents"], values["bonus_permille"], weekdays, minutes_of_day(frame["Startzeit"]))
+    else:
+        values["final_rate_cents"] = (values["base_rate_cents"] * values["bonus_permille"] + 500) // 1000
+
+    # Total payment for this class, rounded half up to whole cents
+    values["amount_cents"] = (values["final_rate_cents"] * values["minutes"] + 30) // 60
+
+    return data
+
+def add_summary_row(data):
+    """Add the totals for the summary row."""
+    console.print("⚙️ [yellow]Adding summary totals...[/yellow]")
+
+    data["totals"] = {
+        "minutes": int(data["values"]["minutes"].sum()),
+        "amount_cents": int(data["values"]["amount_cents"].sum()),
+    }
+    return data
+
+def prepare_fieldnames(data):
+    """Ensure all extra fields are included in fieldnames."""
+    for field in data["settings"].extra_fields:
+        if field not in data["fieldnames"]:
+            data["fieldnames"].append(field)
+
+    return data
+
+def format_for_excel(data):
+    """Select the decimal separator the output writers use (a comma for Excel compatibility)."""
+    console.print("⚙️ [yellow]Formatting for Excel compatibility...[/yellow]")
+
+    data["decimal_separator"] = "," if data["settings"].excel_friendly_format else "."
+    return data
+
+def format_column(data, field):
+    """Format one computed billing column for output, once per distinct value."""
+    values = data["values"]
+    separator = data.get("decimal_separator", ".")
+    if field == "Anmeldequote":
+        return map_unique(pd.Series(values["registered"] / values["capacity"] * 100), "{:.1f}%".format)
+
+    value_name, formatter = FORMATTERS[field]
+    return map_unique(pd.Series(values[value_name]), lambda value: formatter(value, separator))
+
+def output_columns(data):
+    """Return the formatted output columns (as lists) in fieldname order."""
+    frame = data["frame"]
+    columns = []
+    for key in data["fieldnames"]:
+        if key in COMPUTED_FIELDS and "values" in data:
+            columns.append(format_column(data, key).tolist())
+        elif key in frame.columns:
+            columns.append(frame[key].tolist())
+        else:
+            columns.append([""] * len(frame))
+    return columns
+
+def write_rows(data, csvfile, header=True, summary=True):
+    """Write header, data rows and summary row of columnar data to an open CSV file."""
+    fieldnames = data["fieldnames"]
+    writer = csv.writer(csvfile, delimiter=";")
+    if header:
+        writer.writerow(fieldnames)
+    writer.writerows(zip(*output_columns(data)))
+    if summary:
+        summary_row = format_summary_row(fieldnames, data["totals"], data.get("decimal_separator", "."))
+        writer.writerow([summary_row.get(key, "") for key in fieldnames])
+
+TRANSFORMATIONS = [
+    add_duration_calculations,
+    add_base_rates,
+    add_attendance_metrics,
+    apply_bonus_factors,
+    calculate_final_amounts,
+    add_summary_row,
+    prepare_fieldnames,
+    format_for_excel,
+]
+
+# Stages applied to a subset of rows (the summary row is built by the caller)
+ROW_TRANSFORMATIONS = [transform for transform in TRANSFORMATIONS if transform is not add_summary_row]
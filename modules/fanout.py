@@ -0,0 +1,132 @@
+"""This module bills every trainer of an activity export in a single run.
+
+The export is parsed and grouped by trainer once; the per-trainer transformation, CSV output
+and PDF invoice are then spread over a process pool.
+"""
+import os
+import re
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from rich.console import Console
+from configs.config import config
+from modules import columnar, generation, processing, archive, metrics
+
+# Initialize the console for rich output
+console = Console()
+
+def trainer_slug(trainer):
+    """Return a file-name friendly version of a trainer name."""
+    return re.sub(r"[^\w-]+", "-", trainer).strip("-").lower() or "unknown"
+
+def trainer_slugs(trainers):
+    """Return a distinct slug per trainer; names sharing a slug (e.g. "Anna Maria" and "anna-maria") are numbered."""
+    slugs, used = {}, set()
+    for trainer in sorted(trainers):
+        slug, number = trainer_slug(trainer), 1
+        while slug in used:
+            number += 1
+            slug = f"{trainer_slug(trainer)}-{number}"
+        slugs[trainer] = slug
+        used.add(slug)
+    return slugs
+
+def split_by_trainer(input_file, trainers=None, settings=None):
+    """Parse the export once, check it and group the billable sessions by trainer."""
+    from modules.validation import validate_export
+
+    fieldnames, frame = columnar.read_export(input_file)
+    processing.validate_columns(fieldnames)
+    frame = validate_export(frame, fieldnames, input_file, settings or config.snapshot(), trainers or None,
+                            processing.EXCLUDED_STATUSES)
+
+    if "Status" in frame.columns:
+        frame = frame.loc[~frame["Status"].isin(processing.EXCLUDED_STATUSES)]
+    frame = frame.loc[frame["Trainer"].str.strip() != ""]
+    if trainers:
+        frame = frame.loc[frame["Trainer"].isin(trainers)]
+
+    groups = {trainer: group.reset_index(drop=True)
+              for trainer, group in frame.groupby("Trainer", sort=True)}
+    logging.info("Found %d trainers with billable classes in '%s'.", len(groups), input_file)
+    return fieldnames, groups
+
+def quiet_worker(run=None, settings=None):
+    """Silence the per-stage console output in worker processes and log under the run of the fan-out."""
+    metrics.new_run(run, settings)
+    for module in (processing, columnar, generation):
+        module.console.quiet = True
+
+def bill_trainer(trainer, fieldnames, frame, input_file, settings, slug=None):
+    """Transform, save and invoice the sessions of a single trainer."""
+    slug = slug or trainer_slug(trainer)
+    data = processing.transform_data({"fieldnames": list(fieldnames), "frame": frame, "settings": settings})
+    # Kept apart from the single-trainer files, which the invoice generation picks up
+    output_name = os.path.join(processing.TRAINER_DIRECTORY,
+                               f"processed-{slug}-{os.path.basename(archive.plain_path(input_file))}")
+    csv_path = processing.save_processed_data(data, input_file, output_name=output_name)
+
+    # The merged invoice is rendered once all trainers are billed
+    if settings.merge_invoices:
+        return csv_path, None
+
+    # Named after the month of the export, so re-running an old export reproduces the same files
+    year, month = generation.invoice_period(input_file, data)
+    pdf_path = os.path.join(settings.generation_output_directory, f"invoice-{slug}-{month:02d}-{year}.pdf")
+    generation.render_invoice(generation.load_invoice_frame(csv_path, settings.invoice_columns, settings), pdf_path,
+                              f"Stundenabrechnung {month:02d}/{year} - {trainer}", settings=settings)
+    return csv_path, pdf_path
+
+def merge_invoices(results, input_file, settings):
+    """Render the invoices of all billed trainers into one PDF with a bookmark per trainer."""
+    year, month = generation.invoice_period(input_file)
+    pdf_path = os.path.join(settings.generation_output_directory, f"invoices-{month:02d}-{year}.pdf")
+    invoices = [(generation.load_invoice_frame(csv_path, settings.invoice_columns, settings), None,
+                 f"Stundenabrechnung {month:02d}/{year} - {trainer}")
+                for trainer, (csv_path, _) in results.items()]
+    return generation.render_invoices(invoices, merged_path=pdf_path, settings=settings)[0]
+
+def process_all_trainers(input_file=None, trainers=None, max_workers=None):
+    """Bill every (configured) trainer of the export in one run."""
+    console.print("👥 [green]Fan-out selected.[/green]")
+    logging.info("Started fan-out processing.")
+
+    settings = config.snapshot()
+    input_file = input_file or processing.discover_input_file()
+    trainers = trainers if trainers is not None else settings.trainers
+    fieldnames, groups = split_by_trainer(input_file, trainers, settings)
+
+    missing = sorted(set(trainers or []) - set(groups))
+    if missing:
+        logging.warning("No billable classes for configured trainers: %s", ", ".join(missing))
+        console.print(f"[yellow]No billable classes for: {', '.join(missing)}[/yellow]")
+    if not groups:
+        logging.error("No valid classes found in the input file after filtering.")
+        raise ValueError("No valid classes found in the input file after filtering.")
+
+    console.print(f"👥 [yellow]Billing {len(groups)} trainers...[/yellow]")
+    slugs = trainer_slugs(groups)
+    results, failures = {}, {}
+    with ProcessPoolExecutor(max_workers=max_workers or settings.fanout_workers,
+                             initializer=quiet_worker, initargs=(metrics.run_id, settings)) as executor:
+        futures = {executor.submit(bill_trainer, trainer, fieldnames, group, input_file, settings,
+                                   slugs[trainer]): trainer
+                   for trainer, group in groups.items()}
+        for future in as_completed(futures):
+            trainer = futures[future]
+            try:
+                results[trainer] = future.result()
+                logging.info("Billed trainer '%s': %s, %s", trainer, *results[trainer])
+            except Exception as e:
+                failures[trainer] = e
+                logging.error("Billing trainer '%s' failed: %s", trainer, e)
+                console.print(f"[bold red]Error:[/bold red] Billing {trainer} failed: {e}")
+
+    # Report (and merge the invoices) in trainer order
+    results = dict(sorted(results.items()))
+    if settings.merge_invoices and results:
+        pdf_path = merge_invoices(results, input_file, settings)
+        results = {trainer: (csv_path, pdf_path) for trainer, (csv_path, _) in results.items()}
+
+    console.print(f"👥 [green]Fan-out completed: {len(results)} invoices, {len(failures)} failures.[/green]")
+    logging.info("Fan-out completed: %d invoices, %d failures.", len(results), len(failures))
+    return results, failures
@@ -1,101 +1,413 @@
-"""This module performs the generation of PDF invoices for the Rechenmeister tool."""
+"""This module performs the generation of PDF invoices for the Rechenmeister tool.
+
+The invoice layout (page size, styles, table columns and widths, footer) is compiled once per
+process into an ``InvoiceTemplate``; rendering an invoice then only builds its table rows. The
+page tables are created one at a time while the document is laid out, so only the tables of the
+page being placed are held in memory. Many invoices are rendered with ``render_invoices``, as
+separate files or as one merged PDF with a bookmark per invoice.
+"""
 import os
-import glob
 import logging
-import pandas as pd
+from itertools import chain, islice
 from datetime import datetime
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table as PDFTable, TableStyle, Paragraph, Spacer
+from reportlab.lib import pagesizes
+from reportlab.lib.units import inch
+from reportlab.platypus import (BaseDocTemplate, PageTemplate, Frame, Table as PDFTable, TableStyle,
+                                Paragraph, Spacer, PageBreak)
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
 from rich.console import Console
+from configs.config import config, PAGE_SIZES
+from modules import metrics, archive
+from modules.records import SUMMARY_LABEL, COMPUTED_FIELDS, format_money, format_record, format_summary_row
 
 # Initialize the console for rich outputs
 console = Console()
 
-def generate_invoice():
-    """Handle the generation of the PDF invoice."""
+def get_processed_csv():
+    """Find and return the path to the processed CSV file (the latest month if there are several)."""
+    from modules.processing import by_period
+
+    output_folder = "output_csv"
+    output_file_pattern = "processed-*.csv"
+    output_file_list = by_period(archive.find(output_folder, output_file_pattern))
+    if not output_file_list:
+        logging.error("No processed CSV file found in 'output_csv' directory.")
+        console.print("[bold red]Error:[/bold red] No processed CSV file found in 'output_csv' directory.")
+        raise FileNotFoundError("No processed CSV file found in 'output_csv' directory.")
+    if len(output_file_list) > 1:
+        logging.warning("Found %d processed files, using the latest month.", len(output_file_list))
+    logging.info("Using processed file: %s", output_file_list[-1])
+    console.print(f"🧾 [yellow]Using processed file: {output_file_list[-1]}...[/yellow]")
+    return output_file_list[-1]
+
+def invoice_period(path=None, data=None):
+    """Return the (year, month) an invoice bills.
+
+    The month is taken from the export or processed file name, else from the first session date
+    of the data; only without either the current month is used.
+    """
+    from modules.ingestion import file_period, parse_export_date
+
+    period = file_period(path) if path else None
+    if period is None and data is not None:
+        from modules.sidecar import raw_columns
+        dates = raw_columns({**data, "fieldnames": ["Datum"]})["Datum"]
+        try:
+            first = min(parse_export_date(value) for value in dates.unique() if value)
+            period = first.year, first.month
+        except ValueError:
+            period = None
+    if period is None:
+        now = datetime.now()
+        period = now.year, now.month
+    return period
+
+def invoice_path(year, month, settings=None):
+    """Return the path of the PDF invoice for a month, named and placed as in the settings (or live configuration)."""
+    source = settings or config
+    return os.path.join(source.generation_output_directory, source.pdf_filename_format.format(month=month, year=year))
+
+@metrics.instrument("generation")
+def load_dataframe(csv_path):
+    """Read the processed CSV file into a DataFrame."""
+    import pandas as pd
+
+    with archive.open_text(csv_path) as csvfile:
+        dataframe = pd.read_csv(csvfile, delimiter=";", dtype=str, keep_default_na=False)
+    if dataframe.empty:
+        logging.error("Processed CSV file is empty.")
+        console.print("[bold red]Error:[/bold red] Processed CSV file is empty.")
+        raise ValueError("Processed CSV file is empty.")
+    logging.info("Read processed CSV file into DataFrame.")
+    return dataframe
+
+def load_invoice_frame(csv_path, table_columns=None, settings=None):
+    """Load the invoice DataFrame of a processed CSV file, from its binary sidecar if there is a current one."""
+    if (settings or config).binary_sidecar:
+        from modules.sidecar import load_sidecar
+
+        data = load_sidecar(csv_path)
+        if data is not None:
+            return invoice_frame(data, table_columns)
+    return load_dataframe(csv_path)
+
+# Columns every invoice layout reads
+INVOICE_COLUMNS = ["Datum", "Name", "Stundenbetrag"]
+
+def invoice_columns(table_columns=None):
+    """Return the columns of the invoice DataFrame: those of every layout plus the configured table columns."""
+    return list(dict.fromkeys([*INVOICE_COLUMNS, *(table_columns or config.invoice_columns)]))
+
+def invoice_frame(data, table_columns=None):
+    """Build the invoice DataFrame straight from processed data, without a CSV round trip."""
+    import pandas as pd
+
+    columns = invoice_columns(table_columns)
+    separator = data.get("decimal_separator", ".")
+    if "frame" in data:
+        from modules.columnar import format_column
+        rows = data["frame"].reindex(columns=columns, fill_value="")
+        for column in columns:
+            if column in COMPUTED_FIELDS:
+                rows[column] = format_column(data, column).tolist()
+    else:
+        values = ({**record.raw, **format_record(record, separator)} for record in data["rows"])
+        rows = pd.DataFrame([[row.get(column, "") for column in columns] for row in values], columns=columns)
+    summary_row = format_summary_row(columns, data["totals"], separator)
+    summary = pd.DataFrame([[summary_row[col] for col in columns]], columns=columns)
+    return pd.concat([rows, summary], ignore_index=True).fillna("")
+
+# Column widths (in points) of the invoice table per layout
+COLUMN_WIDTHS = {
+    "sessions": [120, 180, 100],
+    "day": [120, 180, 100],
+    "class": [180, 120, 100],
+}
+
+# Column widths (in points) of the per-session layout by column; other columns get the default width
+SESSION_COLUMN_WIDTHS = {"Datum": 120, "Name": 180, "Stundenbetrag": 100}
+DEFAULT_COLUMN_WIDTH = 80
+
+# Fixed row heights (in points), so the rows fitting on a page are known before the layout
+HEADER_ROW_HEIGHT = 27
+ROW_HEIGHT = 18
+
+# Built once and shared by the tables of every page
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+# Font of the footer line (invoice title and page number)
+FOOTER_FONT = ("Helvetica", 8)
+
+def text_column(dataframe, column):
+    """Return a column of the invoice DataFrame as a list of strings, blank where missing."""
+    if column not in dataframe.columns:
+        return [""] * len(dataframe)
+    series = dataframe[column]
+    return series.where(series.notna(), "").astype(str).tolist()
+
+def amount_cents_column(amounts):
+    """Parse formatted amounts (with a decimal point or comma) into integer cents."""
+    import pandas as pd
+
+    euros = pd.to_numeric(pd.Series(amounts, dtype=object).str.replace(",", ".", regex=False), errors="coerce")
+    return (euros.fillna(0) * 100).round().astype("int64")
+
+def session_table_rows(dataframe, columns=None):
+    """Return the header and the rows of the per-session layout, taken column-wise."""
+    columns = list(columns or INVOICE_COLUMNS)
+    dates = text_column(dataframe, "Datum")
+    summary = [date.strip() == SUMMARY_LABEL for date in dates]
+    values = []
+    for column in columns:
+        value = text_column(dataframe, column)
+        if column == "Name":
+            # For the summary row, replace Name with "Summe"
+            value = ["Summe" if is_summary else name for is_summary, name in zip(summary, value)]
+        values.append(value)
+    return columns, list(zip(*values))
+
+def aggregated_table_rows(dataframe, layout):
+    """Return the header and the rows of the per-day or per-class layout."""
+    import pandas as pd
+
+    dates = text_column(dataframe, "Datum")
+    amounts = text_column(dataframe, "Stundenbetrag")
+    separator = "," if any("," in amount for amount in amounts) else "."
+    frame = pd.DataFrame({"Datum": dates, "Name": text_column(dataframe, "Name"),
+                          "cents": amount_cents_column(amounts)})
+    frame = frame.loc[frame["Datum"].str.strip() != SUMMARY_LABEL]
+
+    key = "Datum" if layout == "day" else "Name"
+    groups = frame.groupby(key, sort=layout == "class")["cents"].agg(["size", "sum"])
+    rows = [(group, str(count), format_money(int(cents), separator))
+            for group, count, cents in zip(groups.index.tolist(), groups["size"].tolist(), groups["sum"].tolist())]
+    rows.append(("Summe", str(len(frame)), format_money(int(frame["cents"].sum()), separator)))
+    return [key, "Einheiten", "Stundenbetrag"], rows
+
+def table_rows(dataframe, layout="sessions", columns=None):
+    """Return the header and rows of the invoice table for a layout ("sessions", "day" or "class").
+
+    ``columns`` selects the columns of the per-session layout (default: Datum, Name, Stundenbetrag).
+    """
+    if layout == "sessions":
+        return session_table_rows(dataframe, columns)
+    if layout in ("day", "class"):
+        return aggregated_table_rows(dataframe, layout)
+    raise ValueError(f"Unknown invoice layout '{layout}', expected 'sessions', 'day' or 'class'.")
+
+def column_widths(layout, columns, available_width):
+    """Return the column widths of the invoice table, narrowed proportionally if they exceed the page."""
+    if layout != "sessions":
+        widths = COLUMN_WIDTHS[layout]
+    else:
+        widths = [SESSION_COLUMN_WIDTHS.get(column, DEFAULT_COLUMN_WIDTH) for column in columns]
+    scale = min(available_width / sum(widths), 1)
+    return [width * scale for width in widths]
+
+def rows_fitting(height):
+    """Return how many body rows (below a header row) fit into a height."""
+    return max(int((height - HEADER_ROW_HEIGHT) // ROW_HEIGHT), 1)
+
+def page_tables(header, rows, col_widths, first_page_rows, rows_per_page):
+    """Yield one page-sized table per page, each repeating the header row."""
+    start, size = 0, first_page_rows
+    while True:
+        chunk = rows[start:start + size]
+        table = PDFTable([header, *chunk], colWidths=col_widths, repeatRows=1,
+                         rowHeights=[HEADER_ROW_HEIGHT] + [ROW_HEIGHT] * len(chunk))
+        table.setStyle(TABLE_STYLE)
+        yield table
+        start, size = start + size, rows_per_page
+        if start >= len(rows):
+            return
+
+def build_pdf_tables(dataframe, layout="sessions", first_page_rows=40, rows_per_page=40, columns=None,
+                     col_widths=None):
+    """Return the invoice as an iterator of page-sized tables, each repeating the header row.
+
+    The rows are read from the DataFrame right away; each table is only created when it is consumed.
+    """
+    header, rows = table_rows(dataframe, layout, columns)
+    return page_tables(header, rows, col_widths or COLUMN_WIDTHS[layout], first_page_rows, rows_per_page)
+
+def page_capacity(doc, elements):
+    """Return how many table rows fit on the first page (below the given elements) and on every further page."""
+    # Frame height without the frame's own padding
+    page_height = doc.height - 12
+    used = sum(element.wrap(doc.width, page_height)[1] + element.getSpaceBefore() + element.getSpaceAfter()
+               for element in elements)
+    return rows_fitting(page_height - used), rows_fitting(page_height)
+
+# Flowables taken from the story ahead of the one being placed, for reportlab's look-ahead (keepWithNext)
+LOOKAHEAD = 4
+
+class InvoiceDocument(BaseDocTemplate):
+    """A PDF document of one or more invoices, with a bookmark and a page footer per invoice.
+
+    It is built from any iterable of flowables, which is consumed a few flowables at a time.
+    """
+
+    def __init__(self, pdf_path, template):
+        super().__init__(pdf_path, pagesize=template.page_size)
+        self.invoice_title = ""
+        self.invoice_start = 1  # page the current invoice starts on
+        self.invoice_count = 0
+        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height)
+        self.addPageTemplates([PageTemplate(frames=[frame], onPageEnd=template.draw_footer)])
+        self.pending, self.window = iter(()), []
+
+    def build(self, flowables, *args, **kwargs):
+        """Lay out the flowables, taking them from the iterable only as the pages are filled."""
+        self.pending = iter(flowables)
+        self.window = list(islice(self.pending, LOOKAHEAD))
+        super().build(self.window, *args, **kwargs)
+
+    def handle_flowable(self, flowables):
+        """Place the first flowable, then refill the window from the story."""
+        super().handle_flowable(flowables)
+        # reportlab also places its own pending flowables through here
+        if flowables is self.window:
+            flowables.extend(islice(self.pending, max(LOOKAHEAD - len(flowables), 0)))
+
+    def afterFlowable(self, flowable):
+        """Start a new invoice (bookmark, footer, page count) after its title was placed."""
+        title = getattr(flowable, "invoice_title", None)
+        if title is None:
+            return
+        key = f"invoice-{self.invoice_count}"
+        self.canv.bookmarkPage(key)
+        self.canv.addOutlineEntry(title, key, level=0)
+        self.invoice_title, self.invoice_start = title, self.page
+        self.invoice_count += 1
+
+class InvoiceTemplate:
+    """The invoice layout, compiled once: page size, styles, table columns and widths, and footer.
+
+    Rendering an invoice with it only builds the title and the table rows.
+    """
+
+    def __init__(self, layout="sessions", columns=INVOICE_COLUMNS, page_size="A4"):
+        if layout not in COLUMN_WIDTHS:
+            raise ValueError(f"Unknown invoice layout '{layout}', expected 'sessions', 'day' or 'class'.")
+        self.layout = layout
+        self.columns = list(columns)
+        if page_size.upper() not in PAGE_SIZES:
+            raise ValueError(f"Unknown page size '{page_size}', expected one of {', '.join(PAGE_SIZES)}.")
+        self.page_size = getattr(pagesizes, page_size.upper())
+        self.title_style = getSampleStyleSheet()['Title']
+
+        # Frame of the default one inch page margins, with and without the frame's own padding
+        self.width = self.page_size[0] - 2 * inch
+        self.height = self.page_size[1] - 2 * inch - 12
+        self.col_widths = column_widths(layout, self.columns, self.width - 12)
+        self.rows_per_page = rows_fitting(self.height)
+
+    def draw_footer(self, canvas, doc):
+        """Draw the invoice title and its page number below the frame."""
+        canvas.saveState()
+        canvas.setFont(*FOOTER_FONT)
+        canvas.setFillColor(colors.grey)
+        canvas.drawCentredString(self.page_size[0] / 2, doc.bottomMargin / 2,
+                                 f"{doc.invoice_title} - Seite {doc.page - doc.invoice_start + 1}")
+        canvas.restoreState()
+
+    def story(self, dataframe, title):
+        """Return the flowables of one invoice as an iterator: the title and one page-sized table per page."""
+        heading = Paragraph(title, self.title_style)
+        heading.invoice_title = title
+        elements = [Spacer(1, 6), heading, Spacer(1, 12)]
+
+        used = sum(element.wrap(self.width, self.height)[1] + element.getSpaceBefore() + element.getSpaceAfter()
+                   for element in elements)
+        tables = metrics.measure("generation", "build_pdf_tables", build_pdf_tables, dataframe, layout=self.layout,
+                                 first_page_rows=rows_fitting(self.height - used),
+                                 rows_per_page=self.rows_per_page, columns=self.columns,
+                                 col_widths=self.col_widths)
+        return chain(elements, tables, [Spacer(1, 12)])
+
+    def render(self, invoices, pdf_path):
+        """Render invoices, given as (dataframe, title) pairs, into one PDF file, each starting on a new page."""
+        os.makedirs(os.path.dirname(pdf_path) or ".", exist_ok=True)
+        logging.info("Creating PDF document: %s", pdf_path)
+        stories = [self.story(dataframe, title) for dataframe, title in invoices]
+        elements = chain.from_iterable(chain([PageBreak()], story) if index else story
+                                       for index, story in enumerate(stories))
+
+        try:
+            metrics.measure("generation", "doc.build", InvoiceDocument(pdf_path, self).build, elements,
+                            rows_in=sum(len(dataframe) for dataframe, _ in invoices))
+            logging.info("PDF invoice generated successfully: %s", pdf_path)
+            console.print(f"🧾 [green]PDF invoice generated successfully: {pdf_path}.[/green]")
+        except Exception as e:
+            logging.error("Failed to generate PDF invoice: %s", e)
+            console.print(f"[bold red]Error:[/bold red] Failed to generate PDF invoice: {e}")
+            raise IOError(f"Failed to generate PDF invoice: {e}") from e
+        return pdf_path
+
+# Compiled invoice templates of this process by layout, table columns and page size
+TEMPLATES = {}
+
+def invoice_template(layout=None, settings=None):
+    """Return the invoice template of the settings (or the live configuration), compiled once per process."""
+    source = settings or config
+    key = (layout or source.invoice_layout, tuple(source.invoice_columns), source.page_size)
+    if key not in TEMPLATES:
+        TEMPLATES[key] = InvoiceTemplate(*key)
+    return TEMPLATES[key]
+
+def render_invoices(invoices, merged_path=None, layout=None, settings=None):
+    """Render many invoices, given as (dataframe, pdf_path, title) tuples, with one compiled template.
+
+    Each invoice is written to its own path, or with ``merged_path`` all of them are written to one
+    PDF with a bookmark per invoice. Returns the written paths.
+    """
+    template = invoice_template(layout, settings)
+    if merged_path:
+        return [template.render([(dataframe, title) for dataframe, _, title in invoices], merged_path)]
+    return [template.render([(dataframe, title)], pdf_path) for dataframe, pdf_path, title in invoices]
+
+def render_invoice(dataframe, pdf_path, title, layout=None, settings=None):
+    """Render the invoice for the processed DataFrame to a PDF file, one page-sized table at a time."""
+    return render_invoices([(dataframe, pdf_path, title)], layout=layout, settings=settings)[0]
+
+def generate_invoice(data=None, csv_path=None, source=None, settings=None):
+    """Handle the generation of the PDF invoice.
+
+    When processed data is passed in, it is rendered directly instead of reading the processed CSV.
+    The invoice is named after the month of the source export (or processed CSV file) and follows
+    the settings of the run: those of the data, the ones passed in, or a new snapshot.
+    """
     console.print("🧾 [green]Generate invoice selected.[/green]")
 
-    def get_processed_csv():
-        output_folder = "output_csv"
-        output_file_pattern = "processed-*.csv"
-        output_file_list = glob.glob(os.path.join(output_folder, output_file_pattern))
-        if not output_file_list:
-            logging.error("No processed CSV file found in 'output_csv' directory.")
-            console.print("[bold red]Error:[/bold red] No processed CSV file found in 'output_csv' directory.")
-            raise FileNotFoundError("No processed CSV file found in 'output_csv' directory.")
-        logging.info("Using processed file: %s", output_file_list[0])
-        console.print(f"🧾 [yellow]Using processed file: {output_file_list[0]}...[/yellow]")
-        return output_file_list[0]
-
-    def load_dataframe(csv_path):
-        dataframe = pd.read_csv(csv_path, delimiter=";")
-        if dataframe.empty:
-            logging.error("Processed CSV file is empty.")
-            console.print("[bold red]Error:[/bold red] Processed CSV file is empty.")
-            raise ValueError("Processed CSV file is empty.")
-        logging.info("Read processed CSV file into DataFrame.")
-        return dataframe
-
-    def build_pdf_table(dataframe):
-        columns = ["Datum", "Name", "Stundenbetrag"]
-        # Only keep selected columns, fill missing with blank
-        df = dataframe.reindex(columns=columns, fill_value="")
-        # Keep all rows including summary row
-        df = df.replace({pd.NA: "", None: "", float('nan'): "", "nan": ""})
-        # Prepare table data
-        table_data = [columns]
-        for _, row in df.iterrows():
-            # For summary row, replace Name with "Summe"
-            name_value = "Summe" if row.get("Datum", "").strip() == "Gesamt (Monat)" else row.get("Name", "")
-            table_data.append([
-                row.get("Datum", ""),
-                name_value,
-                row.get("Stundenbetrag", "")
-            ])
-        col_widths = [120, 180, 100]  # px widths for columns
-        table = PDFTable(table_data, colWidths=col_widths)
-        style = TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ])
-        table.setStyle(style)
-        return table
-
-    csv_path = get_processed_csv()
-    df = load_dataframe(csv_path)
-    now = datetime.now()
-    pdf_file_name = f"invoice-{now.month:02d}-{now.year}.pdf"
-    pdf_dir = "output_pdf"
-    os.makedirs(pdf_dir, exist_ok=True)
-    pdf_path = os.path.join(pdf_dir, pdf_file_name)
-    logging.info("Creating PDF document: %s", pdf_path)
-    doc = SimpleDocTemplate(pdf_path, pagesize=A4)
-    styles = getSampleStyleSheet()
-
-    # Add header
-    elements = [
-        Spacer(1, 6),
-        Paragraph(f"Stundenabrechnung {now.month:02d}/{now.year}", styles['Title']),
-        Spacer(1, 12)
-    ]
-
-    # Add table
-    table = build_pdf_table(df)
-    elements.append(table)
-    elements.append(Spacer(1, 12))
-
-    try:
-        doc.build(elements)
-        logging.info("PDF invoice generated successfully: %s", pdf_path)
-        console.print(f"🧾 [green]PDF invoice generated successfully: {pdf_path}.[/green]")
-    except Exception as e:
-        logging.error("Failed to generate PDF invoice: %s", e)
-        console.print(f"[bold red]Error:[/bold red] Failed to generate PDF invoice: {e}")
-        raise IOError(f"Failed to generate PDF invoice: {e}") from e
\ No newline at end of file
+    csv_path = csv_path if data is not None else csv_path or get_processed_csv()
+    settings = data["settings"] if data is not None else settings or config.snapshot()
+    year, month = invoice_period(source or csv_path, data)
+    pdf_path = invoice_path(year, month, settings)
+    title = f"Stundenabrechnung {month:02d}/{year}"
+
+    if data is not None:
+        logging.info("Using processed data from memory.")
+        return render_invoice(invoice_frame(data, settings.invoice_columns), pdf_path, title, settings=settings)
+
+    # Skip rendering when the invoice was already built from this exact processed file
+    if settings.incremental:
+        from modules import incremental
+        if incremental.invoice_is_current(csv_path, pdf_path):
+            logging.info("Processed data unchanged, keeping PDF invoice: %s", pdf_path)
+            console.print(f"🧾 [green]Processed data unchanged, invoice is up to date: {pdf_path}.[/green]")
+            return pdf_path
+
+    df = load_invoice_frame(csv_path, settings.invoice_columns, settings)
+    render_invoice(df, pdf_path, title, settings=settings)
+    if settings.incremental:
+        incremental.record_invoice(csv_path, pdf_path)
+    return pdf_path
@@ -0,0 +1,252 @@
+"""This module keeps the historical session store of the Rechenmeister tool.
+
+Every processed month is also written to a SQLite database, one row per billed session with its
+typed billing values (minutes, cents, per mille). Indexes on trainer, date and class name make
+totals, hours and bonus distributions over any date range a single indexed query instead of
+re-parsing every processed CSV. Sessions are keyed by the month of the export they were billed
+from: processing a month again, in a single-trainer or a fan-out run, replaces the stored sessions
+of that month for the trainers it billed.
+"""
+import os
+import sqlite3
+import logging
+from datetime import date
+from rich.console import Console
+from rich.table import Table
+from configs.config import config
+from modules import metrics
+from modules.records import VALUE_NAMES, format_hours, format_money
+
+# Initialize the console for rich output
+console = Console()
+
+# Columns of a stored session
+SESSION_COLUMNS = """
+    period TEXT NOT NULL,
+    date TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    trainer TEXT NOT NULL,
+    class_name TEXT NOT NULL,
+    minutes INTEGER NOT NULL,
+    base_rate_cents INTEGER NOT NULL,
+    registered INTEGER NOT NULL,
+    capacity INTEGER NOT NULL,
+    bonus_permille INTEGER NOT NULL,
+    final_rate_cents INTEGER NOT NULL,
+    amount_cents INTEGER NOT NULL
+"""
+
+# Streaming runs stage their chunks in staged_sessions and move them to sessions once the month is complete
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,{SESSION_COLUMNS});
+CREATE INDEX IF NOT EXISTS idx_sessions_period_trainer ON sessions (period, trainer);
+CREATE INDEX IF NOT EXISTS idx_sessions_date ON sessions (date);
+CREATE INDEX IF NOT EXISTS idx_sessions_trainer_date ON sessions (trainer, date);
+CREATE INDEX IF NOT EXISTS idx_sessions_class_date ON sessions (class_name, date);
+CREATE TABLE IF NOT EXISTS staged_sessions (
+    stage TEXT NOT NULL,{SESSION_COLUMNS});
+CREATE INDEX IF NOT EXISTS idx_staged_sessions_stage ON staged_sessions (stage);
+"""
+
+# Databases of earlier versions keyed the sessions by the name of the processed CSV file
+MIGRATE_SOURCE_KEY = """
+DROP INDEX IF EXISTS idx_sessions_source;
+ALTER TABLE sessions RENAME COLUMN source TO period;
+UPDATE sessions SET period = substr(date, 1, 7);
+DROP TABLE IF EXISTS staged_sessions;
+"""
+
+# Export columns stored next to the typed values, with their database column
+RAW_COLUMNS = {"Datum": "date", "Startzeit": "start_time", "Endzeit": "end_time",
+               "Trainer": "trainer", "Name": "class_name"}
+
+# Grouping choices of the reports
+GROUP_COLUMNS = {
+    "trainer": "trainer",
+    "class": "class_name",
+    "month": "substr(date, 1, 7)",
+    "day": "date",
+}
+
+def database_path(settings=None):
+    """Return the path of the history database of the settings (or the live configuration).
+
+    Relative paths are inside the processing output directory.
+    """
+    source = settings or config
+    return os.path.join(source.processing_output_directory or "output_csv", source.history_database)
+
+def connect(path=None):
+    """Open the history database, creating its schema if needed."""
+    path = path or database_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    # Write-ahead logging lets the fan-out workers store their months concurrently
+    connection.execute("PRAGMA journal_mode=WAL")
+    if "source" in {row[1] for row in connection.execute("PRAGMA table_info(sessions)")}:
+        connection.executescript(MIGRATE_SOURCE_KEY)
+    connection.executescript(SCHEMA)
+    return connection
+
+def connect_existing(path=None):
+    """Open the history database for a report, which requires it to exist."""
+    path = path or database_path()
+    if not os.path.exists(path):
+        logging.error("No history database found at '%s'.", path)
+        raise FileNotFoundError(f"No history database found at '{path}'. Process a month first.")
+    return connect(path)
+
+def iso_date(value):
+    """Convert a DD.MM.YY export date to an ISO date string."""
+    from modules.ingestion import parse_export_date
+    return parse_export_date(value).isoformat()
+
+def export_period(input_file, data):
+    """Return the month ("YYYY-MM") an export bills: from its file name, else from its first session."""
+    from modules.ingestion import file_period
+
+    period = file_period(input_file)
+    if period is not None:
+        return f"{period[0]:04d}-{period[1]:02d}"
+    from modules.sidecar import raw_columns
+    dates = raw_columns({**data, "fieldnames": ["Datum"]})["Datum"]
+    return min(iso_date(value) for value in set(dates) if value)[:7]
+
+def session_rows(data):
+    """Yield one database row per session of processed data."""
+    from modules.sidecar import raw_columns, typed_values
+
+    columns = raw_columns({**data, "fieldnames": list(RAW_COLUMNS)})
+    dates = {value: iso_date(value) for value in set(columns["Datum"])}
+    values = [array.tolist() for array in typed_values(data).values()]
+    raw = [columns[column].tolist() for column in RAW_COLUMNS]
+    raw[0] = [dates[value] for value in raw[0]]
+    return zip(*raw, *values)
+
+# Columns of an inserted session row
+INSERT_COLUMNS = ", ".join(["period", *RAW_COLUMNS.values(), *VALUE_NAMES])
+
+# Index of the trainer in a session row
+TRAINER_INDEX = list(RAW_COLUMNS).index("Trainer")
+
+@metrics.instrument("processing")
+def store_sessions(data, period, path=None):
+    """Store the sessions of processed data for a month, replacing what was stored for its trainers before."""
+    rows = list(session_rows(data))
+    trainers = sorted({row[TRAINER_INDEX] for row in rows})
+    trainer_markers = ", ".join("?" * len(trainers))
+    placeholders = ", ".join("?" for _ in INSERT_COLUMNS.split(", "))
+    connection = connect(path)
+    try:
+        with connection:
+            connection.execute(f"DELETE FROM sessions WHERE period = ? AND trainer IN ({trainer_markers})",
+                               (period, *trainers))
+            connection.executemany(f"INSERT INTO sessions ({INSERT_COLUMNS}) VALUES ({placeholders})",
+                                   ((period, *row) for row in rows))
+    finally:
+        connection.close()
+    logging.info("Stored sessions of %s (%s) in the history database.", period, ", ".join(trainers))
+    return data
+
+@metrics.instrument("processing")
+def stage_sessions(data, period, stage, path=None):
+    """Stage the sessions of one chunk of a streamed month under ``stage``; the stored month stays unchanged."""
+    placeholders = ", ".join("?" for _ in INSERT_COLUMNS.split(", "))
+    connection = connect(path)
+    try:
+        with connection:
+            connection.executemany(f"INSERT INTO staged_sessions (stage, {INSERT_COLUMNS}) VALUES (?, {placeholders})",
+                                   ((stage, period, *row) for row in session_rows(data)))
+    finally:
+        connection.close()
+    return data
+
+def commit_staged(stage, path=None):
+    """Replace the stored sessions of the staged months and trainers with the staged sessions in one transaction."""
+    connection = connect(path)
+    try:
+        with connection:
+            connection.execute("DELETE FROM sessions WHERE (period, trainer) IN "
+                               "(SELECT DISTINCT period, trainer FROM staged_sessions WHERE stage = ?)", (stage,))
+            connection.execute(f"INSERT INTO sessions ({INSERT_COLUMNS}) "
+                               f"SELECT {INSERT_COLUMNS} FROM staged_sessions WHERE stage = ?", (stage,))
+            connection.execute("DELETE FROM staged_sessions WHERE stage = ?", (stage,))
+    finally:
+        connection.close()
+    logging.info("Stored sessions of '%s' in the history database.", stage)
+
+def discard_staged(stage, path=None):
+    """Drop the sessions staged under ``stage`` (by a failed or interrupted streaming run)."""
+    connection = connect(path)
+    try:
+        with connection:
+            connection.execute("DELETE FROM staged_sessions WHERE stage = ?", (stage,))
+    finally:
+        connection.close()
+
+def date_filter(start=None, end=None, trainer=None, class_name=None):
+    """Return the WHERE clause and parameters for the report filters."""
+    clauses, parameters = [], []
+    for condition, value in (("date >= ?", start), ("date <= ?", end),
+                             ("trainer = ?", trainer), ("class_name = ?", class_name)):
+        if value is not None:
+            clauses.append(condition)
+            parameters.append(value.isoformat() if isinstance(value, date) else value)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", parameters
+
+def query_totals(start=None, end=None, group_by="trainer", trainer=None, class_name=None, path=None):
+    """Return (group, sessions, minutes, amount in cents) per group for a date range."""
+    where, parameters = date_filter(start, end, trainer, class_name)
+    group = GROUP_COLUMNS[group_by]
+    connection = connect_existing(path)
+    try:
+        return connection.execute(
+            f"SELECT {group}, COUNT(*), SUM(minutes), SUM(amount_cents) FROM sessions{where} "
+            f"GROUP BY {group} ORDER BY {group}", parameters).fetchall()
+    finally:
+        connection.close()
+
+def query_bonus_distribution(start=None, end=None, group_by="trainer", trainer=None, class_name=None, path=None):
+    """Return (group, bonus factor in per mille, sessions, minutes, amount in cents) for a date range."""
+    where, parameters = date_filter(start, end, trainer, class_name)
+    group = GROUP_COLUMNS[group_by]
+    connection = connect_existing(path)
+    try:
+        return connection.execute(
+            f"SELECT {group}, bonus_permille, COUNT(*), SUM(minutes), SUM(amount_cents) FROM sessions{where} "
+            f"GROUP BY {group}, bonus_permille ORDER BY {group}, bonus_permille", parameters).fetchall()
+    finally:
+        connection.close()
+
+def report_cells(report, group, sessions, minutes, cents):
+    """Return the table cells of one group of a totals or hours report."""
+    cells = [str(group), str(sessions), format_hours(minutes)]
+    return cells + [format_money(cents)] if report == "totals" else cells
+
+def print_report(report, start=None, end=None, group_by="trainer", trainer=None, class_name=None):
+    """Print a totals, hours or bonus report for a date range."""
+    period = f"{start or '...'} - {end or '...'}"
+    table = Table(title=f"{report.capitalize()} by {group_by} ({period})")
+    table.add_column(group_by.capitalize(), style="cyan")
+
+    if report == "bonus":
+        rows = query_bonus_distribution(start, end, group_by, trainer, class_name)
+        for title in ("Bonus", "Sessions", "Hours", "Amount"):
+            table.add_column(title, justify="right")
+        for group, permille, sessions, minutes, cents in rows:
+            table.add_row(str(group), f"{permille / 1000:g}x", str(sessions), format_hours(minutes),
+                          format_money(cents))
+    else:
+        rows = query_totals(start, end, group_by, trainer, class_name)
+        titles = ["Sessions", "Hours"] + (["Amount"] if report == "totals" else [])
+        for title in titles:
+            table.add_column(title, justify="right")
+        for group, sessions, minutes, cents in rows:
+            table.add_row(*report_cells(report, group, sessions, minutes, cents))
+        if rows:
+            totals = [sum(row[index] for row in rows) for index in (1, 2, 3)]
+            table.add_row(*report_cells(report, "Total", *totals), style="bold")
+    console.print(table)
+    return rows
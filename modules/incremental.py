@@ -0,0 +1,172 @@
+"""This module provides incremental (delta) processing for growing month-to-date exports.
+
+A JSON manifest next to the processed CSV records the content hash of the input, a hash per
+billable session (keyed by date, start time, name and trainer) with its typed billing values,
+and the hash of the processed CSV the last invoice was rendered from. A rerun only transforms new
+or changed sessions and the invoice is skipped when the processed result did not change.
+"""
+import os
+import io
+import json
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from rich.console import Console
+from configs.config import config
+from modules import columnar, sidecar, archive
+from modules.ingestion import file_hash
+from modules.processing import EXCLUDED_STATUSES, validate_columns, save_sidecar, save_history, save_workbook
+from modules.records import VALUE_NAMES
+from modules.validation import validate_export
+from modules.workbook import workbook_path
+
+# Initialize the console for rich output
+console = Console()
+
+# Columns identifying a session across exports
+SESSION_KEY_COLUMNS = ["Datum", "Startzeit", "Name", "Trainer"]
+
+def manifest_path(output_file):
+    """Return the path of the manifest belonging to a processed CSV file."""
+    return f"{output_file}.manifest.json"
+
+def load_manifest(output_file):
+    """Load the manifest of a processed CSV file, or an empty one."""
+    try:
+        with open(manifest_path(output_file), encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_manifest(output_file, manifest):
+    """Atomically write the manifest of a processed CSV file."""
+    path = manifest_path(output_file)
+    with open(f"{path}.part", 'w', encoding="utf-8") as file:
+        file.write(json.dumps(manifest))
+    os.replace(f"{path}.part", path)
+
+def settings_fingerprint(settings):
+    """Return the settings that influence the computed billing columns."""
+    fingerprint = {
+        "base_hourly_rate": settings.base_hourly_rate,
+        "trainer": settings.trainer,
+        "extra_fields": settings.extra_fields,
+        "excel_friendly_format": settings.excel_friendly_format,
+        "tariff": settings.tariff,
+    }
+    # Compare like the manifest stores it (tuples and frozen sections as plain JSON)
+    return json.loads(json.dumps(fingerprint))
+
+def session_keys(frame):
+    """Build a stable key per session, numbering repeated sessions in file order."""
+    base = frame[SESSION_KEY_COLUMNS[0]]
+    for column in SESSION_KEY_COLUMNS[1:]:
+        base = base + "|" + frame[column]
+    occurrence = base.groupby(base, sort=False).cumcount()
+    return (base + "#" + occurrence.astype(str)).tolist()
+
+def row_hashes(frame):
+    """Return a content hash per row."""
+    return [f"{value:016x}" for value in pd.util.hash_pandas_object(frame, index=False).tolist()]
+
+def process_incremental(input_file, settings=None):
+    """Process only new or changed sessions and merge them with the stored results.
+
+    Returns the path of the processed CSV and whether its content changed.
+    """
+    settings = settings or config.snapshot()
+    output_folder = settings.processing_output_directory
+    os.makedirs(output_folder, exist_ok=True)
+    output_file = os.path.join(output_folder, f"processed-{os.path.basename(archive.plain_path(input_file))}")
+
+    manifest = load_manifest(output_file)
+    input_hash = file_hash(input_file)
+    fingerprint = settings_fingerprint(settings)
+    if manifest.get("settings") != fingerprint:
+        manifest = {}
+
+    if manifest.get("input_hash") == input_hash and os.path.exists(output_file):
+        logging.info("Input file unchanged since last run, keeping '%s'.", output_file)
+        console.print("🛠 [yellow]Input file unchanged, nothing to process.[/yellow]")
+        return output_file, False
+
+    # Parse and filter the export
+    fieldnames, frame = columnar.read_export(input_file)
+    validate_columns(fieldnames)
+    frame = validate_export(frame, fieldnames, input_file, settings, (settings.trainer,), EXCLUDED_STATUSES)
+    frame = columnar.filter_sessions(frame, EXCLUDED_STATUSES, settings.trainer)
+    if not len(frame):
+        logging.error("No valid classes found in the input file after filtering.")
+        console.print("[bold red]Error:[/bold red] No valid classes found in the input file after filtering.")
+        raise ValueError("No valid classes found in the input file after filtering.")
+
+    keys = session_keys(frame)
+    hashes = row_hashes(frame)
+    stored = manifest.get("sessions", {})
+    changed = [index for index, (key, row_hash) in enumerate(zip(keys, hashes))
+               if stored.get(key, [None])[0] != row_hash]
+    logging.info("Incremental run: %d of %d sessions are new or changed.", len(changed), len(keys))
+    console.print(f"🛠 [yellow]{len(changed)} of {len(keys)} sessions are new or changed...[/yellow]")
+
+    # Transform the new or changed sessions only
+    computed = {}
+    if changed:
+        data = {"fieldnames": list(fieldnames), "frame": frame.iloc[changed].reset_index(drop=True),
+                "settings": settings}
+        for transform in columnar.ROW_TRANSFORMATIONS:
+            data = transform(data)
+        values = zip(*(data["values"][name].tolist() for name in VALUE_NAMES))
+        computed = {keys[index]: list(row) for index, row in zip(changed, values)}
+
+    # Merge with the stored sessions, in export order (each entry is [hash, *typed values])
+    sessions = {key: [row_hash, *computed[key]] if key in computed else stored[key]
+                for key, row_hash in zip(keys, hashes)}
+
+    merged = [sessions[key] for key in keys]
+    values = {name: np.array([session[position] for session in merged], dtype=np.int64)
+              for position, name in enumerate(VALUE_NAMES, start=1)}
+    data = {"fieldnames": list(fieldnames), "frame": frame, "values": values, "settings": settings}
+    data = columnar.add_summary_row(columnar.prepare_fieldnames(data))
+    data = columnar.format_for_excel(data)
+
+    buffer = io.StringIO(newline="")
+    columnar.write_rows(data, buffer)
+    content = buffer.getvalue().encode("utf-8")
+    output_hash = hashlib.sha256(content).hexdigest()
+
+    result_changed = output_hash != manifest.get("output_hash") or not os.path.exists(output_file)
+    if result_changed:
+        with open(f"{output_file}.part", 'wb') as csvfile:
+            csvfile.write(content)
+        os.replace(f"{output_file}.part", output_file)
+        logging.info("Processed data written to '%s'.", output_file)
+    else:
+        logging.info("Processed result unchanged, keeping '%s'.", output_file)
+    if settings.xlsx_export and (result_changed or not os.path.exists(workbook_path(output_file))):
+        save_workbook(data, output_file)
+    if settings.binary_sidecar and (result_changed or not os.path.exists(sidecar.sidecar_path(output_file))):
+        save_sidecar(data, output_file)
+    if settings.history_enabled and result_changed:
+        save_history(data, input_file)
+
+    manifest.update({
+        "settings": fingerprint,
+        "input_hash": input_hash,
+        "output_hash": output_hash,
+        "sessions": sessions,
+    })
+    save_manifest(output_file, manifest)
+    return output_file, result_changed
+
+def invoice_is_current(csv_path, pdf_path):
+    """Return whether the PDF was already rendered from the current processed CSV."""
+    invoice = load_manifest(csv_path).get("invoice", {})
+    return (invoice.get("pdf_path") == pdf_path and os.path.exists(pdf_path)
+            and invoice.get("csv_hash") == file_hash(csv_path))
+
+def record_invoice(csv_path, pdf_path):
+    """Remember which processed CSV the PDF was rendered from."""
+    manifest = load_manifest(csv_path)
+    manifest["invoice"] = {"csv_hash": file_hash(csv_path), "pdf_path": pdf_path}
+    save_manifest(csv_path, manifest)
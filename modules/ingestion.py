@@ -1,10 +1,21 @@
-"""This module handles file ingestion - moving and renaming source files."""
+"""This module handles file ingestion - moving and renaming source files.
+
+Besides the single-file ingestion of the current month, a bulk mode takes every matching export,
+names each one after the month of its own date range, drops exports whose content was already
+seen and moves or copies the remaining ones concurrently.
+"""
 import os
+import re
+import csv
 import glob
+import shutil
+import hashlib
 import logging
-from datetime import datetime
+from datetime import datetime, date
+from concurrent.futures import ThreadPoolExecutor
 from rich.console import Console
 from configs.config import config
+from modules import archive
 
 # Initialize the console for rich output
 console = Console()
@@ -54,3 +65,229 @@ def ingest_file():
         raise IOError(f"Failed to move and rename file: {e}") from e
 
     logging.info("Ingestion process completed.")
+
+# Date range in the export's file name, e.g. "... 2025-08-01-2025-08-20.csv"
+DATE_RANGE_PATTERN = re.compile(r"(\d{4})-(\d{2})-(\d{2})-(\d{4})-(\d{2})-(\d{2})")
+
+# Month and year at the end of an ingested or processed file name, e.g. "aktivitaetsbericht-08-2025.csv(.gz)"
+FILE_PERIOD_PATTERN = re.compile(r"(\d{1,2})-(\d{4})(?:\.\w+)+$")
+
+def file_hash(path):
+    """Return the SHA-256 hex digest of a file's (uncompressed) content."""
+    digest = hashlib.sha256()
+    with archive.open_binary(path) as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def parse_export_date(value):
+    """Parse a DD.MM.YY date of the activity export."""
+    day, month, year = value.strip().split(".")
+    return date(2000 + int(year) if len(year) == 2 else int(year), int(month), int(day))
+
+def export_date_range(path, from_name=True):
+    """Return the first and last date covered by an export, or None if it cannot be determined.
+
+    The range is taken from the file name when it contains one, otherwise from the "Datum" column.
+    """
+    match = DATE_RANGE_PATTERN.search(os.path.basename(path)) if from_name else None
+    if match:
+        numbers = [int(group) for group in match.groups()]
+        return date(*numbers[:3]), date(*numbers[3:])
+
+    try:
+        with archive.open_text(path, errors="replace") as csvfile:
+            reader = csv.reader(csvfile, delimiter=";")
+            header = [head.strip() for head in next(reader, [])]
+            if "Datum" not in header:
+                return None
+            index = header.index("Datum")
+            dates = [parse_export_date(row[index]) for row in reader if len(row) > index and row[index].strip()]
+    except (OSError, ValueError) as e:
+        logging.warning("Could not read the date range of '%s': %s", path, e)
+        return None
+
+    return (min(dates), max(dates)) if dates else None
+
+def target_file_name(date_range):
+    """Return the target file name for an export covering the given date range."""
+    start, _ = date_range
+    return config.output_filename_format.format(month=start.month, year=start.year)
+
+def file_period(path):
+    """Return the (year, month) in an ingested or processed file name (e.g. "...-08-2025.csv"), or None."""
+    match = FILE_PERIOD_PATTERN.search(os.path.basename(path))
+    if match and 1 <= int(match.group(1)) <= 12:
+        return int(match.group(2)), int(match.group(1))
+    return None
+
+# File in the target directory recording the content hash of every ingested export
+INGESTED_MANIFEST = ".ingested.sha256"
+
+def read_manifest(target_directory):
+    """Return the content hashes and file names recorded in the manifest of ingested exports."""
+    hashes, names = set(), set()
+    try:
+        with open(os.path.join(target_directory, INGESTED_MANIFEST), encoding="utf-8") as manifest:
+            for line in manifest:
+                digest, _, name = line.rstrip("\n").partition("  ")
+                hashes.add(digest)
+                names.add(name)
+    except FileNotFoundError:
+        pass
+    return hashes, names
+
+def record_ingested(target_directory, ingested):
+    """Add ingested files, given as (path, content hash) pairs, to the manifest."""
+    # Archived files keep the name of the plain file they were compressed from
+    lines = "".join(f"{digest}  {os.path.basename(archive.plain_path(path))}\n" for path, digest in ingested)
+    with open(os.path.join(target_directory, INGESTED_MANIFEST), "a", encoding="utf-8") as manifest:
+        manifest.write(lines)
+
+# Content hashes of source files by path, size and modification time, so rescans read a file once
+SOURCE_HASHES = {}
+
+def source_hash(path):
+    """Return the content hash of a source file, hashing it only when it changed since the last scan."""
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in SOURCE_HASHES:
+        SOURCE_HASHES[key] = file_hash(path)
+    return SOURCE_HASHES[key]
+
+def ingested_hashes(target_directory, max_workers=None):
+    """Return the content hashes of the ingested exports, as recorded at ingest time.
+
+    Files missing from the manifest (placed by hand, or ingested before it existed) are hashed once
+    and added, so only new files are ever read.
+    """
+    hashes, names = read_manifest(target_directory)
+    unrecorded = [path for path in archive.find(target_directory, "*.csv")
+                  if os.path.basename(archive.plain_path(path)) not in names]
+    if unrecorded:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            digests = list(executor.map(file_hash, unrecorded))
+        record_ingested(target_directory, zip(unrecorded, digests))
+        hashes.update(digests)
+    return hashes
+
+def plan_ingestion(source_files, target_directory, max_workers=None):
+    """Decide which exports to ingest under which name.
+
+    Returns a list of (source, target, content hash) entries and a mapping of skipped source files
+    to the reason. Exports with the same content as an earlier one or an already ingested file are
+    skipped; of several exports for the same month, the one reaching the latest date wins.
+    """
+    ingested = ingested_hashes(target_directory, max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        hashes = dict(zip(source_files, executor.map(source_hash, source_files)))
+        ranges = dict(zip(source_files, executor.map(export_date_range, source_files)))
+
+    skipped, seen, candidates = {}, set(), {}
+    for source in sorted(source_files):
+        if hashes[source] in ingested:
+            skipped[source] = "already ingested"
+        elif hashes[source] in seen:
+            skipped[source] = "duplicate"
+        elif ranges[source] is None:
+            skipped[source] = "no date range"
+        else:
+            seen.add(hashes[source])
+            target = os.path.join(target_directory, target_file_name(ranges[source]))
+            current = candidates.get(target)
+            if current is None or ranges[source][1] > ranges[current][1]:
+                if current is not None:
+                    skipped[current] = "superseded"
+                candidates[target] = source
+            else:
+                skipped[source] = "superseded"
+
+    # Never replace an ingested export with sessions later in the month than the candidate
+    for target, source in list(candidates.items()):
+        existing = export_date_range(target, from_name=False) if os.path.exists(target) else None
+        sessions = export_date_range(source, from_name=False)
+        if existing is not None and (sessions is None or existing[1] > sessions[1]):
+            skipped[source] = "superseded"
+            del candidates[target]
+
+    return [(source, target, hashes[source]) for target, source in candidates.items()], skipped
+
+def ensure_target_directory(target_directory):
+    """Create the target directory if it is missing and allowed by the configuration."""
+    if not os.path.exists(target_directory):
+        if config.auto_create_directories:
+            os.makedirs(target_directory, exist_ok=True)
+            logging.info("Created target directory: %s", target_directory)
+        else:
+            raise FileNotFoundError(f"Target directory does not exist: {target_directory}")
+
+def transfer_file(source, target, mode="move"):
+    """Move or copy a file, atomically replacing the target.
+
+    Moves within one filesystem are a rename; otherwise the content is copied with
+    ``shutil.copyfile``, which uses the kernel's zero-copy path where available.
+    """
+    same_filesystem = os.stat(source).st_dev == os.stat(os.path.dirname(target) or ".").st_dev
+    if mode == "move" and same_filesystem:
+        os.replace(source, target)
+        return target
+
+    partial_file = f"{target}.part"
+    try:
+        shutil.copyfile(source, partial_file)
+        shutil.copystat(source, partial_file)
+        os.replace(partial_file, target)
+    except Exception:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        raise
+
+    if mode == "move":
+        os.remove(source)
+    return target
+
+def ingest_all(mode=None, max_workers=None):
+    """Ingest every matching export at once.
+
+    Returns the ingested target files, the skipped source files with the reason and the failed
+    source files with the error.
+    """
+    console.print("📥 [green]Bulk ingestion selected.[/green]")
+    logging.info("Started bulk ingestion process.")
+
+    mode = mode or config.ingestion_transfer_mode
+    max_workers = max_workers or config.ingestion_workers
+    target_directory = config.target_directory
+    source_file_list = glob.glob(os.path.join(config.source_directory, config.source_file_pattern))
+
+    ensure_target_directory(target_directory)
+
+    if not source_file_list:
+        logging.error("No matching source file found!")
+        raise FileNotFoundError(f"No source file matching pattern '{config.source_file_pattern}' "
+                                f"found in {config.source_directory}.")
+
+    plan, skipped = plan_ingestion(source_file_list, target_directory, max_workers)
+    for source, reason in skipped.items():
+        logging.info("Skipped '%s': %s.", source, reason)
+
+    ingested, failures = [], {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(transfer_file, source, target, mode): (source, digest)
+                   for source, target, digest in plan}
+        for future, (source, digest) in futures.items():
+            try:
+                ingested.append((future.result(), digest))
+                logging.info("Ingested '%s' as '%s'.", source, ingested[-1][0])
+            except Exception as e:
+                failures[source] = str(e)
+                logging.error("Failed to ingest '%s': %s", source, e)
+
+    # The content moved unchanged, so the hashes of the plan apply to the ingested files
+    if ingested:
+        record_ingested(target_directory, ingested)
+    ingested = [target for target, _ in ingested]
+    console.print(f"📥 [green]Ingested {len(ingested)} exports, skipped {len(skipped)}, "
+                  f"{len(failures)} failed.[/green]")
+    logging.info("Bulk ingestion process completed.")
+    return sorted(ingested), skipped, failures
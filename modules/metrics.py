@@ -0,0 +1,188 @@
+"""This module records per-step metrics of the processing and generation pipeline.
+
+Every instrumented step records its wall time, the rows going in and out, how much the resident
+memory of the process changed over the step, the process' peak resident memory so far and, when
+``metrics.track_memory`` is set, the peak traced memory (tracemalloc) while the step ran. Tracing
+slows allocation-heavy steps such as ``doc.build`` down considerably, so it is off by default and
+the resident memory change is the per-step memory figure of a normal run. Records are appended as JSON lines to the metrics
+file in the logs directory; runs enabled with ``enable()`` (the ``--metrics`` flag) also keep them
+in memory to print a summary table at the end.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import tracemalloc
+from datetime import datetime
+from functools import wraps
+from rich.console import Console
+from rich.table import Table
+from configs.config import config
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+# Initialize the console for rich output
+console = Console()
+
+# Identifier of the current run, its settings (resolved on first use) and the records collected for its summary
+run_id = uuid.uuid4().hex[:12]
+run_settings = None
+records = []
+
+# Enabled at runtime (e.g. by the --metrics flag), in addition to the config switch
+_enabled_override = None
+
+def current_settings():
+    """Return the settings snapshot of the current run, resolving it on first use."""
+    global run_settings
+    if run_settings is None:
+        run_settings = config.snapshot()
+    return run_settings
+
+def enabled():
+    """Return whether metrics are collected."""
+    return current_settings().metrics_enabled if _enabled_override is None else _enabled_override
+
+def enable(value=True):
+    """Switch metrics collection on or off for this process (on also keeps the records for ``print_summary``)."""
+    global _enabled_override
+    _enabled_override = value
+
+def new_run(run=None, settings=None):
+    """Start a new run with a fresh run ID (or join ``run`` of another process) and no records.
+
+    The metrics settings are taken from ``settings``, or from a snapshot resolved on first use.
+    """
+    global run_id, run_settings
+    run_id = run or uuid.uuid4().hex[:12]
+    run_settings = settings
+    records.clear()
+    return run_id
+
+def count_rows(value):
+    """Return the number of data rows in a pipeline value, if it has any."""
+    if isinstance(value, dict):
+        if "frame" in value:
+            return len(value["frame"])
+        if "rows" in value:
+            return len(value["rows"])
+        return None
+    if hasattr(value, "_cellvalues"):
+        return len(value._cellvalues)
+    if hasattr(value, "__len__") and not isinstance(value, (str, bytes)):
+        return len(value)
+    return None
+
+def max_rss_mib():
+    """Return the peak resident set size of the process in MiB, if available."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return round(max_rss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+def rss_mib():
+    """Return the current resident set size of the process in MiB, or the peak where it cannot be read."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return max_rss_mib()
+
+def write_record(record):
+    """Append a record to the metrics file."""
+    settings = current_settings()
+    path = os.path.join(settings.logs_directory, settings.metrics_filename)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding="utf-8") as file:
+            file.write(json.dumps(record) + "\n")
+    except OSError as e:
+        logging.warning("Failed to write metrics record: %s", e)
+
+def measure(stage, step, func, *args, rows_in=None, **kwargs):
+    """Call ``func`` and record its metrics as ``stage``/``step`` when metrics are enabled."""
+    if not enabled():
+        return func(*args, **kwargs)
+
+    track_memory = current_settings().metrics_track_memory
+    started_tracing = False
+    if track_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+
+    if rows_in is None and args:
+        rows_in = count_rows(args[0])
+
+    rss_before = rss_mib()
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        wall_time = time.perf_counter() - start
+        peak = None
+        if track_memory:
+            peak = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+            if started_tracing:
+                tracemalloc.stop()
+
+    record = {
+        "run_id": run_id,
+        "timestamp": datetime.now().isoformat(timespec="milliseconds"),
+        "stage": stage,
+        "step": step,
+        "wall_s": round(wall_time, 6),
+        "rows_in": rows_in,
+        "rows_out": count_rows(result),
+        "rss_delta_mib": None if rss_before is None else round(rss_mib() - rss_before, 1),
+        "peak_mib": None if peak is None else round(peak / 2**20, 3),
+        "max_rss_mib": max_rss_mib(),
+    }
+    # Only a run enabled at runtime prints a summary; long-running modes just write the records out
+    if _enabled_override:
+        records.append(record)
+    write_record(record)
+    return result
+
+def instrument(stage, step=None):
+    """Decorator recording the metrics of every call of a function."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return measure(stage, step or func.__name__, func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def print_summary(run=None):
+    """Print the metrics of a run as a table."""
+    run = run or run_id
+    table = Table(title=f"Pipeline metrics (run {run})")
+    table.add_column("Stage", style="cyan")
+    table.add_column("Step", style="white")
+    table.add_column("Wall (s)", justify="right")
+    table.add_column("Rows in", justify="right")
+    table.add_column("Rows out", justify="right")
+    table.add_column("RSS change (MiB)", justify="right")
+    table.add_column("Peak (MiB)", justify="right")
+    table.add_column("Max RSS (MiB)", justify="right")
+
+    run_records = [record for record in records if record["run_id"] == run]
+    for record in run_records:
+        table.add_row(record["stage"], record["step"], f"{record['wall_s']:.3f}",
+                      "" if record["rows_in"] is None else str(record["rows_in"]),
+                      "" if record["rows_out"] is None else str(record["rows_out"]),
+                      "" if record["rss_delta_mib"] is None else f"{record['rss_delta_mib']:+.1f}",
+                      "" if record["peak_mib"] is None else f"{record['peak_mib']:.1f}",
+                      "" if record["max_rss_mib"] is None else f"{record['max_rss_mib']:.1f}")
+    table.add_row("", "total", f"{sum(record['wall_s'] for record in run_records):.3f}", "", "", "", "", "",
+                  style="bold")
+    console.print(table)
@@ -0,0 +1,57 @@
+"""This module runs the complete Rechenmeister pipeline non-interactively.
+
+Ingestion, processing and generation are chained in one process. The processed data is handed
+to the PDF builder in memory; the processed CSV is only written when requested, the history
+store is filled either way.
+"""
+import logging
+from rich.console import Console
+from configs.config import config
+from modules.ingestion import ingest_file
+from modules import processing, generation
+
+# Initialize the console for rich output
+console = Console()
+
+def run_pipeline(ingest=True, write_csv=False, input_file=None):
+    """Run ingestion, processing and PDF generation in one go and return the PDF path."""
+    logging.info("Started headless pipeline run.")
+
+    if ingest and input_file is None:
+        try:
+            ingest_file()
+        except FileNotFoundError as fnf_err:
+            # No new export downloaded: bill the one already ingested
+            logging.warning("Skipping ingestion: %s", fnf_err)
+            console.print(f"[yellow]Skipping ingestion: {fnf_err}[/yellow]")
+
+    input_file = input_file or processing.discover_input_file()
+
+    # Streaming and incremental mode work on files, so they keep the CSV handoff
+    settings = config.snapshot()
+    output_file = None
+    if settings.streaming or settings.incremental:
+        output_file = processing.process_file(input_file=input_file, settings=settings)
+        pdf_path = generation.generate_invoice(csv_path=output_file, source=input_file, settings=settings)
+    else:
+        data = processing.transform_data(processing.load_and_validate_csv(input_file, settings=settings))
+        if write_csv:
+            output_file = processing.save_processed_data(data, input_file)
+            console.print(f"🛠 [green]Processed data written to {output_file}.[/green]")
+        elif settings.history_enabled:
+            # The month is recorded in the history store whether or not the CSV is written
+            processing.save_history(data, input_file)
+        pdf_path = generation.generate_invoice(data, source=input_file)
+
+    from modules.archive import archive_after_run
+    archive_after_run([input_file] + ([output_file] if output_file else []), settings)
+
+    logging.info("Headless pipeline run completed: %s", pdf_path)
+    return pdf_path
+
+def warm_worker():
+    """Import the stage modules once per worker process, so the first export or job is not a cold start."""
+    from modules import columnar  # imports pandas, generation already imported reportlab
+
+    for module in (processing, columnar, generation):
+        module.console.quiet = True
@@ -2,34 +2,56 @@
 import os
 import glob
 import logging
-import pandas as pd
 import csv
 from rich.console import Console
 from configs.config import config
+from modules import metrics, archive
+from modules.records import (SessionRecord, time_to_minutes, final_rate_cents, amount_cents,
+                             format_record, format_summary_row)
 
 # Initialize the console for rich output
 console = Console()
 
-def discover_input_file():
-    """Find and return the path to the input CSV file."""
-    input_folder = "input_csv"
+# Sessions with these statuses are never billed
+EXCLUDED_STATUSES = ("Storniert", "Abgesagt")
+
+# Subdirectory of the processing output directory holding the per-trainer files of the fan-out
+TRAINER_DIRECTORY = "trainers"
+
+def by_period(paths):
+    """Sort files by the month in their names (oldest first), then by name."""
+    from modules.ingestion import file_period
+    return sorted(paths, key=lambda path: (file_period(path) or (0, 0), path))
+
+def discover_input_files(input_folder="input_csv", include_archived=False):
+    """Find and return the paths of all (pending, or also archived) input CSV files, oldest month first."""
     input_file_pattern = "aktivitaetsbericht-*.csv"
-    input_file_list = glob.glob(os.path.join(input_folder, input_file_pattern))
+    if include_archived:
+        input_file_list = by_period(archive.find(input_folder, input_file_pattern))
+    else:
+        input_file_list = by_period(glob.glob(os.path.join(input_folder, input_file_pattern)))
 
     if not input_file_list:
-        logging.error("No valid input CSV file found in 'input_csv' directory.")
-        raise FileNotFoundError("No valid input CSV file found in 'input_csv' directory.")
+        logging.error("No valid input CSV file found in '%s' directory.", input_folder)
+        raise FileNotFoundError(f"No valid input CSV file found in '{input_folder}' directory.")
+    return input_file_list
 
-    input_file = input_file_list[0]
+def discover_input_file():
+    """Find and return the path to the input CSV file (the latest month if there are several)."""
+    input_file_list = discover_input_files(include_archived=True)
+    input_file = input_file_list[-1]
+    if len(input_file_list) > 1:
+        logging.warning("Found %d input files, using the latest month '%s'; use batch mode to process all.",
+                        len(input_file_list), input_file)
+        console.print(f"[yellow]Found {len(input_file_list)} input files, using {input_file}. "
+                      "Use batch mode to process all of them.[/yellow]")
     logging.info("Using input file: %s", input_file)
     return input_file
 
-def load_and_validate_csv(input_file):
-    """Load CSV data and validate required columns are present."""
-    # Read the CSV file as a DataFrame for validation
-    dataframe = pd.read_csv(input_file, delimiter=";")
+def validate_columns(fieldnames):
+    """Validate that all required columns are present in the header."""
     required_cols = ["Datum", "Name", "Trainer"]
-    missing_cols = [col for col in required_cols if col not in dataframe.columns]
+    missing_cols = [col for col in required_cols if col not in fieldnames]
 
     if not missing_cols:
         logging.info("All required columns are present in the input file.")
@@ -39,203 +61,311 @@ def load_and_validate_csv(input_file):
         console.print(f"[bold red]Error:[/bold red] Missing required columns: {', '.join(missing_cols)}")
         raise ValueError(f"Missing required columns in the input file: {', '.join(missing_cols)}")
 
-    # Load the actual data using csv.DictReader
-    with open(input_file, newline='', encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=";")
-        if reader.fieldnames is None:
-            raise ValueError("Input CSV file is empty or missing header row.")
-
-        fieldnames = [head.strip() for head in reader.fieldnames]
-        filtered_rows = [row for row in reader
-                        if row.get("Status") not in ("Storniert", "Abgesagt")
-                        and row.get("Trainer") == "Victoria"]
-
-    if not filtered_rows:
+def validate_rows(rows, fieldnames, input_file, trainer, settings, report_directory=None):
+    """Check the export rows of the row-based engine against the schema and return the valid ones."""
+    import pandas as pd
+    from modules import validation
+
+    frame = pd.DataFrame(rows, columns=rows[0].keys() if rows else fieldnames, dtype=object).fillna("")
+    frame.columns = [str(column).strip() for column in frame.columns]
+    valid = validation.validate_export(frame, fieldnames, input_file, settings, (trainer,),
+                                       EXCLUDED_STATUSES, report_directory)
+    return [rows[index] for index in valid.index]
+
+@metrics.instrument("processing")
+def load_and_validate_csv(input_file, engine=None, trainer=None, settings=None, report_directory=None):
+    """Load CSV data, validate required columns are present and check the sessions against the schema.
+
+    The settings snapshot of the run (resolved here unless passed in) travels with the data.
+    Problems are reported in ``report_directory`` (default: the processing output directory).
+    """
+    settings = settings or config.snapshot()
+    engine = engine or settings.processing_engine
+    trainer = trainer or settings.trainer
+
+    if engine == "columnar":
+        from modules import columnar, validation
+
+        # Parse the file once into typed columns
+        fieldnames, frame = columnar.read_export(input_file)
+        validate_columns(fieldnames)
+        frame = validation.validate_export(frame, fieldnames, input_file, settings, (trainer,),
+                                           EXCLUDED_STATUSES, report_directory)
+        frame = columnar.filter_sessions(frame, EXCLUDED_STATUSES, trainer)
+        data = {"fieldnames": fieldnames, "frame": frame, "settings": settings}
+        row_count = len(frame)
+    else:
+        # Load the actual data using csv.DictReader
+        with archive.open_text(input_file) as csvfile:
+            reader = csv.DictReader(csvfile, delimiter=";")
+            if reader.fieldnames is None:
+                raise ValueError("Input CSV file is empty or missing header row.")
+
+            fieldnames = [head.strip() for head in reader.fieldnames]
+            validate_columns(fieldnames)
+            rows = validate_rows(list(reader), fieldnames, input_file, trainer, settings, report_directory)
+            filtered_rows = [SessionRecord(row) for row in rows
+                            if row.get("Status") not in EXCLUDED_STATUSES
+                            and row.get("Trainer") == trainer]
+        data = {"fieldnames": fieldnames, "rows": filtered_rows, "settings": settings}
+        row_count = len(filtered_rows)
+
+    if not row_count:
         logging.error("No valid classes found in the input file after filtering.")
         console.print("[bold red]Error:[/bold red] No valid classes found in the input file after filtering.")
         raise ValueError("No valid classes found in the input file after filtering.")
 
-    logging.info("Loaded %d valid classes for processing.", len(filtered_rows))
-    return {"fieldnames": fieldnames, "rows": filtered_rows}
-
-def time_to_decimal(time_str):
-    """Helper function to convert time in HH:MM format to decimal hours."""
-    hours, minutes = map(int, time_str.split(":"))
-    return hours + minutes / 60
+    logging.info("Loaded %d valid classes for processing.", row_count)
+    return data
 
 def add_duration_calculations(data):
-    """Add duration calculations in hours to each row."""
+    """Add the class duration in minutes to each row."""
     console.print("⚙️ [yellow]Calculating class durations...[/yellow]")
 
-    for row in data["rows"]:
-        start_time = time_to_decimal(row["Startzeit"])
-        end_time = time_to_decimal(row["Endzeit"])
-        duration = end_time - start_time
-        row["Dauer-in-Stunden"] = f"{duration:.1f}"
+    for record in data["rows"]:
+        record.minutes = time_to_minutes(record.raw["Endzeit"]) - time_to_minutes(record.raw["Startzeit"])
 
     return data
 
 def add_base_rates(data):
-    """Add base hourly rates to each row."""
+    """Add base hourly rates (in cents) to each row."""
+    from modules.tariff import current_tariff
+
     console.print("⚙️ [yellow]Applying base hourly rates...[/yellow]")
 
-    for row in data["rows"]:
-        row["Stundensatz-Basis"] = config.base_hourly_rate
+    tariff = current_tariff(data["settings"])
+    for record in data["rows"]:
+        record.base_rate_cents = tariff.base_rate_cents(record.get("Trainer", ""), record.get("Name", ""))
 
     return data
 
 def add_attendance_metrics(data):
-    """Calculate and add attendance rate (registration rate) to each row."""
+    """Add registrations and capacity, which make up the attendance rate, to each row."""
     console.print("⚙️ [yellow]Calculating attendance metrics...[/yellow]")
 
-    for row in data["rows"]:
-        registered = int(row.get("Angemeldet", "0"))
-        max_participants = int(row.get("Max. Teilnehmer", "8"))
-        registration_rate = registered / max_participants
-        row["Anmeldequote"] = f"{(registration_rate * 100):.1f}%"
+    for record in data["rows"]:
+        record.registered = int(record.get("Angemeldet", "0"))
+        record.capacity = int(record.get("Max. Teilnehmer", "8"))
+        if not record.capacity:
+            raise ValueError(f"Invalid 'Max. Teilnehmer' of 0 for class on {record.get('Datum')}.")
 
     return data
 
 def apply_bonus_factors(data):
     """Apply bonus factors based on attendance rates."""
+    from modules.tariff import current_tariff
+
     console.print("⚙️ [yellow]Applying bonus factors...[/yellow]")
 
-    for row in data["rows"]:
-        if row["Anmeldequote"] == "100.0%":
-            row["Bonus-Faktor"] = 2.0
-        elif row["Anmeldequote"] == "50.0%":
-            row["Bonus-Faktor"] = 1.5
-        else:
-            row["Bonus-Faktor"] = 1.0
+    tariff = current_tariff(data["settings"])
+    for record in data["rows"]:
+        record.bonus_permille = tariff.bonus_permille(record.registered, record.capacity)
 
     return data
 
 def calculate_final_amounts(data):
-    """Calculate final hourly rates and total amounts."""
+    """Calculate final hourly rates and total amounts in cents."""
+    from modules.tariff import current_tariff, weekday
+
     console.print("⚙️ [yellow]Calculating final payment amounts...[/yellow]")
 
-    for row in data["rows"]:
-        # Final hourly rate with bonus
-        final_rate = float(row['Stundensatz-Basis']) * float(row['Bonus-Faktor'])
-        row["Stundensatz-Final"] = f"{final_rate:.2f}"
+    tariff = current_tariff(data["settings"])
+    for record in data["rows"]:
+        # Final hourly rate with bonus and surcharges
+        if tariff.has_surcharges:
+            record.final_rate_cents = tariff.final_rate_cents(
+                record.base_rate_cents, record.bonus_permille,
+                weekday(record.raw["Datum"]), time_to_minutes(record.raw["Startzeit"]))
+        else:
+            record.final_rate_cents = final_rate_cents(record.base_rate_cents, record.bonus_permille)
 
         # Total payment for this class
-        total_amount = final_rate * float(row['Dauer-in-Stunden'])
-        row["Stundenbetrag"] = f"{total_amount:.2f}"
+        record.amount_cents = amount_cents(record.final_rate_cents, record.minutes)
 
     return data
 
 def add_summary_row(data):
-    """Add a summary row with totals."""
+    """Add the totals for the summary row."""
     console.print("⚙️ [yellow]Adding summary totals...[/yellow]")
 
-    # Calculate totals
-    total_hours = sum(float(row["Dauer-in-Stunden"]) for row in data["rows"])
-    total_payment = sum(float(row["Stundensatz-Final"]) * float(row["Dauer-in-Stunden"])
-                       for row in data["rows"])
-
-    # Create summary row
-    summary_row = {key: "" for key in data["fieldnames"]}
-    summary_row["Datum"] = "Gesamt (Monat)"
-    summary_row["Dauer-in-Stunden"] = f"{total_hours:.1f}"
-    summary_row["Stundenbetrag"] = f"{total_payment:.2f}"
-
-    data["summary_row"] = summary_row
+    data["totals"] = {
+        "minutes": sum(record.minutes for record in data["rows"]),
+        "amount_cents": sum(record.amount_cents for record in data["rows"]),
+    }
     return data
 
 def prepare_fieldnames(data):
     """Ensure all extra fields are included in fieldnames."""
-    for field in config.extra_fields:
+    for field in data["settings"].extra_fields:
         if field not in data["fieldnames"]:
             data["fieldnames"].append(field)
 
-    # Ensure all rows have all fieldnames
-    for row in data["rows"]:
-        for key in data["fieldnames"]:
-            if key not in row:
-                row[key] = None
-
     return data
 
-def excel_friendly(value):
-    """Convert a value to a format suitable for Excel (dots to commas)."""
-    if isinstance(value, str) and "." in value:
-        return value.replace(".", ",")
-    return value
-
 def format_for_excel(data):
-    """Convert decimal points to commas for Excel compatibility."""
+    """Select the decimal separator the output writers use (a comma for Excel compatibility)."""
     console.print("⚙️ [yellow]Formatting for Excel compatibility...[/yellow]")
 
-    numeric_columns = ["Dauer-in-Stunden", "Stundensatz-Basis", "Bonus-Faktor", 
-                       "Stundensatz-Final", "Stundenbetrag"]
-
-    # Format data rows
-    for row in data["rows"]:
-        for col in numeric_columns:
-            if col in row:
-                row[col] = excel_friendly(str(row[col]))
-
-    # Format summary row
-    for col in ["Dauer-in-Stunden", "Stundenbetrag"]:
-        if col in data["summary_row"]:
-            data["summary_row"][col] = excel_friendly(str(data["summary_row"][col]))
-
+    data["decimal_separator"] = "," if data["settings"].excel_friendly_format else "."
     return data
 
-def save_processed_data(data, input_file):
-    """Save processed data to output CSV file."""
-    output_folder = config.processing_output_directory or "output_csv"
-    os.makedirs(output_folder, exist_ok=True)
-    output_file = os.path.join(output_folder, f"processed-{os.path.basename(input_file)}")
+def output_rows(data):
+    """Yield the formatted output rows of the row-based engine, in fieldname order."""
+    separator = data.get("decimal_separator", ".")
+    fieldnames = data["fieldnames"]
+    for record in data["rows"]:
+        row = dict(record.raw)
+        row.update(format_record(record, separator))
+        yield [row.get(key, "") for key in fieldnames]
+
+def summary_row(data):
+    """Return the formatted summary row."""
+    return format_summary_row(data["fieldnames"], data["totals"], data.get("decimal_separator", "."))
+
+def write_processed(data, csvfile):
+    """Write header, data rows and summary row of processed data to an open CSV file."""
+    if "frame" in data:
+        from modules import columnar
+        columnar.write_rows(data, csvfile)
+        return
+
+    writer = csv.writer(csvfile, delimiter=";")
+    writer.writerow(data["fieldnames"])
+    writer.writerows(output_rows(data))
+    summary = summary_row(data)
+    writer.writerow([summary.get(key, "") for key in data["fieldnames"]])
+
+@metrics.instrument("processing")
+def save_processed_data(data, input_file, output_name=None):
+    """Save processed data to output CSV file, as configured in the settings of its run."""
+    settings = data["settings"]
+    output_folder = settings.processing_output_directory
+    output_name = output_name or f"processed-{os.path.basename(archive.plain_path(input_file))}"
+    output_file = os.path.join(output_folder, output_name)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
 
     try:
         with open(output_file, 'w', newline='', encoding="utf-8") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=data["fieldnames"], delimiter=";")
-            writer.writeheader()
-            writer.writerows(data["rows"])
-            writer.writerow(data["summary_row"])
+            write_processed(data, csvfile)
 
         logging.info("Processed data written to '%s'.", output_file)
-        return output_file
     except Exception as e:
         logging.error("Failed to write processed data to output file: %s", e)
         console.print(f"[bold red]Error:[/bold red] Failed to write processed data to output file: {e}")
         raise IOError(f"Failed to write processed data to output file: {e}") from e
 
+    if settings.xlsx_export:
+        save_workbook(data, output_file)
+    if settings.binary_sidecar:
+        save_sidecar(data, output_file)
+    if settings.history_enabled:
+        save_history(data, input_file)
+    return output_file
+
+def save_workbook(data, output_file):
+    """Write the processed data as an Excel workbook next to the processed CSV file."""
+    from modules import workbook
+
+    try:
+        return workbook.write_workbook(data, output_file)
+    except Exception as e:
+        logging.error("Failed to write workbook for '%s': %s", output_file, e)
+        console.print(f"[bold red]Error:[/bold red] Failed to write workbook for '{output_file}': {e}")
+        raise IOError(f"Failed to write workbook for '{output_file}': {e}") from e
+
+def save_sidecar(data, output_file):
+    """Write the binary sidecar of the processed data; the CSV file stays the fallback."""
+    from modules import sidecar
+
+    try:
+        sidecar.write_sidecar(data, output_file)
+    except Exception as e:
+        logging.warning("Failed to write binary sidecar for '%s': %s", output_file, e)
+
+def save_history(data, input_file, stage=None):
+    """Store the processed sessions of an export's month in the history database of its settings.
+
+    The processed CSV file stays authoritative. With ``stage`` the sessions of a streaming chunk
+    are only staged under that key until ``finish_history``. Returns whether the sessions were stored.
+    """
+    from modules import history
+
+    path = history.database_path(data["settings"])
+    try:
+        period = history.export_period(input_file, data)
+        if stage:
+            history.stage_sessions(data, period, stage, path)
+        else:
+            history.store_sessions(data, period, path)
+        return True
+    except Exception as e:
+        logging.warning("Failed to store '%s' in the history database: %s", input_file, e)
+        return False
+
+def finish_history(stage, settings, commit=True):
+    """Replace the stored months with the sessions staged by a streaming run, or drop them when it failed."""
+    from modules import history
+
+    path = history.database_path(settings)
+    try:
+        if commit:
+            history.commit_staged(stage, path)
+        else:
+            history.discard_staged(stage, path)
+    except Exception as e:
+        logging.warning("Failed to update '%s' in the history database: %s", stage, e)
+
+# Transformation steps of the row-based engine, in order
+TRANSFORMATIONS = [
+    add_duration_calculations,
+    add_base_rates,
+    add_attendance_metrics,
+    apply_bonus_factors,
+    calculate_final_amounts,
+    add_summary_row,
+    prepare_fieldnames,
+    format_for_excel,
+]
+
+def transformations_for(data):
+    """Return the transformation steps matching the engine that loaded the data."""
+    if "frame" in data:
+        from modules import columnar
+        return columnar.TRANSFORMATIONS
+    return TRANSFORMATIONS
+
 def transform_data(raw_data):
     """Apply all transformation steps to the raw data."""
-    transformations = [
-        add_duration_calculations,
-        add_base_rates,
-        add_attendance_metrics,
-        apply_bonus_factors,
-        calculate_final_amounts,
-        add_summary_row,
-        prepare_fieldnames,
-        format_for_excel,
-    ]
-
     data = raw_data
-    for transform in transformations:
-        data = transform(data)
+    for transform in transformations_for(raw_data):
+        data = metrics.measure("processing", transform.__name__, transform, data)
 
     return data
 
-def process_file():
+def process_file(streaming=None, input_file=None, settings=None):
     """Main orchestrator for the processing workflow."""
     console.print("🛠 [green]Processing selected.[/green]")
     console.print("🛠 [yellow]Processing...[/yellow]")
     logging.info("Started processing file.")
+    settings = settings or config.snapshot()
+    streaming = settings.streaming if streaming is None else streaming
 
     try:
-        input_file = discover_input_file()
-        raw_data = load_and_validate_csv(input_file)
-        processed_data = transform_data(raw_data)
-        output_file = save_processed_data(processed_data, input_file)
+        input_file = input_file or discover_input_file()
+        if settings.incremental:
+            from modules.incremental import process_incremental
+            output_file, _ = process_incremental(input_file, settings=settings)
+        elif streaming:
+            from modules.streaming import stream_process
+            output_file = stream_process(input_file, settings=settings)
+        else:
+            raw_data = load_and_validate_csv(input_file, settings=settings)
+            processed_data = transform_data(raw_data)
+            output_file = save_processed_data(processed_data, input_file)
 
         console.print(f"🛠 [green]Processing completed. Processed data written to {output_file}.[/green]")
         logging.info("Processing completed successfully.")
+        return output_file
     except Exception as e:
         logging.error("Processing failed: %s", e)
         raise
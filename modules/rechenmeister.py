@@ -1,22 +1,29 @@
 """This module provides a command-line interface for the Rechenmeister invoice automation system."""
 import os
+import sys
 import logging
+import argparse
+from datetime import date
 from rich.console import Console
 from rich.panel import Panel
 from rich.prompt import IntPrompt
 from rich.table import Table
 from rich import box
-from modules.ingestion import ingest_file
-from modules.processing import process_file
-from modules.generation import generate_invoice
 from configs.config import config
+from modules import audit
 
-# Configure logging
+# Stage modules are imported when their option is chosen, so the menu appears without
+# loading pandas, NumPy or reportlab
+
+# Configure logging: the action log and the structured audit log, both rotated by size under a file lock
 logging.basicConfig(
-    filename=os.path.join(config.logs_directory, config.log_filename),
+    handlers=[audit.LockedRotatingFileHandler(
+        os.path.join(config.logs_directory, config.log_filename), maxBytes=config.log_max_bytes,
+        backupCount=config.log_backup_count, encoding="utf-8")],
     level=getattr(logging, config.get('logging', 'level', 'INFO')),
     format='%(asctime)s %(levelname)s: %(message)s'
 )
+audit.install()
 
 # Initialize the console for rich output
 console = Console()
@@ -34,24 +41,154 @@ def main_menu():
     table.add_row("1", "📥 Ingestion (Move and rename source file)")
     table.add_row("2", "🛠  Processing (Extend the source file)")
     table.add_row("3", "🧾 Generation (Create PDF invoice)")
+    table.add_row("4", "👥 Fan-out (Process and invoice every trainer)")
+    table.add_row("5", "📦 Bulk ingestion (Move and rename every source file)")
+    table.add_row("6", "📜 Log inspection (Show the latest log records)")
+    table.add_row("7", "🗂  Batch processing (Process and invoice every pending export)")
+    table.add_row("8", "🗜  Archive (Compress used CSV files and apply the retention policy)")
     table.add_row("99", "🚪 Exit")
     console.print(table)
 
     # Prompt the user for their choice
-    choice = IntPrompt.ask("Choose an option", choices=["1", "2", "3", "99"])
+    choice = IntPrompt.ask("Choose an option", choices=["1", "2", "3", "4", "5", "6", "7", "8", "99"])
     return choice
 
-def main():
+def parse_args(argv=None):
+    """Parse the command-line arguments for the non-interactive commands."""
+    parser = argparse.ArgumentParser(prog="rechenmeister", description="Rechenmeister invoice automation.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="Run ingestion, processing and PDF generation without the menu.")
+    run_parser.add_argument("--input", dest="input_file", help="Process this export instead of ingesting one.")
+    run_parser.add_argument("--no-ingest", dest="ingest", action="store_false",
+                            help="Skip ingestion and use the export already in input_csv/.")
+    run_parser.add_argument("--write-csv", action="store_true",
+                            help="Also write the processed CSV to output_csv/.")
+    run_parser.add_argument("--metrics", action="store_true",
+                            help="Record per-step metrics and print a summary table.")
+
+    ingest_parser = subparsers.add_parser("ingest", help="Ingest every matching export at once.")
+    ingest_parser.add_argument("--copy", dest="mode", action="store_const", const="copy",
+                               help="Copy the exports instead of moving them.")
+    ingest_parser.add_argument("--workers", type=int, help="Number of concurrent transfers.")
+
+    batch_parser = subparsers.add_parser("batch", help="Process and invoice every export in input_csv/.")
+    batch_parser.add_argument("--workers", type=int, help="Number of worker processes.")
+
+    archive_parser = subparsers.add_parser("archive", help="Compress used CSV files and delete expired archives.")
+    archive_parser.add_argument("--codec", choices=["auto", "gzip", "xz", "zstd"], help="Compression codec.")
+    archive_parser.add_argument("--min-age-days", type=int, help="Only archive files not modified for this many days.")
+    archive_parser.add_argument("--retention-days", type=int, help="Delete archived files older than this many days.")
+
+    watch_parser = subparsers.add_parser("watch", help="Ingest, process and invoice new exports as they arrive.")
+    watch_parser.add_argument("--workers", type=int, help="Number of worker processes.")
+    watch_parser.add_argument("--backend", choices=["auto", "inotify", "polling"],
+                              help="How to watch the source directory.")
+
+    logs_parser = subparsers.add_parser("logs", help="Inspect the structured audit log.")
+    logs_parser.add_argument("--run", help="Only records of this run ID.")
+    logs_parser.add_argument("--from", dest="start", type=date.fromisoformat, help="First day (YYYY-MM-DD).")
+    logs_parser.add_argument("--to", dest="end", type=date.fromisoformat, help="Last day (YYYY-MM-DD).")
+    logs_parser.add_argument("--level", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+                             help="Only records of this level.")
+    logs_parser.add_argument("--tail", dest="count", type=int, default=20,
+                             help="Number of latest records to show without a filter.")
+    logs_parser.add_argument("--runs", dest="list_runs", action="store_true", help="List the logged runs.")
+
+    serve_parser = subparsers.add_parser("serve", help="Accept exports over HTTP and invoice them.")
+    serve_parser.add_argument("--host", help="Interface to listen on.")
+    serve_parser.add_argument("--port", type=int, help="Port to listen on.")
+    serve_parser.add_argument("--workers", type=int, help="Number of worker processes.")
+
+    history_parser = subparsers.add_parser("history", help="Report on the stored sessions of all processed months.")
+    history_parser.add_argument("report", choices=["totals", "hours", "bonus"])
+    history_parser.add_argument("--from", dest="start", type=date.fromisoformat, help="First date (YYYY-MM-DD).")
+    history_parser.add_argument("--to", dest="end", type=date.fromisoformat, help="Last date (YYYY-MM-DD).")
+    history_parser.add_argument("--by", dest="group_by", choices=["trainer", "class", "month", "day"],
+                                default="trainer", help="Group the report by trainer, class, month or day.")
+    history_parser.add_argument("--trainer", help="Only sessions of this trainer.")
+    history_parser.add_argument("--class", dest="class_name", help="Only sessions of this class.")
+
+    return parser.parse_args(argv)
+
+def run_command(args):
+    """Run a non-interactive command and return the process exit code."""
+    try:
+        if args.command == "run":
+            from modules import metrics
+            from modules.pipeline import run_pipeline
+            if args.metrics:
+                metrics.enable()
+            run_pipeline(ingest=args.ingest, write_csv=args.write_csv, input_file=args.input_file)
+            if args.metrics:
+                metrics.print_summary()
+        elif args.command == "ingest":
+            from modules.ingestion import ingest_all
+            _, _, failures = ingest_all(mode=args.mode, max_workers=args.workers)
+            return 1 if failures else 0
+        elif args.command == "batch":
+            from modules.batch import process_batch
+            _, failures = process_batch(max_workers=args.workers)
+            return 1 if failures else 0
+        elif args.command == "archive":
+            from modules.archive import archive_files
+            _, _, failures = archive_files(codec=args.codec, min_age_days=args.min_age_days,
+                                           retention_days=args.retention_days)
+            return 1 if failures else 0
+        elif args.command == "watch":
+            from modules.watcher import run_daemon
+            run_daemon(workers=args.workers, backend=args.backend)
+        elif args.command == "logs":
+            audit.inspect_logs(run=args.run, start=args.start, end=args.end, level=args.level,
+                               count=args.count, list_runs=args.list_runs)
+        elif args.command == "serve":
+            from modules.server import run_server
+            run_server(host=args.host, port=args.port, workers=args.workers)
+        elif args.command == "history":
+            from modules.history import print_report
+            print_report(args.report, start=args.start, end=args.end, group_by=args.group_by,
+                         trainer=args.trainer, class_name=args.class_name)
+        return 0
+    except Exception as e:
+        logging.error("Command '%s' failed: %s", args.command, e)
+        console.print(f"[bold red]Error:[/bold red] {e}")
+        return 1
+
+def main(argv=None):
     """The main function to run the Rechenmeister CLI."""
+    args = parse_args(argv)
+    if args.command:
+        sys.exit(run_command(args))
+
     while True:
         selection = main_menu()
+        # Every chosen option is a run of its own in the audit log
+        from modules import metrics
+        metrics.new_run()
         try:
             if selection == 1:
+                from modules.ingestion import ingest_file
                 ingest_file()
             elif selection == 2:
+                from modules.processing import process_file
                 process_file()
             elif selection == 3:
+                from modules.generation import generate_invoice
                 generate_invoice()
+            elif selection == 4:
+                from modules.fanout import process_all_trainers
+                process_all_trainers()
+            elif selection == 5:
+                from modules.ingestion import ingest_all
+                ingest_all()
+            elif selection == 6:
+                audit.inspect_logs()
+            elif selection == 7:
+                from modules.batch import process_batch
+                process_batch()
+            elif selection == 8:
+                from modules.archive import archive_files
+                archive_files()
             elif selection == 99:
                 console.print("👋 [bold blue]Goodbye![/bold blue]")
                 break
@@ -59,6 +196,9 @@ def main():
             console.print(f"[bold red]Error:[/bold red] {fnf_err}")
         except IOError as io_err:
             console.print(f"[bold red]File operation error:[/bold red] {io_err}")
+        except ValueError as value_err:
+            # Invalid exports stop the chosen option only; the message names the error report
+            console.print(f"[bold red]Invalid data:[/bold red] {value_err}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,98 @@
+"""This module defines the typed internal representation of billed sessions.
+
+Durations are kept as integer minutes and money as integer cents through the whole pipeline;
+bonus factors are kept in per mille. Values are only turned into strings by the output writers
+through the formatting helpers below, so no stage parses back what another stage formatted.
+"""
+
+# Billing columns computed by the transformations, in output order
+COMPUTED_FIELDS = ["Dauer-in-Stunden", "Stundensatz-Basis", "Anmeldequote", "Bonus-Faktor",
+                   "Stundensatz-Final", "Stundenbetrag"]
+
+# Billing columns written with the configured decimal separator
+NUMERIC_FIELDS = ["Dauer-in-Stunden", "Stundensatz-Basis", "Bonus-Faktor",
+                  "Stundensatz-Final", "Stundenbetrag"]
+
+# Typed billing values of a session, in storage order
+VALUE_NAMES = ["minutes", "base_rate_cents", "registered", "capacity", "bonus_permille",
+               "final_rate_cents", "amount_cents"]
+
+SUMMARY_LABEL = "Gesamt (Monat)"
+
+class SessionRecord:
+    """A billed session: the raw export row plus its typed billing values."""
+    __slots__ = ("raw", "minutes", "base_rate_cents", "registered", "capacity",
+                 "bonus_permille", "final_rate_cents", "amount_cents")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.minutes = None
+        self.base_rate_cents = None
+        self.registered = None
+        self.capacity = None
+        self.bonus_permille = None
+        self.final_rate_cents = None
+        self.amount_cents = None
+
+    def get(self, key, default=None):
+        """Return a raw export value, like ``dict.get`` on the export row."""
+        return self.raw.get(key, default)
+
+def time_to_minutes(time_str):
+    """Convert a time in HH:MM format to minutes after midnight."""
+    hours, minutes = map(int, time_str.split(":"))
+    return hours * 60 + minutes
+
+def to_cents(amount):
+    """Convert a configured amount in Euros to integer cents."""
+    return round(float(amount) * 100)
+
+def final_rate_cents(base_rate_cents, bonus_permille):
+    """Apply a bonus factor to an hourly rate, rounding half up to whole cents."""
+    return (base_rate_cents * bonus_permille + 500) // 1000
+
+def amount_cents(rate_cents, minutes):
+    """Return the payment for a duration at an hourly rate, rounding half up to whole cents."""
+    return (rate_cents * minutes + 30) // 60
+
+def format_hours(minutes, separator="."):
+    """Format minutes as decimal hours with one decimal place."""
+    return f"{minutes / 60:.1f}".replace(".", separator)
+
+def format_money(cents, separator="."):
+    """Format integer cents as an amount with two decimal places."""
+    sign = "-" if cents < 0 else ""
+    return f"{sign}{abs(cents) // 100}{separator}{abs(cents) % 100:02d}"
+
+def format_rate(cents, separator="."):
+    """Format the base hourly rate in whole euros where it has no cents (e.g. 20), otherwise like money (20.50)."""
+    if cents % 100 == 0:
+        return f"{cents // 100}"
+    return format_money(cents, separator)
+
+def format_bonus(permille, separator="."):
+    """Format a per-mille bonus factor as a decimal factor (e.g. 1.5)."""
+    return str(permille / 1000).replace(".", separator)
+
+def format_quote(registered, capacity):
+    """Format the registration rate as a percentage with one decimal place."""
+    return f"{registered / capacity * 100:.1f}%"
+
+def format_record(record, separator="."):
+    """Return the formatted billing columns of a session record."""
+    return {
+        "Dauer-in-Stunden": format_hours(record.minutes, separator),
+        "Stundensatz-Basis": format_rate(record.base_rate_cents, separator),
+        "Anmeldequote": format_quote(record.registered, record.capacity),
+        "Bonus-Faktor": format_bonus(record.bonus_permille, separator),
+        "Stundensatz-Final": format_money(record.final_rate_cents, separator),
+        "Stundenbetrag": format_money(record.amount_cents, separator),
+    }
+
+def format_summary_row(fieldnames, totals, separator="."):
+    """Return the formatted summary row for the given totals."""
+    summary_row = {key: "" for key in fieldnames}
+    summary_row["Datum"] = SUMMARY_LABEL
+    summary_row["Dauer-in-Stunden"] = format_hours(totals["minutes"], separator)
+    summary_row["Stundenbetrag"] = format_money(totals["amount_cents"], separator)
+    return summary_row
@@ -0,0 +1,298 @@
+"""This module provides the HTTP invoicing service of the Rechenmeister tool.
+
+Other tools submit an activity export with ``POST /jobs`` (the CSV file as request body,
+optionally ``?trainer=<name>``) and receive a job id. Jobs wait in a bounded queue and are
+processed by a fixed number of warm worker processes; when the queue is full, new uploads are
+refused with ``503`` until it drains. Clients poll ``GET /jobs/<id>`` for the status and download
+the results from ``GET /jobs/<id>/csv`` and ``GET /jobs/<id>/pdf``. Finished jobs and their files
+are removed once they are older than the configured time to live.
+"""
+import os
+import json
+import uuid
+import time
+import shutil
+import signal
+import asyncio
+import logging
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+from rich.console import Console
+from configs.config import config
+
+# Initialize the console for rich output
+console = Console()
+
+# Status line texts of the responses the service sends
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 411: "Length Required", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+# Downloadable results of a job, with their content type
+RESULTS = {"csv": "text/csv; charset=utf-8", "pdf": "application/pdf"}
+
+# Upper limit for the request line and headers
+MAX_HEADER_SIZE = 64 * 1024
+
+class HTTPError(Exception):
+    """An error answered with an HTTP status code."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def process_job(job_directory, trainer=None):
+    """Process the uploaded export of a job and render its invoice (runs in a worker process)."""
+    from modules import processing, generation, ingestion, metrics
+
+    # Every job is a run of its own in the audit log
+    metrics.new_run()
+    # Pick up edited settings (e.g. new rates) without restarting the service
+    config.reload_if_changed()
+    input_file = os.path.join(job_directory, "export.csv")
+    data = processing.transform_data(processing.load_and_validate_csv(input_file, trainer=trainer,
+                                                                      report_directory=job_directory))
+
+    csv_path = os.path.join(job_directory, "processed.csv")
+    with open(csv_path, 'w', newline='', encoding="utf-8") as csvfile:
+        processing.write_processed(data, csvfile)
+    if data["settings"].history_enabled:
+        processing.save_history(data, input_file)
+
+    date_range = ingestion.export_date_range(input_file, from_name=False)
+    month = date_range[0] if date_range else datetime.now()
+    title = f"Stundenabrechnung {month.month:02d}/{month.year} - {trainer or data['settings'].trainer}"
+    pdf_path = os.path.join(job_directory, "invoice.pdf")
+    generation.render_invoice(generation.invoice_frame(data, data["settings"].invoice_columns), pdf_path, title,
+                              settings=data["settings"])
+    return {"csv": csv_path, "pdf": pdf_path}
+
+def read_file(path):
+    """Return the content of a result file."""
+    with open(path, "rb") as file:
+        return file.read()
+
+async def read_request(reader, max_body):
+    """Read one HTTP request and return its method, path, query parameters and body."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.LimitOverrunError as e:
+        raise HTTPError(400, "Request header too large.") from e
+    except asyncio.IncompleteReadError as e:
+        raise ConnectionResetError("Connection closed before the request was complete.") from e
+
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = request_line.split(" ", 2)
+    except ValueError as e:
+        raise HTTPError(400, f"Malformed request line: {request_line!r}") from e
+    headers = {}
+    for line in header_lines:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    body = b""
+    if method == "POST":
+        if "content-length" not in headers:
+            raise HTTPError(411, "Uploads need a Content-Length header.")
+        length = int(headers["content-length"])
+        if length > max_body:
+            raise HTTPError(413, f"Uploads are limited to {max_body} bytes.")
+        body = await reader.readexactly(length)
+
+    url = urlsplit(target)
+    return method, url.path, parse_qs(url.query), body
+
+class InvoiceServer:
+    """Accept exports over HTTP and process them on a bounded pool of workers."""
+
+    def __init__(self, host=None, port=None, workers=None, queue_size=None, jobs_directory=None,
+                 max_upload_bytes=None, job_ttl_hours=None, handler=process_job, executor=None):
+        self.host = host or config.server_host
+        self.port = config.server_port if port is None else port
+        self.workers = workers or config.server_workers
+        self.jobs_directory = jobs_directory or config.server_jobs_directory
+        self.max_upload_bytes = max_upload_bytes or config.server_max_upload_mb * 1024 * 1024
+        self.job_ttl = (config.server_job_ttl_hours if job_ttl_hours is None else job_ttl_hours) * 3600
+        self.handler = handler
+        self.executor = executor
+        self.queue = asyncio.Queue(maxsize=queue_size or config.server_queue_size)
+        self.stop_event = asyncio.Event()
+        self.jobs = {}  # id -> job status
+        self.uploads = 0  # uploads being saved, each holding a reserved queue slot
+        self.server = None
+
+    def stop(self):
+        """Ask the service to finish the jobs in progress and exit."""
+        self.stop_event.set()
+
+    def job(self, job_id):
+        """Return the status of a job."""
+        if job_id not in self.jobs:
+            raise HTTPError(404, f"Unknown job '{job_id}'.")
+        return self.jobs[job_id]
+
+    async def submit(self, body, trainer=None):
+        """Store an uploaded export and queue it, returning the new job."""
+        if not body.strip():
+            raise HTTPError(400, "The uploaded export is empty.")
+        await self.evict()
+        if self.queue.qsize() + self.uploads >= self.queue.maxsize:
+            raise HTTPError(503, "Too many jobs waiting, try again later.")
+
+        job_id = uuid.uuid4().hex
+        job_directory = os.path.join(self.jobs_directory, job_id)
+        # Reserve the queue slot before saving, so uploads arriving meanwhile cannot take it
+        self.uploads += 1
+        try:
+            await asyncio.to_thread(self.save_upload, job_directory, body)
+        except Exception:
+            shutil.rmtree(job_directory, ignore_errors=True)
+            raise
+        finally:
+            self.uploads -= 1
+        job = {"id": job_id, "status": "queued", "trainer": trainer, "error": None,
+               "submitted": datetime.now().isoformat(timespec="seconds"), "finished": None, "results": {}}
+        self.jobs[job_id] = job
+        self.queue.put_nowait((job_id, job_directory))
+        logging.info("Queued job %s (%d bytes).", job_id, len(body))
+        return job
+
+    async def evict(self):
+        """Forget the finished jobs older than the time to live and remove their files."""
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job["finished"] is not None and now - job["finished"] > self.job_ttl]
+        # Forgotten before the first await, so concurrent uploads never evict the same job twice
+        for job_id in expired:
+            del self.jobs[job_id]
+        for job_id in expired:
+            await asyncio.to_thread(shutil.rmtree, os.path.join(self.jobs_directory, job_id), ignore_errors=True)
+        if expired:
+            logging.info("Removed %d expired jobs.", len(expired))
+
+    def remove_stale_directories(self):
+        """Remove the job directories left behind by an earlier run once they are older than the time to live."""
+        now = time.time()
+        for entry in os.scandir(self.jobs_directory):
+            if entry.is_dir() and entry.name not in self.jobs and now - entry.stat().st_mtime > self.job_ttl:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    @staticmethod
+    def save_upload(job_directory, body):
+        """Write an uploaded export into its job directory."""
+        os.makedirs(job_directory, exist_ok=True)
+        with open(os.path.join(job_directory, "export.csv"), "wb") as export:
+            export.write(body)
+
+    async def work(self, executor):
+        """Hand queued jobs to the executor, one at a time per worker."""
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id, job_directory = await self.queue.get()
+            job = self.jobs[job_id]
+            job["status"] = "running"
+            try:
+                job["results"] = await loop.run_in_executor(executor, self.handler, job_directory, job["trainer"])
+                job["status"] = "done"
+                logging.info("Job %s done.", job_id)
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+                logging.error("Job %s failed: %s", job_id, e)
+            finally:
+                job["finished"] = time.time()
+                self.queue.task_done()
+
+    def status_document(self, job):
+        """Return the public status document of a job."""
+        document = {key: job[key] for key in ("id", "status", "trainer", "error", "submitted")}
+        document["results"] = {name: f"/jobs/{job['id']}/{name}" for name in job["results"]}
+        return document
+
+    async def route(self, method, path, query, body):
+        """Answer a request, returning the status, content type, body and extra headers."""
+        parts = [part for part in path.split("/") if part]
+        if parts == ["health"] and method == "GET":
+            return 200, "application/json", {"status": "ok", "queued": self.queue.qsize()}, {}
+        if parts == ["jobs"] and method == "POST":
+            trainer = query.get("trainer", [None])[0]
+            return 202, "application/json", self.status_document(await self.submit(body, trainer)), {}
+        if len(parts) == 2 and parts[0] == "jobs" and method == "GET":
+            return 200, "application/json", self.status_document(self.job(parts[1])), {}
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] in RESULTS and method == "GET":
+            job = self.job(parts[1])
+            if job["status"] != "done":
+                raise HTTPError(409, f"Job '{job['id']}' is {job['status']}.")
+            result = job["results"][parts[2]]
+            content = await asyncio.to_thread(read_file, result)
+            disposition = {"Content-Disposition": f'attachment; filename="{os.path.basename(result)}"'}
+            return 200, RESULTS[parts[2]], content, disposition
+        if parts and parts[0] in ("jobs", "health"):
+            raise HTTPError(405, f"{method} is not supported for {path}.")
+        raise HTTPError(404, f"No such resource: {path}")
+
+    async def handle(self, reader, writer):
+        """Serve one connection (one request per connection)."""
+        try:
+            try:
+                method, path, query, body = await read_request(reader, self.max_upload_bytes)
+                status, content_type, content, headers = await self.route(method, path, query, body)
+            except HTTPError as e:
+                status, content_type, content, headers = e.status, "application/json", {"error": str(e)}, {}
+            except ValueError as e:
+                status, content_type, content, headers = 400, "application/json", {"error": str(e)}, {}
+
+            if content_type == "application/json":
+                content = json.dumps(content).encode("utf-8")
+            head = [f"HTTP/1.1 {status} {REASONS[status]}", f"Content-Type: {content_type}",
+                    f"Content-Length: {len(content)}", "Connection: close"]
+            head += [f"{name}: {value}" for name, value in headers.items()]
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + content)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logging.warning("Connection dropped: %s", e)
+        finally:
+            writer.close()
+
+    async def run(self):
+        """Serve requests until stopped, then finish the queued jobs."""
+        from modules.pipeline import warm_worker
+
+        os.makedirs(self.jobs_directory, exist_ok=True)
+        await asyncio.to_thread(self.remove_stale_directories)
+        executor = self.executor or ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker)
+        workers = [asyncio.create_task(self.work(executor)) for _ in range(self.workers)]
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=MAX_HEADER_SIZE)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info("Serving on %s:%d (%d workers).", self.host, self.port, self.workers)
+        console.print(f"🌐 [green]Serving on http://{self.host}:{self.port} ({self.workers} workers)...[/green]")
+        try:
+            async with self.server:
+                await self.stop_event.wait()
+                self.server.close()
+            await self.queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if self.executor is None:
+                executor.shutdown(wait=True)
+
+        logging.info("Invoicing service stopped after %d jobs.", len(self.jobs))
+        return self.jobs
+
+def run_server(**options):
+    """Run the invoicing service until SIGINT or SIGTERM."""
+    async def main():
+        server = InvoiceServer(**options)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, server.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+        return await server.run()
+
+    return asyncio.run(main())
@@ -0,0 +1,129 @@
+"""This module writes and loads the binary columnar sidecar of a processed CSV file.
+
+Next to every ``processed-*.csv`` a ``.sidecar`` directory stores the same month in typed form,
+one ``.npy`` file per array: the billing values as integer arrays (minutes, cents, per mille),
+every raw export column dictionary-encoded as integer codes plus its distinct values, the totals
+and the decimal separator. Integer arrays are stored in the smallest dtype that holds their values.
+
+Loading maps the value and code arrays into memory instead of reading them, hands the values over
+in their stored dtype and the raw columns as categoricals over their codes, so a load costs the
+same for any number of sessions until the data is actually used. The sidecar records the size
+and modification time of the CSV it belongs to and is ignored (and the CSV used) when the CSV
+changed since.
+"""
+import os
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+from modules import metrics
+from modules.records import COMPUTED_FIELDS, VALUE_NAMES
+
+# Bump when the array layout changes; sidecars of other versions are ignored
+FORMAT_VERSION = 2
+
+def sidecar_path(csv_path):
+    """Return the path of the sidecar directory belonging to a processed CSV file."""
+    return f"{os.path.splitext(csv_path)[0]}.sidecar"
+
+def remove_sidecar(csv_path):
+    """Remove the sidecar of a processed CSV file, including one of the earlier single-file format."""
+    shutil.rmtree(sidecar_path(csv_path), ignore_errors=True)
+    legacy_path = f"{os.path.splitext(csv_path)[0]}.npz"
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+def csv_stamp(csv_path):
+    """Return the size and modification time identifying the current CSV content."""
+    stat = os.stat(csv_path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+def compact(array):
+    """Return an integer array in the smallest dtype holding all of its values."""
+    if not len(array):
+        return array.astype(np.int8)
+    return array.astype(np.promote_types(np.min_scalar_type(int(array.min())),
+                                         np.min_scalar_type(int(array.max()))))
+
+def raw_columns(data):
+    """Return the raw (not computed) output columns of processed data."""
+    columns = [key for key in data["fieldnames"] if key not in COMPUTED_FIELDS]
+    if "frame" in data:
+        frame = data["frame"]
+        return {key: frame[key] if key in frame.columns else pd.Series("", index=frame.index, dtype=object)
+                for key in columns}
+    return {key: pd.Series([record.get(key) or "" for record in data["rows"]], dtype=object) for key in columns}
+
+def typed_values(data):
+    """Return the typed billing values of processed data as integer arrays."""
+    if "frame" in data:
+        return {name: np.asarray(data["values"][name], dtype=np.int64) for name in VALUE_NAMES}
+    return {name: np.fromiter((getattr(record, name) for record in data["rows"]), dtype=np.int64,
+                              count=len(data["rows"]))
+            for name in VALUE_NAMES}
+
+def write_sidecar(data, csv_path):
+    """Write the sidecar of processed data next to its (already written) CSV file."""
+    columns = raw_columns(data)
+    arrays = {
+        "version": np.array(FORMAT_VERSION),
+        "csv_stamp": csv_stamp(csv_path),
+        "fieldnames": np.array(data["fieldnames"], dtype=str),
+        "columns": np.array(list(columns), dtype=str),
+        "separator": np.array(data.get("decimal_separator", ".")),
+        "totals": np.array([data["totals"]["minutes"], data["totals"]["amount_cents"]], dtype=np.int64),
+    }
+    for name, array in typed_values(data).items():
+        arrays[f"value_{name}"] = compact(array)
+    for index, values in enumerate(columns.values()):
+        # Exports are parsed without NA detection, so every value gets a code
+        codes, uniques = pd.factorize(values)
+        arrays[f"codes_{index}"] = compact(codes)
+        arrays[f"uniques_{index}"] = np.array(uniques.tolist(), dtype=str)
+
+    path = sidecar_path(csv_path)
+    partial_path = f"{path}.part"
+    shutil.rmtree(partial_path, ignore_errors=True)
+    os.makedirs(partial_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(partial_path, f"{name}.npy"), array, allow_pickle=False)
+    # A directory cannot replace another one, readers fall back to the CSV while it is missing
+    remove_sidecar(csv_path)
+    os.rename(partial_path, path)
+    logging.info("Binary sidecar written to '%s'.", path)
+    return path
+
+@metrics.instrument("generation")
+def load_sidecar(csv_path):
+    """Load the processed data of a CSV file from its sidecar, or None if there is no current one."""
+    path = sidecar_path(csv_path)
+    if not os.path.exists(path) or not os.path.exists(csv_path):
+        return None
+
+    def array(name, mmap_mode=None):
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+
+    try:
+        if int(array("version")) != FORMAT_VERSION or not np.array_equal(array("csv_stamp"), csv_stamp(csv_path)):
+            logging.info("Sidecar '%s' is outdated, using the CSV file.", path)
+            return None
+
+        # The raw columns stay dictionary-encoded, over the mapped codes
+        frame = pd.DataFrame({
+            column: pd.Categorical.from_codes(array(f"codes_{index}", "r"), array(f"uniques_{index}").tolist())
+            for index, column in enumerate(array("columns").tolist())
+        })
+        totals = array("totals").tolist()
+        data = {
+            "fieldnames": array("fieldnames").tolist(),
+            "frame": frame,
+            "values": {name: array(f"value_{name}", "r") for name in VALUE_NAMES},
+            "totals": {"minutes": totals[0], "amount_cents": totals[1]},
+            "decimal_separator": str(array("separator")),
+        }
+    except (OSError, KeyError, ValueError) as e:
+        logging.warning("Failed to load sidecar '%s', using the CSV file: %s", path, e)
+        return None
+
+    logging.info("Loaded processed data from sidecar '%s'.", path)
+    return data
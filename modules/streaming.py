@@ -0,0 +1,113 @@
+"""This module provides the constant-memory streaming mode of the processing workflow.
+
+The export is read in bounded chunks, every chunk is pushed through the columnar transformation
+stages as a generator pipeline and written to the output CSV as soon as it is ready. The summary
+row is built from running totals, so peak memory depends on the chunk size, plus the hash of
+every distinct session the validator keeps to detect duplicates across chunks.
+"""
+import os
+import csv
+import logging
+from rich.console import Console
+from configs.config import config
+from modules import columnar, archive
+from modules.validation import Validator
+from modules.processing import EXCLUDED_STATUSES, validate_columns, save_history, finish_history
+from modules.records import format_summary_row
+from modules.workbook import WorkbookWriter, workbook_path
+
+# Initialize the console for rich output
+console = Console()
+
+def read_chunks(input_file, chunk_size, settings):
+    """Yield the valid, filtered sessions of the export chunk by chunk.
+
+    The problems of all chunks are reported together after the last one.
+    """
+    validator = Validator(input_file, settings, (settings.trainer,), EXCLUDED_STATUSES)
+    header_checked = False
+    for fieldnames, frame in columnar.iter_export(input_file, chunk_size):
+        if not header_checked:
+            validate_columns(fieldnames)
+            header_checked = True
+
+        frame = validator.check(frame, fieldnames)
+        frame = columnar.filter_sessions(frame, EXCLUDED_STATUSES, settings.trainer)
+        if len(frame):
+            yield {"fieldnames": list(fieldnames), "frame": frame, "settings": settings}
+    validator.finish()
+
+def transform_chunks(chunks, totals):
+    """Apply the columnar stages to every chunk and update the running totals."""
+    previous_quiet = columnar.console.quiet
+    try:
+        for index, data in enumerate(chunks):
+            # Print the stage messages for the first chunk only
+            if index:
+                columnar.console.quiet = True
+
+            for transform in columnar.ROW_TRANSFORMATIONS:
+                data = transform(data)
+            totals["rows"] += len(data["frame"])
+            totals["minutes"] += int(data["values"]["minutes"].sum())
+            totals["amount_cents"] += int(data["values"]["amount_cents"].sum())
+
+            yield data
+    finally:
+        columnar.console.quiet = previous_quiet
+
+def stream_process(input_file, chunk_size=None, settings=None):
+    """Process the export chunk by chunk and write the output CSV incrementally."""
+    settings = settings or config.snapshot()
+    chunk_size = chunk_size or settings.chunk_size
+    output_folder = settings.processing_output_directory
+    os.makedirs(output_folder, exist_ok=True)
+    output_file = os.path.join(output_folder, f"processed-{os.path.basename(archive.plain_path(input_file))}")
+    partial_file = f"{output_file}.part"
+
+    console.print(f"🛠 [yellow]Streaming in chunks of {chunk_size} rows...[/yellow]")
+    totals = {"rows": 0, "minutes": 0, "amount_cents": 0}
+    last_chunk = None
+    workbook_writer = None
+    # Chunks are staged in the history database and replace the stored month only after a complete run
+    stage = os.path.basename(output_file)
+    history_staged = settings.history_enabled
+    if history_staged:
+        finish_history(stage, settings, commit=False)
+
+    try:
+        with open(partial_file, 'w', newline='', encoding="utf-8") as csvfile:
+            for data in transform_chunks(read_chunks(input_file, chunk_size, settings), totals):
+                columnar.write_rows(data, csvfile, header=last_chunk is None, summary=False)
+                if settings.xlsx_export:
+                    if workbook_writer is None:
+                        workbook_writer = WorkbookWriter(workbook_path(output_file), data["fieldnames"])
+                    workbook_writer.append(data)
+                if history_staged:
+                    history_staged = save_history(data, input_file, stage=stage)
+                last_chunk = data
+
+            if last_chunk is not None:
+                fieldnames = last_chunk["fieldnames"]
+                summary_row = format_summary_row(fieldnames, totals, last_chunk.get("decimal_separator", "."))
+                csv.writer(csvfile, delimiter=";").writerow([summary_row.get(key, "") for key in fieldnames])
+
+        if not totals["rows"]:
+            logging.error("No valid classes found in the input file after filtering.")
+            console.print("[bold red]Error:[/bold red] No valid classes found in the input file after filtering.")
+            raise ValueError("No valid classes found in the input file after filtering.")
+    except Exception:
+        os.remove(partial_file)
+        if workbook_writer is not None:
+            workbook_writer.discard()
+        if settings.history_enabled:
+            finish_history(stage, settings, commit=False)
+        raise
+
+    os.replace(partial_file, output_file)
+    if settings.history_enabled:
+        finish_history(stage, settings, commit=history_staged)
+    if workbook_writer is not None:
+        workbook_writer.close(totals)
+    logging.info("Streamed %d valid classes to '%s'.", totals["rows"], output_file)
+    return output_file
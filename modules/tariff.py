@@ -0,0 +1,181 @@
+"""This module compiles the configurable tariff rules of the Rechenmeister tool.
+
+The ``tariff`` section of ``config.yaml`` defines attendance tiers (bonus factors by attendance
+rate), base hourly rates per trainer or class and surcharges by weekday or start time. The rules
+are compiled once into sorted lookup tables:
+
+- attendance tiers into sorted arrays of rates (in per mille) with their bonus factors,
+- base rates into sorted arrays of trainer and class names with their rates in cents,
+- surcharges into a 7-entry weekday table and a 1440-entry start-minute table of factors.
+
+Both engines evaluate the same tables: the row-based engine with one bisection or index per value,
+the columnar engine with ``np.searchsorted`` and array indexing over whole columns. All factors are
+kept in per mille and all amounts in cents, so both engines round identically.
+"""
+import bisect
+import json
+import numpy as np
+import pandas as pd
+from configs.config import config
+from modules.ingestion import parse_export_date
+from modules.records import to_cents, time_to_minutes, final_rate_cents
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+MINUTES_PER_DAY = 24 * 60
+
+# The tiers of the original hard-coded tariff: exactly full classes and exactly half-full classes
+DEFAULT_ATTENDANCE_TIERS = [
+    {"rate": 1.0, "factor": 2.0, "match": "exact"},
+    {"rate": 0.5, "factor": 1.5, "match": "exact"},
+]
+
+def to_permille(value):
+    """Convert a factor or rate (e.g. 1.5) to integer per mille."""
+    return round(float(value) * 1000)
+
+def parse_weekday(value):
+    """Return the weekday index (Monday = 0) of a weekday number or name."""
+    if isinstance(value, int) and 0 <= value < 7:
+        return value
+    name = str(value).strip().lower()[:3]
+    if name not in WEEKDAYS:
+        raise ValueError(f"Invalid weekday in tariff surcharges: {value!r}")
+    return WEEKDAYS.index(name)
+
+def weekday(value):
+    """Return the weekday index (Monday = 0) of a DD.MM.YY export date."""
+    return parse_export_date(value).weekday()
+
+def sorted_table(mapping, convert):
+    """Compile a mapping into sorted keys and the converted values in the same order."""
+    keys = sorted(mapping)
+    return keys, [convert(mapping[key]) for key in keys]
+
+def lookup(keys, values, key, default):
+    """Look up a key in a sorted table by bisection."""
+    index = bisect.bisect_left(keys, key)
+    if index < len(keys) and keys[index] == key:
+        return values[index]
+    return default
+
+def lookup_batch(keys, values, column, default):
+    """Look up every value of a column in a sorted table, searching each distinct value once."""
+    if not keys:
+        return np.full(len(column), default, dtype=np.int64)
+    codes, uniques = pd.factorize(pd.Series(column, dtype=object))
+    uniques = np.asarray(uniques, dtype=object)
+    keys = np.asarray(keys, dtype=object)
+    positions = np.minimum(np.searchsorted(keys, uniques), len(keys) - 1)
+    found = keys[positions] == uniques
+    result = np.full(len(uniques), default, dtype=np.int64)
+    result[found] = np.asarray(values, dtype=np.int64)[positions[found]]
+    return result[codes]
+
+class Tariff:
+    """The compiled tariff rules."""
+
+    def __init__(self, settings, base_hourly_rate):
+        """Compile the ``tariff`` settings into lookup tables."""
+        settings = settings or {}
+        self.default_rate_cents = to_cents(base_hourly_rate)
+        self.trainer_keys, self.trainer_rates = sorted_table(settings.get("trainer_rates") or {}, to_cents)
+        self.class_keys, self.class_rates = sorted_table(settings.get("class_rates") or {}, to_cents)
+
+        # Attendance tiers, as sorted rates in per mille with the bonus factor in per mille
+        tiers = settings.get("attendance_tiers", DEFAULT_ATTENDANCE_TIERS)
+        exact, at_least = {}, {}
+        for tier in tiers:
+            match = tier.get("match", "at_least")
+            if match not in ("exact", "at_least"):
+                raise ValueError(f"Invalid attendance tier match {match!r}, expected 'exact' or 'at_least'.")
+            factor = to_permille(tier["factor"])
+            if factor <= 0:
+                raise ValueError(f"Invalid attendance tier factor {tier['factor']!r}.")
+            (exact if match == "exact" else at_least)[to_permille(tier["rate"])] = factor
+        self.default_bonus_permille = to_permille(settings.get("default_factor", 1.0))
+        self.exact_rates, self.exact_factors = sorted_table(exact, int)
+        self.threshold_rates, self.threshold_factors = sorted_table(at_least, int)
+
+        # Surcharges, multiplied into one factor per weekday and one per start minute
+        weekday_factors = [1.0] * 7
+        minute_factors = [1.0] * MINUTES_PER_DAY
+        for surcharge in settings.get("surcharges") or []:
+            factor = float(surcharge["factor"])
+            if factor <= 0:
+                raise ValueError(f"Invalid surcharge factor {surcharge['factor']!r}.")
+            if "weekdays" in surcharge:
+                for day in surcharge["weekdays"]:
+                    weekday_factors[parse_weekday(day)] *= factor
+            if "from" in surcharge or "to" in surcharge:
+                start = time_to_minutes(surcharge.get("from", "00:00"))
+                end = time_to_minutes(surcharge.get("to", "24:00"))
+                minutes = range(start, end) if start <= end else [*range(start, MINUTES_PER_DAY), *range(end)]
+                for minute in minutes:
+                    minute_factors[minute] *= factor
+        self.weekday_table = np.array([to_permille(factor) for factor in weekday_factors], dtype=np.int64)
+        self.minute_table = np.array([to_permille(factor) for factor in minute_factors], dtype=np.int64)
+        self.has_surcharges = bool((self.weekday_table != 1000).any() or (self.minute_table != 1000).any())
+
+    def base_rate_cents(self, trainer, class_name):
+        """Return the base hourly rate of a session; class rates take precedence over trainer rates."""
+        rate = lookup(self.trainer_keys, self.trainer_rates, trainer, self.default_rate_cents)
+        return lookup(self.class_keys, self.class_rates, class_name, rate)
+
+    def base_rate_cents_batch(self, trainers, class_names):
+        """Return the base hourly rates of whole columns of sessions."""
+        rates = lookup_batch(self.trainer_keys, self.trainer_rates, trainers, self.default_rate_cents)
+        class_rates = lookup_batch(self.class_keys, self.class_rates, class_names, -1)
+        return np.where(class_rates >= 0, class_rates, rates)
+
+    def bonus_permille(self, registered, capacity):
+        """Return the bonus factor (per mille) for an attendance; exact tiers take precedence."""
+        rate = registered * 1000 / capacity
+        index = bisect.bisect_left(self.exact_rates, rate)
+        if index < len(self.exact_rates) and self.exact_rates[index] == rate:
+            return self.exact_factors[index]
+        index = bisect.bisect_right(self.threshold_rates, rate) - 1
+        return self.threshold_factors[index] if index >= 0 else self.default_bonus_permille
+
+    def bonus_permille_batch(self, registered, capacity):
+        """Return the bonus factors (per mille) for whole columns of attendances."""
+        # Integer per-mille tier rates compare exactly with this ratio: equality only for exact quotients
+        rate = registered * 1000 / capacity
+        result = np.full(len(rate), self.default_bonus_permille, dtype=np.int64)
+        if self.threshold_rates:
+            index = np.searchsorted(np.asarray(self.threshold_rates, dtype=np.float64), rate, side="right") - 1
+            reached = index >= 0
+            result[reached] = np.asarray(self.threshold_factors, dtype=np.int64)[index[reached]]
+        if self.exact_rates:
+            exact_rates = np.asarray(self.exact_rates, dtype=np.float64)
+            index = np.minimum(np.searchsorted(exact_rates, rate), len(exact_rates) - 1)
+            matched = exact_rates[index] == rate
+            result[matched] = np.asarray(self.exact_factors, dtype=np.int64)[index[matched]]
+        return result
+
+    def final_rate_cents(self, base_rate_cents, bonus_permille, weekday, start_minute):
+        """Return the final hourly rate: the base rate with bonus, then weekday and time surcharges."""
+        rate = final_rate_cents(base_rate_cents, bonus_permille)
+        if self.has_surcharges:
+            rate = final_rate_cents(rate, int(self.weekday_table[weekday]))
+            rate = final_rate_cents(rate, int(self.minute_table[start_minute % MINUTES_PER_DAY]))
+        return rate
+
+    def final_rate_cents_batch(self, base_rate_cents, bonus_permille, weekdays, start_minutes):
+        """Return the final hourly rates of whole columns of sessions."""
+        rate = (base_rate_cents * bonus_permille + 500) // 1000
+        if self.has_surcharges:
+            rate = (rate * self.weekday_table[weekdays] + 500) // 1000
+            rate = (rate * self.minute_table[start_minutes % MINUTES_PER_DAY] + 500) // 1000
+        return rate
+
+# Compiled tariff of the current settings
+_compiled = {}
+
+def current_tariff(settings=None):
+    """Return the tariff compiled from a settings snapshot, compiling it only when the rules changed."""
+    settings = settings or config.snapshot()
+    key = json.dumps([settings.tariff, settings.base_hourly_rate], sort_keys=True, default=str)
+    if key not in _compiled:
+        _compiled.clear()
+        _compiled[key] = Tariff(settings.tariff, settings.base_hourly_rate)
+    return _compiled[key]
@@ -0,0 +1,226 @@
+"""This module checks activity exports against a declarative schema for the Rechenmeister tool.
+
+``SCHEMA`` states what a valid value of every column the transformations read looks like (dates,
+clock times, integer ranges); the cross-column rules check that a class ends after it starts,
+that its status is one of ``validation.allowed_statuses`` and that no session is listed twice.
+Every rule is evaluated on whole columns, so one pass over an export reports all of its problems
+instead of stopping at the first bad row.
+
+Invalid sessions never reach the transformations. By default the run stops after the pass with
+the complete error report (``errors-<export>.csv``); with ``validation.quarantine`` the invalid
+rows are set aside in ``rejected-<export>.csv`` and the remaining sessions are billed.
+"""
+import os
+import re
+import logging
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+from modules import archive
+from modules.columnar import map_unique
+from modules.records import time_to_minutes
+
+# Initialize the console for rich output
+console = Console()
+
+@dataclass(frozen=True)
+class Field:
+    """The rule for the values of one export column."""
+    column: str
+    kind: str               # "date", "time" or "integer"
+    minimum: int = None     # smallest allowed integer
+    required: bool = False  # the transformations cannot run without the column
+
+# Schema of the export columns the transformations read
+SCHEMA = (
+    Field("Datum", "date", required=True),
+    Field("Startzeit", "time", required=True),
+    Field("Endzeit", "time", required=True),
+    Field("Angemeldet", "integer", minimum=0),
+    Field("Max. Teilnehmer", "integer", minimum=1),
+)
+
+# Columns identifying a session; a later row with the same values is a duplicate
+SESSION_KEY = ("Datum", "Startzeit", "Endzeit", "Name", "Trainer")
+
+# Valid values of the column kinds
+TIME_PATTERN = r"\s*(?:[01]?\d|2[0-3]):[0-5]\d\s*"
+DATE_PATTERN = r"\s*\d{1,2}\.\d{1,2}\.(?:\d{2}|\d{4})\s*"
+INTEGER_PATTERN = r"\s*[+-]?\d+\s*"
+
+# Columns of the error report
+REPORT_COLUMNS = ["Zeile", "Spalte", "Wert", "Fehler"]
+
+# Problems printed to the console; the report file lists all of them
+MAX_SHOWN = 20
+
+def is_date(value):
+    """Return whether a DD.MM.YY export date exists in the calendar."""
+    from modules.ingestion import parse_export_date
+
+    try:
+        parse_export_date(value)
+        return True
+    except ValueError:
+        return False
+
+def matches(column, pattern):
+    """Return whether each value of a column matches a pattern, testing every distinct value once."""
+    compiled = re.compile(pattern)
+    return map_unique(column, lambda value: compiled.fullmatch(value) is not None).to_numpy(dtype=bool)
+
+def report_paths(input_file, directory):
+    """Return the paths of the error report and of the rejected rows of an export."""
+    name = os.path.basename(archive.plain_path(input_file))
+    return os.path.join(directory, f"errors-{name}"), os.path.join(directory, f"rejected-{name}")
+
+class Validator:
+    """Check the sessions of an export against the schema and collect every problem.
+
+    ``check`` takes the whole export or one chunk at a time and returns the valid rows;
+    ``finish`` writes the report once all rows were checked.
+    """
+
+    def __init__(self, input_file, settings, trainers=None, excluded_statuses=(), directory=None):
+        self.input_file = input_file
+        self.settings = settings
+        self.trainers = trainers  # None checks the sessions of every trainer
+        self.excluded_statuses = excluded_statuses
+        self.directory = directory or settings.processing_output_directory
+        self.fieldnames = None
+        self.problems = []
+        self.rejected = []
+        self.rejected_rows = 0
+        self.seen = set()  # hashes of the sessions of earlier chunks, one per distinct session
+
+    def flag(self, frame, mask, column, message):
+        """Record a problem for every row of a mask and return the mask."""
+        if mask.any():
+            rows = frame.loc[mask]
+            self.problems.append(pd.DataFrame({
+                "Zeile": rows.index.to_numpy() + 2,  # the header is line 1
+                "Spalte": column,
+                "Wert": rows[column].to_numpy() if column in rows.columns else "",
+                "Fehler": message,
+            }))
+        return mask
+
+    def scope(self, frame):
+        """Return the mask of the rows this run bills or might bill."""
+        if self.trainers is None:
+            return map_unique(frame["Trainer"], str.strip).to_numpy() != ""
+        return frame["Trainer"].isin(self.trainers).to_numpy()
+
+    def check_field(self, frame, field, rows):
+        """Check the values of one schema column in the given rows, returning the invalid ones."""
+        column = frame[field.column][rows]
+        valid = np.ones(len(frame), dtype=bool)
+        if field.kind == "time":
+            valid[rows] = matches(column, TIME_PATTERN)
+            return self.flag(frame, ~valid, field.column, "not a time (HH:MM)")
+        if field.kind == "date":
+            valid[rows] = matches(column, DATE_PATTERN)
+            valid[valid & rows] = map_unique(frame[field.column][valid & rows], is_date).to_numpy(dtype=bool)
+            return self.flag(frame, ~valid, field.column, "not a date (DD.MM.YY)")
+
+        valid[rows] = matches(column, INTEGER_PATTERN)
+        invalid = self.flag(frame, ~valid, field.column, "not an integer")
+        if field.minimum is not None:
+            numbers = np.full(len(frame), field.minimum, dtype=np.int64)
+            numbers[valid & rows] = map_unique(frame[field.column][valid & rows], int).to_numpy(dtype=np.int64)
+            invalid |= self.flag(frame, numbers < field.minimum, field.column, f"must be at least {field.minimum}")
+        return invalid
+
+    def check(self, frame, fieldnames):
+        """Check a frame of export rows in one pass and return its valid rows."""
+        missing = [field.column for field in SCHEMA if field.required and field.column not in fieldnames]
+        if missing:
+            raise ValueError(f"Missing required columns in the input file: {', '.join(missing)}")
+        self.fieldnames = list(fieldnames)
+
+        rows = self.scope(frame)
+        invalid = np.zeros(len(frame), dtype=bool)
+        if "Status" in frame.columns:
+            invalid |= self.flag(frame, rows & ~frame["Status"].isin(self.settings.allowed_statuses).to_numpy(),
+                                 "Status", "unknown status")
+            rows &= ~frame["Status"].isin(self.excluded_statuses).to_numpy()
+
+        invalid_fields = {field.column: self.check_field(frame, field, rows)
+                          for field in SCHEMA if field.column in frame.columns}
+        for field_invalid in invalid_fields.values():
+            invalid |= field_invalid
+
+        # Only sessions with two valid times can be compared
+        timed = rows & ~invalid_fields["Startzeit"] & ~invalid_fields["Endzeit"]
+        start = np.zeros(len(frame), dtype=np.int64)
+        end = np.zeros(len(frame), dtype=np.int64)
+        start[timed] = map_unique(frame["Startzeit"][timed], time_to_minutes).to_numpy(dtype=np.int64)
+        end[timed] = map_unique(frame["Endzeit"][timed], time_to_minutes).to_numpy(dtype=np.int64)
+        invalid |= self.flag(frame, timed & (end <= start), "Endzeit", "does not end after the start time")
+
+        key = [column for column in SESSION_KEY if column in frame.columns]
+        hashes = pd.util.hash_pandas_object(frame.loc[rows, key], index=False).to_numpy()
+        duplicate = np.zeros(len(frame), dtype=bool)
+        values = hashes.tolist()
+        # Set lookups keep the cost per chunk independent of the rows checked before
+        duplicate[rows] = pd.Series(hashes).duplicated().to_numpy() | np.fromiter(
+            map(self.seen.__contains__, values), dtype=bool, count=len(values))
+        self.seen.update(values)
+        invalid |= self.flag(frame, duplicate, "Datum", "duplicate session (same date, times, class and trainer)")
+
+        if invalid.any():
+            self.rejected.append(frame.loc[invalid])
+            self.rejected_rows += int(invalid.sum())
+        return frame.loc[~invalid]
+
+    def print_problems(self, problems):
+        """Print the first problems as a table."""
+        table = Table(title=f"{len(problems)} problems in {self.input_file}")
+        for column in REPORT_COLUMNS:
+            table.add_column(column, style="cyan" if column == "Zeile" else None, overflow="fold")
+        for row in problems.head(MAX_SHOWN).itertuples(index=False):
+            table.add_row(*(str(value) for value in row))
+        console.print(table)
+        if len(problems) > MAX_SHOWN:
+            console.print(f"[yellow]... and {len(problems) - MAX_SHOWN} more.[/yellow]")
+
+    def finish(self):
+        """Write the error report and stop the run, or set the invalid rows aside when quarantining.
+
+        Returns the number of rejected rows.
+        """
+        report_path, rejected_path = report_paths(self.input_file, self.directory)
+        if not self.problems:
+            # A report of an earlier run no longer applies
+            for path in (report_path, rejected_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return 0
+
+        problems = pd.concat(self.problems, ignore_index=True).sort_values("Zeile", kind="stable")
+        os.makedirs(self.directory, exist_ok=True)
+        problems.to_csv(report_path, sep=";", index=False)
+        self.print_problems(problems)
+
+        if not self.settings.quarantine:
+            logging.error("Validation of '%s' failed: %d invalid sessions, %d problems (report: '%s').",
+                          self.input_file, self.rejected_rows, len(problems), report_path)
+            raise ValueError(f"{self.rejected_rows} invalid sessions in '{self.input_file}', "
+                             f"see '{report_path}'.")
+
+        rejected = pd.concat(self.rejected).sort_index()
+        rejected.to_csv(rejected_path, sep=";", index=False, columns=self.fieldnames)
+        logging.warning("Quarantined %d invalid sessions of '%s' in '%s' (report: '%s').",
+                        self.rejected_rows, self.input_file, rejected_path, report_path)
+        console.print(f"[yellow]Set {self.rejected_rows} invalid sessions aside in {rejected_path}.[/yellow]")
+        return self.rejected_rows
+
+def validate_export(frame, fieldnames, input_file, settings, trainers=None, excluded_statuses=(),
+                    directory=None):
+    """Check a complete export and return its valid rows (raises unless quarantine is enabled)."""
+    validator = Validator(input_file, settings, trainers, excluded_statuses, directory)
+    frame = validator.check(frame, fieldnames)
+    validator.finish()
+    return frame
@@ -0,0 +1,276 @@
+"""This module provides the watch-folder daemon of the Rechenmeister tool.
+
+The daemon watches the ingestion source directory (with inotify on Linux, otherwise by polling),
+waits until a new export has stopped changing and then ingests, processes and invoices it. Exports
+are handed to a bounded queue served by a fixed number of warm worker processes; when the queue is
+full, the watcher waits before accepting more work. Exports of the same month are handled one
+after the other.
+"""
+import os
+import glob
+import errno
+import struct
+import signal
+import asyncio
+import fnmatch
+import logging
+import ctypes
+import ctypes.util
+from concurrent.futures import ProcessPoolExecutor
+from rich.console import Console
+from configs.config import config
+from modules import ingestion, metrics
+
+# Initialize the console for rich output
+console = Console()
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# Header of every inotify event: watch descriptor, mask, cookie and name length
+EVENT_HEADER = struct.Struct("iIII")
+
+def open_inotify(directory):
+    """Start watching a directory with inotify and return the file descriptor, or None if unavailable."""
+    library = ctypes.util.find_library("c")
+    if library is None:
+        return None
+    libc = ctypes.CDLL(library, use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        return None
+
+    fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if fd < 0:
+        logging.warning("inotify_init1 failed: %s", os.strerror(ctypes.get_errno()))
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+        logging.warning("inotify_add_watch failed: %s", os.strerror(ctypes.get_errno()))
+        os.close(fd)
+        return None
+    return fd
+
+def read_events(fd):
+    """Read the pending inotify events and return the changed file names (None on queue overflow)."""
+    names = set()
+    while True:
+        try:
+            buffer = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if length:
+                names.add(os.fsdecode(buffer[offset:offset + length].rstrip(b"\0")))
+            offset += length
+
+def snapshot(directory, pattern):
+    """Return the size and modification time of every matching file in a directory."""
+    files = {}
+    for path in glob.glob(os.path.join(directory, pattern)):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files[path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+def handle_export(source_file):
+    """Ingest, process and invoice a single export (runs in a worker process)."""
+    from modules.pipeline import run_pipeline
+
+    # Every export is a run of its own in the audit log
+    metrics.new_run()
+    # Pick up edited settings (e.g. new rates) without restarting the daemon
+    config.reload_if_changed()
+    ingestion.ensure_target_directory(config.target_directory)
+    plan, skipped = ingestion.plan_ingestion([source_file], config.target_directory, max_workers=1)
+    if not plan:
+        logging.info("Skipped '%s': %s.", source_file, skipped.get(source_file))
+        return None
+
+    _, target, digest = plan[0]
+    ingestion.transfer_file(source_file, target, config.ingestion_transfer_mode)
+    ingestion.record_ingested(config.target_directory, [(target, digest)])
+    logging.info("Ingested '%s' as '%s'.", source_file, target)
+    return run_pipeline(ingest=False, write_csv=True, input_file=target)
+
+class WatchDaemon:
+    """Watch a directory and feed settled exports to a bounded pool of workers."""
+
+    def __init__(self, directory=None, pattern=None, workers=None, queue_size=None, debounce=None,
+                 poll_interval=None, backend=None, handler=handle_export, executor=None):
+        self.directory = directory or config.source_directory
+        self.pattern = pattern or config.source_file_pattern
+        self.workers = workers or config.daemon_workers
+        self.debounce = config.daemon_debounce_seconds if debounce is None else debounce
+        self.poll_interval = poll_interval or config.daemon_poll_interval
+        self.backend = backend or config.daemon_backend
+        self.handler = handler
+        self.executor = executor
+        self.queue = asyncio.Queue(maxsize=queue_size or config.daemon_queue_size)
+        self.stop_event = asyncio.Event()
+        self.settling = {}   # path -> debounce task
+        self.queued = set()  # paths waiting in the queue or being handled
+        self.handled = {}    # path -> (size, mtime) when it was handled
+        self.month_locks = {}
+        self.results = []
+
+    def stop(self):
+        """Ask the daemon to finish the exports in progress and exit."""
+        self.stop_event.set()
+
+    def notice(self, path):
+        """Start waiting for a new or changed export to settle (its debounce task sees further changes)."""
+        if (not fnmatch.fnmatch(os.path.basename(path), self.pattern)
+                or path in self.queued or path in self.settling):
+            return
+        self.settling[path] = asyncio.get_running_loop().create_task(self.settle(path))
+
+    def rescan(self):
+        """Notice every matching file of the directory that was not handled in its current state."""
+        for path, state in snapshot(self.directory, self.pattern).items():
+            if self.handled.get(path) != state:
+                self.notice(path)
+
+    async def settle(self, path):
+        """Queue an export once its size and modification time stayed the same for the debounce time."""
+        try:
+            state = None
+            while True:
+                previous = state
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    return
+                state = (stat.st_size, stat.st_mtime_ns)
+                if state == previous and stat.st_size:
+                    break
+                await asyncio.sleep(self.debounce)
+
+            self.queued.add(path)
+            self.handled[path] = state
+            # Blocks while all workers are busy and the queue is full (backpressure)
+            await self.queue.put(path)
+            logging.info("Queued export '%s'.", path)
+        finally:
+            del self.settling[path]
+
+    async def watch_inotify(self, fd):
+        """Notice changed exports from inotify events until the daemon stops."""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        loop.add_reader(fd, ready.set)
+        stopped = asyncio.ensure_future(self.stop_event.wait())
+        try:
+            while True:
+                readable = asyncio.ensure_future(ready.wait())
+                await asyncio.wait([readable, stopped], return_when=asyncio.FIRST_COMPLETED)
+                if stopped.done():
+                    readable.cancel()
+                    break
+
+                ready.clear()
+                names = read_events(fd)
+                if names is None:
+                    logging.warning("inotify queue overflowed, rescanning '%s'.", self.directory)
+                    self.rescan()
+                    continue
+                for name in names:
+                    self.notice(os.path.join(self.directory, name))
+        finally:
+            stopped.cancel()
+            loop.remove_reader(fd)
+            os.close(fd)
+
+    async def watch_polling(self):
+        """Notice changed exports by scanning the directory until the daemon stops."""
+        while not self.stop_event.is_set():
+            self.rescan()
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def work(self, executor):
+        """Hand queued exports to the executor, one month at a time."""
+        loop = asyncio.get_running_loop()
+        while True:
+            path = await self.queue.get()
+            try:
+                date_range = await asyncio.to_thread(ingestion.export_date_range, path)
+                month = ingestion.target_file_name(date_range) if date_range else path
+                async with self.month_locks.setdefault(month, asyncio.Lock()):
+                    result = await loop.run_in_executor(executor, self.handler, path)
+                if result is not None:
+                    self.results.append(result)
+                    console.print(f"👁 [green]Invoice ready: {result}.[/green]")
+            except Exception as e:
+                logging.error("Failed to handle export '%s': %s", path, e)
+                console.print(f"[bold red]Error:[/bold red] Failed to handle export '{path}': {e}")
+            finally:
+                self.queued.discard(path)
+                self.queue.task_done()
+
+    async def run(self):
+        """Watch the directory until stopped and return the paths of the generated invoices."""
+        from modules.pipeline import warm_worker
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd = open_inotify(self.directory) if self.backend in ("auto", "inotify") else None
+        if fd is None and self.backend == "inotify":
+            raise OSError("inotify is not available on this system.")
+        backend = "inotify" if fd is not None else "polling"
+        logging.info("Watching '%s' for '%s' (%s, %d workers).", self.directory, self.pattern, backend, self.workers)
+        console.print(f"👁 [green]Watching {self.directory} ({backend}, {self.workers} workers)...[/green]")
+
+        executor = self.executor or ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker)
+        workers = [asyncio.create_task(self.work(executor)) for _ in range(self.workers)]
+        try:
+            # Exports that arrived while the daemon was not running
+            self.rescan()
+            if fd is not None:
+                await self.watch_inotify(fd)
+            else:
+                await self.watch_polling()
+
+            # Finish what was already accepted
+            for task in list(self.settling.values()):
+                task.cancel()
+            await self.queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if self.executor is None:
+                executor.shutdown(wait=True)
+
+        logging.info("Watch daemon stopped after %d invoices.", len(self.results))
+        return self.results
+
+def run_daemon(**options):
+    """Run the watch daemon until SIGINT or SIGTERM."""
+    async def main():
+        daemon = WatchDaemon(**options)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, daemon.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+        return await daemon.run()
+
+    return asyncio.run(main())
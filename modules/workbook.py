@@ -0,0 +1,139 @@
+"""This module writes processed data as a native Excel workbook for the Rechenmeister tool.
+
+The XLSX file holds the same columns as the processed CSV, but the billing values are real
+numeric cells (hours, euros, factors, a percentage) with Excel number formats and the dates are
+date cells, so no decimal comma has to be parsed back. The sheet is written with openpyxl's
+write-only mode block by block, which keeps memory bounded for large months, and the summary row
+holds the computed totals instead of formulas.
+"""
+import os
+import logging
+import numpy as np
+from modules import metrics
+from modules.records import SUMMARY_LABEL
+
+# Rows converted from the typed columns at a time
+BLOCK_ROWS = 10000
+
+# Excel number format of every computed column
+NUMBER_FORMATS = {
+    "Dauer-in-Stunden": "0.0",
+    "Stundensatz-Basis": "#,##0.00",
+    "Anmeldequote": "0.0%",
+    "Bonus-Faktor": "0.0##",
+    "Stundensatz-Final": "#,##0.00",
+    "Stundenbetrag": "#,##0.00",
+}
+DATE_FORMAT = "DD.MM.YYYY"
+
+def workbook_path(csv_path):
+    """Return the path of the workbook belonging to a processed CSV file."""
+    return f"{os.path.splitext(csv_path)[0]}.xlsx"
+
+def numeric_columns(data):
+    """Return the computed columns of processed data as numbers in their display unit."""
+    from modules.sidecar import typed_values
+
+    values = typed_values(data)
+    return {
+        "Dauer-in-Stunden": values["minutes"] / 60,
+        "Stundensatz-Basis": values["base_rate_cents"] / 100,
+        "Anmeldequote": values["registered"] / values["capacity"],
+        "Bonus-Faktor": values["bonus_permille"] / 1000,
+        "Stundensatz-Final": values["final_rate_cents"] / 100,
+        "Stundenbetrag": values["amount_cents"] / 100,
+    }
+
+def date_column(dates):
+    """Convert a column of DD.MM.YY export dates to dates, once per distinct value."""
+    from modules.columnar import map_unique
+    from modules.ingestion import parse_export_date
+
+    def to_date(value):
+        try:
+            return parse_export_date(value)
+        except ValueError:
+            return value
+    return map_unique(dates, to_date)
+
+class WorkbookWriter:
+    """Stream processed data into an XLSX file, chunk by chunk."""
+
+    def __init__(self, path, fieldnames):
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("Abrechnung")
+        self.cell = WriteOnlyCell
+        self.formats = {key: NUMBER_FORMATS.get(key, DATE_FORMAT if key == "Datum" else None)
+                        for key in self.fieldnames}
+        self.sheet.append(self.fieldnames)
+
+    def styled(self, value, number_format):
+        """Return a value as a cell with a number format (plain values stay unstyled)."""
+        if number_format is None or isinstance(value, str):
+            return value
+        cell = self.cell(self.sheet, value)
+        cell.number_format = number_format
+        return cell
+
+    def append(self, data):
+        """Append the sessions of processed data (a whole month or one streaming chunk)."""
+        from modules.sidecar import raw_columns
+
+        # Empty export values become empty cells, which are not written at all
+        columns = {key: column.where(column != "", None) for key, column in raw_columns(data).items()}
+        columns.update(numeric_columns(data))
+        if "Datum" in columns:
+            columns["Datum"] = date_column(columns["Datum"])
+
+        ordered = [np.asarray(columns[key]) if key in NUMBER_FORMATS else np.asarray(columns[key], dtype=object)
+                   for key in self.fieldnames]
+        formats = [self.formats[key] for key in self.fieldnames]
+        rows = len(ordered[0]) if ordered else 0
+        for start in range(0, rows, BLOCK_ROWS):
+            block = [column[start:start + BLOCK_ROWS].tolist() for column in ordered]
+            for row in zip(*block):
+                self.sheet.append([self.styled(value, number_format)
+                                   for value, number_format in zip(row, formats)])
+
+    def close(self, totals):
+        """Append the summary row with the totals and save the workbook."""
+        summary = {key: None for key in self.fieldnames}
+        summary["Datum"] = SUMMARY_LABEL
+        summary["Dauer-in-Stunden"] = totals["minutes"] / 60
+        summary["Stundenbetrag"] = totals["amount_cents"] / 100
+        self.sheet.append([self.styled(summary[key], NUMBER_FORMATS.get(key)) for key in self.fieldnames])
+
+        # Write to a partial file first, so an interrupted run never leaves a truncated workbook behind
+        partial = f"{self.path}.part"
+        try:
+            self.workbook.save(partial)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        os.replace(partial, self.path)
+        logging.info("Workbook written to '%s'.", self.path)
+        return self.path
+
+    def discard(self):
+        """Drop an unfinished workbook of a failed run, with the temporary file holding its rows."""
+        # Write-only sheets buffer their rows in a temporary file until the workbook is saved
+        writer = self.sheet._writer
+        if writer is not None:
+            if self.sheet._rows is not None:
+                self.sheet._rows.close()
+            writer.close()
+            if os.path.exists(writer.out):
+                os.remove(writer.out)
+
+@metrics.instrument("processing")
+def write_workbook(data, csv_path):
+    """Write the workbook of processed data next to its processed CSV file."""
+    writer = WorkbookWriter(workbook_path(csv_path), data["fieldnames"])
+    writer.append(data)
+    return writer.close(data["totals"])
@@ -1,8 +1,200 @@
 """This is a sample test file for the Rechenmeister CLI tool."""
 import unittest
 import os
-from configs.config import config
+import io
+import asyncio
+import json
+import filecmp
+import logging
+import dataclasses
+import time
+import tempfile
+import threading
+from datetime import date, datetime
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from configs.config import config, Config
 from modules.ingestion import ingest_file
+from modules import ingestion, watcher, server, audit, batch, validation, archive
+from modules import processing, streaming, fanout, incremental, generation, metrics, records, columnar, sidecar, history, tariff
+
+EXPORT_HEADER = ("Typ;Datum;Startzeit;Endzeit;Name;Angemeldet;Anwesend;Max. Teilnehmer;Warteliste;"
+                 "Trainer;Ort;Status;Sport;Aktivitätsgruppe;Kommentar zur Einheit;Veröffentlicht;"
+                 "Einheit archiviert;Aktivität archiviert;Einheit abgesagt")
+
+EXPORT_ROWS = [
+    "Klasse;01.08.25;17:30;18:30;Yoga Flow;;;8;0;;;Storniert;Yoga;group_01;;;ja;nein;ja",
+    "Klasse;02.08.25;09:00;10:00;Yoga Flow;4;4;8;0;Victoria;;buchbar;Yoga;group_01;;;nein;nein;nein",
+    "Klasse;02.08.25;10:30;11:45;\"Pilates; Core\";8;7;8;0;Victoria;;buchbar;Yoga;group_02;;;nein;nein;nein",
+    "Klasse;03.08.25;18:15;19:30;Yin;3;3;8;0;Victoria;;buchbar;Yoga;group_03;;;nein;nein;nein",
+    "Klasse;04.08.25;07:00;08:00;Vinyasa;6;6;6;0;Teacher01;;buchbar;Yoga;group_04;;;nein;nein;nein",
+    "Klasse;05.08.25;12:00;13:30;Vinyasa;2;2;6;0;Victoria;;Abgesagt;Yoga;group_04;;;nein;nein;ja",
+]
+
+def write_export(path, rows=None):
+    """Write a small activity export with the given data rows."""
+    with open(path, "w", encoding="utf-8", newline="") as export:
+        export.write("\r\n".join([EXPORT_HEADER] + (EXPORT_ROWS if rows is None else rows)) + "\r\n")
+    return path
+
+class TestConfig(unittest.TestCase):
+    """Test cases for the settings snapshot and hot reload."""
+    def setUp(self):
+        """Set up a copy of the configuration file."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.config_path = os.path.join(self.tmp_dir.name, "config.yaml")
+        with open(config.config_path, encoding="utf-8") as source:
+            with open(self.config_path, "w", encoding="utf-8") as target:
+                target.write(source.read())
+
+    def edit_config(self, old, new):
+        """Replace text in the configuration copy and move its modification time forward."""
+        with open(self.config_path, encoding="utf-8") as file:
+            text = file.read()
+        with open(self.config_path, "w", encoding="utf-8") as file:
+            file.write(text.replace(old, new))
+        mtime = os.stat(self.config_path).st_mtime_ns + 1_000_000_000
+        os.utime(self.config_path, ns=(mtime, mtime))
+
+    def test_snapshot_is_frozen_and_validated(self):
+        """Test that snapshots cannot be changed and invalid settings are rejected."""
+        settings = config.snapshot()
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            settings.trainer = "Someone"
+        with self.assertRaises(TypeError):
+            settings.tariff["default_factor"] = 3.0
+        with mock.patch.dict(config.config["processing"], {"engine": "spreadsheet"}):
+            with self.assertRaises(ValueError):
+                config.snapshot()
+        with mock.patch.dict(config.config["processing"], {"xlsx_export": "false"}):
+            with self.assertRaisesRegex(ValueError, "xlsx_export must be true or false"):
+                config.snapshot()
+
+    def test_stages_use_the_snapshot_of_the_run(self):
+        """Test that changing the settings during a run does not affect data loaded before."""
+        input_file = write_export(os.path.join(self.tmp_dir.name, "aktivitaetsbericht-08-2025.csv"))
+        data = processing.load_and_validate_csv(input_file)
+        with mock.patch.dict(config.config["processing"], {"base_hourly_rate": 99.0}):
+            data = processing.transform_data(data)
+        self.assertEqual(data["totals"]["amount_cents"], 10500)
+
+        output_dir = os.path.join(self.tmp_dir.name, "output")
+        with mock.patch.dict(config.config["processing"], {"output_directory": output_dir}):
+            data = processing.transform_data(processing.load_and_validate_csv(input_file))
+        elsewhere = os.path.join(self.tmp_dir.name, "elsewhere")
+        with mock.patch.dict(config.config["processing"], {"output_directory": elsewhere, "xlsx_export": True}):
+            output_file = processing.save_processed_data(data, input_file)
+        self.assertEqual(os.path.dirname(output_file), output_dir)
+        self.assertFalse(os.path.exists(output_file.replace(".csv", ".xlsx")))
+
+        settings = config.snapshot()
+        with mock.patch.dict(config.config["generation"], {"filename_format": "rechnung-{year}-{month:02d}.pdf",
+                                                           "output_directory": "elsewhere"}):
+            self.assertEqual(generation.invoice_path(2025, 8, settings),
+                             os.path.join("output_pdf", "invoice-08-2025.pdf"))
+            self.assertEqual(generation.invoice_path(2025, 8), os.path.join("elsewhere", "rechnung-2025-08.pdf"))
+
+    def test_reload_if_changed(self):
+        """Test that an edited file is picked up and an invalid edit keeps the previous settings."""
+        settings = Config(self.config_path)
+        self.assertFalse(settings.reload_if_changed())
+
+        self.edit_config("base_hourly_rate: 20.0", "base_hourly_rate: 25.0")
+        self.assertTrue(settings.reload_if_changed())
+        self.assertEqual(settings.snapshot().base_hourly_rate, 25.0)
+
+        self.edit_config('engine: "columnar"', 'engine: "spreadsheet"')
+        self.assertFalse(settings.reload_if_changed())
+        self.assertEqual(settings.snapshot().processing_engine, "columnar")
+
+class TestAudit(unittest.TestCase):
+    """Test cases for the structured audit log and its offset index."""
+    def setUp(self):
+        """Set up an audit handler writing to a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, "audit.jsonl")
+        self.handler = audit.AuditHandler(self.path, max_bytes=4000, backup_count=3)
+        self.addCleanup(self.handler.close)
+
+    def log(self, run, day, message):
+        """Write one record of a run on a day."""
+        record = logging.LogRecord("root", logging.INFO, __file__, 1, message, None, None)
+        record.created = datetime(day.year, day.month, day.day, 12).timestamp()
+        with mock.patch.object(metrics, "run_id", run):
+            self.handler.handle(record)
+
+    def test_search_tail_and_rotation(self):
+        """Test that runs and date ranges are found through the index across rotated files."""
+        for index in range(60):
+            self.log(f"run{index // 10}", date(2025, 8, 1 + index // 20), f"message {index}")
+
+        self.assertTrue(os.path.exists(audit.segment_path(self.path, 1)))
+        self.assertEqual([record["message"] for record in audit.search(run="run2", path=self.path)],
+                         [f"message {index}" for index in range(20, 30)])
+        in_range = audit.search(start=date(2025, 8, 2), end=date(2025, 8, 2), path=self.path)
+        self.assertEqual({record["time"][:10] for record in in_range}, {"2025-08-02"})
+        self.assertEqual(len(in_range), 20)
+        self.assertEqual([record["message"] for record in audit.tail(3, path=self.path)],
+                         ["message 57", "message 58", "message 59"])
+        self.assertEqual([run for run, *_ in audit.runs(path=self.path)],
+                         [f"run{index}" for index in range(6)])
+
+    def test_handlers_share_the_log(self):
+        """Test that a handler reads the index only after another handler wrote, and blocks stay per run."""
+        other = audit.AuditHandler(self.path, max_bytes=4000, backup_count=3)
+        self.addCleanup(other.close)
+        with mock.patch.object(audit, "last_index_entry", wraps=audit.last_index_entry) as last_index_entry:
+            for index in range(5):
+                self.log("run0", date(2025, 8, 1), f"message {index}")
+            self.assertEqual(last_index_entry.call_count, 0)
+
+            self.handler, first = other, self.handler
+            self.log("run1", date(2025, 8, 1), "other")
+            self.handler = first
+            self.log("run0", date(2025, 8, 1), "again")
+            self.assertEqual(last_index_entry.call_count, 2)
+        self.assertEqual([(run, blocks) for run, _, _, blocks in audit.runs(path=self.path)],
+                         [("run0", 2), ("run1", 1)])
+
+    def test_action_log_rotation_is_shared(self):
+        """Test that a handler whose log was rotated by another one writes on into the new file."""
+        path = os.path.join(self.tmp_dir.name, "rechenmeister.log")
+        handlers = [audit.LockedRotatingFileHandler(path, maxBytes=40, backupCount=20) for _ in range(2)]
+        for handler in handlers:
+            self.addCleanup(handler.close)
+        for index in range(40):
+            handlers[index % 2].emit(logging.LogRecord("root", logging.INFO, __file__, 1, f"line {index}", None, None))
+
+        # Oldest file first, every record once and in order
+        files = [f"{path}.{number}" for number in range(20, 0, -1) if os.path.exists(f"{path}.{number}")] + [path]
+        lines = []
+        for file in files:
+            with open(file, encoding="utf-8") as log:
+                lines.extend(log.read().splitlines())
+        self.assertEqual(lines, [f"line {index}" for index in range(40)])
+
+    def test_tail_filters_level_before_counting(self):
+        """Test that the last records of a level are found even behind many records of other levels."""
+        self.log("run0", date(2025, 8, 1), "first")
+        record = logging.LogRecord("root", logging.ERROR, __file__, 1, "failed", None, None)
+        self.handler.handle(record)
+        for index in range(100):
+            self.log("run1", date(2025, 8, 2), f"message {index}")
+        self.assertEqual([record["message"] for record in audit.tail(5, path=self.path, level="error")], ["failed"])
+        self.assertEqual(len(audit.tail(5, path=self.path)), 5)
+
+    def test_every_export_is_a_run(self):
+        """Test that the exports a long-running worker handles get their own run IDs."""
+        run_ids = set()
+        with mock.patch("modules.pipeline.run_pipeline"), \
+                mock.patch.object(ingestion, "plan_ingestion", return_value=([], {})):
+            for _ in range(2):
+                watcher.handle_export("export.csv")
+                run_ids.add(metrics.run_id)
+        self.assertEqual(len(run_ids), 2)
 
 class TestIngestion(unittest.TestCase):
     """Test cases for the ingestion functionality of Rechenmeister."""
@@ -26,5 +218,780 @@ class TestIngestion(unittest.TestCase):
         files = os.listdir(self.target_directory)
         self.assertTrue(len(files) > 0, "No files found in target directory.")
 
+class TestBulkIngestion(unittest.TestCase):
+    """Test cases for ingesting a backlog of exports at once."""
+    def setUp(self):
+        """Set up temporary source and target directories with several exports."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.source = os.path.join(self.tmp_dir.name, "downloads")
+        self.target = os.path.join(self.tmp_dir.name, "input_csv")
+        os.makedirs(self.source)
+        section = "ingestion_testing" if config.testing_mode else "ingestion"
+        patcher = mock.patch.dict(config.config[section], {
+            "source_directory": self.source, "target_directory": self.target, "source_file_pattern": "*.csv"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        write_export(os.path.join(self.source, "Bericht 2025-08-01-2025-08-10.csv"), EXPORT_ROWS[:2])
+        write_export(os.path.join(self.source, "Bericht 2025-08-01-2025-08-20.csv"))
+        write_export(os.path.join(self.source, "Bericht Kopie 2025-08-01-2025-08-20.csv"))
+        write_export(os.path.join(self.source, "Bericht ohne Zeitraum.csv"),
+                     [row.replace(".08.25", ".07.25") for row in EXPORT_ROWS])
+
+    def test_ingest_all(self):
+        """Test that every month is ingested once, named after its date range."""
+        ingested, skipped, failures = ingestion.ingest_all(mode="copy")
+        self.assertEqual(failures, {})
+        self.assertEqual([os.path.basename(path) for path in ingested],
+                         ["aktivitaetsbericht-07-2025.csv", "aktivitaetsbericht-08-2025.csv"])
+        self.assertEqual(sorted(skipped.values()), ["duplicate", "superseded"])
+        self.assertTrue(filecmp.cmp(ingested[1], os.path.join(self.source, "Bericht 2025-08-01-2025-08-20.csv"),
+                                    shallow=False))
+        self.assertEqual(len(os.listdir(self.source)), 4)
+
+        # A second run finds everything already ingested
+        ingested, skipped, _ = ingestion.ingest_all(mode="move")
+        self.assertEqual(ingested, [])
+        self.assertIn("already ingested", skipped.values())
+
+    def test_ingested_files_are_not_rehashed(self):
+        """Test that planning compares against the recorded hashes instead of re-reading every ingested file."""
+        ingested, _, _ = ingestion.ingest_all(mode="copy")
+        new_export = write_export(os.path.join(self.source, "Bericht 2025-09-01-2025-09-10.csv"),
+                                  [row.replace(".08.25", ".09.25") for row in EXPORT_ROWS])
+        with mock.patch.object(ingestion, "file_hash", wraps=ingestion.file_hash) as file_hash:
+            plan, _ = ingestion.plan_ingestion([new_export], self.target, max_workers=1)
+            self.assertEqual([call.args[0] for call in file_hash.call_args_list], [new_export])
+            self.assertEqual(len(plan), 1)
+
+            # Ingesting records the hashes of the plan, and a rescan does not read unchanged sources again
+            file_hash.reset_mock()
+            ingestion.ingest_all(mode="copy")
+            ingestion.ingest_all(mode="copy")
+            file_hash.assert_not_called()
+
+        # Files placed by hand are hashed once and recorded
+        write_export(os.path.join(self.target, "aktivitaetsbericht-06-2025.csv"),
+                     [row.replace(".08.25", ".06.25") for row in EXPORT_ROWS])
+        self.assertEqual(len(ingestion.ingested_hashes(self.target)), len(ingested) + 2)
+        self.assertEqual(len(ingestion.read_manifest(self.target)[1]), len(ingested) + 2)
+
+class TestWatcher(unittest.TestCase):
+    """Test cases for the watch-folder daemon."""
+    def setUp(self):
+        """Set up a temporary watched directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def watch(self, backend, write_files):
+        """Run the daemon with a recording handler while ``write_files`` creates exports."""
+        async def scenario():
+            daemon = watcher.WatchDaemon(directory=self.tmp_dir.name, pattern="*.csv", workers=2,
+                                         queue_size=1, debounce=0.05, poll_interval=0.02, backend=backend,
+                                         handler=os.path.basename, executor=ThreadPoolExecutor(2))
+            task = asyncio.create_task(daemon.run())
+            await asyncio.sleep(0.1)
+            await write_files()
+            await asyncio.sleep(0.5)
+            daemon.stop()
+            return await task
+        return asyncio.run(scenario())
+
+    async def write_exports(self):
+        """Write one export in two parts and two complete ones."""
+        partial = os.path.join(self.tmp_dir.name, "slow.csv")
+        with open(partial, "w", encoding="utf-8") as export:
+            export.write(EXPORT_HEADER + "\r\n")
+        await asyncio.sleep(0.02)
+        with open(partial, "a", encoding="utf-8") as export:
+            export.write(EXPORT_ROWS[1] + "\r\n")
+        write_export(os.path.join(self.tmp_dir.name, "a.csv"))
+        write_export(os.path.join(self.tmp_dir.name, "b.csv"))
+        write_export(os.path.join(self.tmp_dir.name, "ignored.txt"))
+
+    def test_polling(self):
+        """Test that every settled export is handled exactly once when polling."""
+        self.assertEqual(sorted(self.watch("polling", self.write_exports)), ["a.csv", "b.csv", "slow.csv"])
+
+    def test_inotify(self):
+        """Test that every settled export is handled exactly once with inotify."""
+        if watcher.open_inotify(self.tmp_dir.name) is None:
+            self.skipTest("inotify is not available")
+        self.assertEqual(sorted(self.watch("inotify", self.write_exports)), ["a.csv", "b.csv", "slow.csv"])
+
+class TestServer(unittest.TestCase):
+    """Test cases for the HTTP invoicing service."""
+    def setUp(self):
+        """Set up a temporary jobs directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        patcher = mock.patch.dict(config.config["processing"], {"output_directory": output_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def request(self, port, method, path, body=b""):
+        """Send one request and return the status code and response body."""
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n"
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, content = response.partition(b"\r\n\r\n")
+        return int(head.split(b" ")[1]), content
+
+    def test_upload_poll_and_download(self):
+        """Test that an uploaded export is processed and its CSV and PDF can be downloaded."""
+        input_file = write_export(os.path.join(self.tmp_dir.name, "aktivitaetsbericht-08-2025.csv"))
+        with open(input_file, "rb") as export:
+            upload = export.read()
+
+        async def scenario():
+            service = server.InvoiceServer(host="127.0.0.1", port=0, workers=1, queue_size=1,
+                                           jobs_directory=self.tmp_dir.name, executor=ThreadPoolExecutor(1))
+            task = asyncio.create_task(service.run())
+            while service.server is None:
+                await asyncio.sleep(0.01)
+            port = service.port
+
+            status, content = await self.request(port, "POST", "/jobs", upload)
+            self.assertEqual(status, 202)
+            job_id = json.loads(content)["id"]
+            for _ in range(500):
+                status, content = await self.request(port, "GET", f"/jobs/{job_id}")
+                if json.loads(content)["status"] in ("done", "failed"):
+                    break
+                await asyncio.sleep(0.02)
+            self.assertEqual(json.loads(content)["status"], "done", content)
+
+            responses = {name: await self.request(port, "GET", f"/jobs/{job_id}/{name}") for name in ("csv", "pdf")}
+            missing = await self.request(port, "GET", "/jobs/unknown")
+            service.stop()
+            await task
+            return responses, missing
+
+        responses, missing = asyncio.run(scenario())
+        self.assertEqual(responses["csv"][0], 200)
+        self.assertTrue(responses["csv"][1].decode("utf-8").splitlines()[-1].endswith(";105,00"))
+        self.assertEqual(responses["pdf"][0], 200)
+        self.assertTrue(responses["pdf"][1].startswith(b"%PDF"))
+        self.assertEqual(missing[0], 404)
+        self.assertEqual(history.query_totals(), [("Victoria", 3, 210, 10500)])
+
+    def test_queue_slot_is_reserved_during_upload(self):
+        """Test that an upload arriving while another one is saved cannot overfill the queue."""
+        saving, release = threading.Event(), threading.Event()
+
+        def slow_save(job_directory, body):
+            saving.set()
+            release.wait(5)
+            server.InvoiceServer.save_upload(job_directory, body)
+
+        async def scenario():
+            service = server.InvoiceServer(host="127.0.0.1", port=0, workers=1, queue_size=1,
+                                           jobs_directory=self.tmp_dir.name)
+            with mock.patch.object(service, "save_upload", slow_save):
+                first = asyncio.create_task(service.submit(b"Typ;Datum\r\n"))
+                await asyncio.to_thread(saving.wait, 5)
+                with self.assertRaises(server.HTTPError) as refused:
+                    await service.submit(b"Typ;Datum\r\n")
+                release.set()
+                job = await first
+            return service, job, refused.exception.status
+
+        service, job, status = asyncio.run(scenario())
+        self.assertEqual(status, 503)
+        self.assertEqual(list(service.jobs), [job["id"]])
+        self.assertEqual(service.queue.qsize(), 1)
+        self.assertEqual(os.listdir(self.tmp_dir.name), [job["id"]])
+
+    def test_finished_jobs_expire(self):
+        """Test that finished jobs older than the time to live are forgotten together with their files."""
+        for name, age in (("stale", 7200), ("recent", 60)):
+            os.makedirs(os.path.join(self.tmp_dir.name, name))
+            os.utime(os.path.join(self.tmp_dir.name, name), (time.time() - age, time.time() - age))
+
+        async def scenario():
+            service = server.InvoiceServer(host="127.0.0.1", port=0, workers=1, queue_size=4,
+                                           jobs_directory=self.tmp_dir.name, job_ttl_hours=1)
+            service.remove_stale_directories()
+            finished = await service.submit(b"Typ;Datum\r\n")
+            waiting = await service.submit(b"Typ;Datum\r\n")
+            service.jobs[finished["id"]]["finished"] = time.time() - 7200
+            latest = await service.submit(b"Typ;Datum\r\n")
+            return service, waiting, latest
+
+        service, waiting, latest = asyncio.run(scenario())
+        self.assertEqual(set(service.jobs), {waiting["id"], latest["id"]})
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), sorted(["recent", waiting["id"], latest["id"]]))
+
+    def test_workers_are_warm_and_quiet(self):
+        """Test that the shared worker initializer quiets the console output of the stages."""
+        from modules import pipeline
+        self.addCleanup(setattr, generation.console, "quiet", generation.console.quiet)
+        self.addCleanup(setattr, processing.console, "quiet", processing.console.quiet)
+        self.addCleanup(setattr, columnar.console, "quiet", columnar.console.quiet)
+        pipeline.warm_worker()
+        self.assertTrue(all(module.console.quiet for module in (processing, columnar, generation)))
+
+class TestProcessing(unittest.TestCase):
+    """Test cases for the processing functionality of Rechenmeister."""
+    def setUp(self):
+        """Set up a temporary export and output directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.input_file = write_export(os.path.join(self.tmp_dir.name, "aktivitaetsbericht-08-2025.csv"))
+
+    def process(self, engine):
+        """Run the processing chain with the given engine and return the output path."""
+        output_dir = os.path.join(self.tmp_dir.name, engine)
+        with mock.patch.dict(config.config["processing"], {"output_directory": output_dir}):
+            data = processing.load_and_validate_csv(self.input_file, engine=engine)
+            data = processing.transform_data(data)
+            return processing.save_processed_data(data, self.input_file)
+
+    def test_engines_are_byte_identical(self):
+        """Test that the columnar engine writes exactly what the row engine writes."""
+        rows_output = self.process("rows")
+        columnar_output = self.process("columnar")
+        self.assertTrue(filecmp.cmp(rows_output, columnar_output, shallow=False))
+
+    def test_xlsx_export(self):
+        """Test that the workbook holds numeric billing cells and the totals of both engines."""
+        from openpyxl import load_workbook
+        for engine in ("rows", "columnar"):
+            with mock.patch.dict(config.config["processing"], {"xlsx_export": True}):
+                csv_path = self.process(engine)
+            sheet = load_workbook(os.path.splitext(csv_path)[0] + ".xlsx", read_only=True).active
+            rows = list(sheet.iter_rows(values_only=True))
+            header = rows[0]
+            self.assertEqual(len(rows), 5)
+            self.assertEqual(rows[1][header.index("Datum")].date(), date(2025, 8, 2))
+            self.assertEqual(rows[1][header.index("Stundenbetrag")], 30)
+            self.assertEqual(rows[2][header.index("Bonus-Faktor")], 2)
+            self.assertEqual(rows[-1][header.index("Datum")], records.SUMMARY_LABEL)
+            self.assertEqual(rows[-1][header.index("Dauer-in-Stunden")], 3.5)
+            self.assertEqual(rows[-1][header.index("Stundenbetrag")], 105)
+
+    def test_streaming_matches_batch(self):
+        """Test that streaming in small chunks writes the same file as batch processing."""
+        batch_output = self.process("columnar")
+        output_dir = os.path.join(self.tmp_dir.name, "streaming")
+        with mock.patch.dict(config.config["processing"], {"output_directory": output_dir}):
+            streamed_output = streaming.stream_process(self.input_file, chunk_size=2)
+        self.assertTrue(filecmp.cmp(batch_output, streamed_output, shallow=False))
+
+    def test_summary_row(self):
+        """Test the billed totals in the summary row."""
+        with open(self.process("columnar"), encoding="utf-8") as output:
+            lines = output.read().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[-1].startswith(";Gesamt (Monat);"))
+        self.assertTrue(lines[-1].endswith(";3,5;;;;;105,00"))
+
+    def test_amounts_are_exact_cents(self):
+        """Test that amounts are computed from exact minutes in integer cents."""
+        self.assertEqual(records.amount_cents(2000, 75), 2500)
+        self.assertEqual(records.amount_cents(3000, 50), 2500)
+        self.assertEqual(records.format_money(records.amount_cents(2000, 45), ","), "15,00")
+        self.assertEqual([records.format_rate(2000), records.format_rate(2050, ",")], ["20", "20,50"])
+        with open(self.process("rows"), encoding="utf-8") as output:
+            amounts = [line.rsplit(";", 1)[1] for line in output.read().splitlines()[1:-1]]
+        self.assertEqual(amounts, ["30,00", "50,00", "25,00"])
+
+class TestValidation(unittest.TestCase):
+    """Test cases for checking exports against the schema."""
+    BAD_ROWS = [
+        "Klasse;06.08.25;9:7;10:00;Yin;3;3;8;0;Victoria;;buchbar;Yoga;group_03;;;nein;nein;nein",
+        "Klasse;07.08.25;11:00;10:00;Yin;x;3;0;0;Victoria;;buchbar;Yoga;group_03;;;nein;nein;nein",
+        "Klasse;31.02.25;11:00;12:00;Yin;3;3;8;0;Victoria;;buchbr;Yoga;group_03;;;nein;nein;nein",
+        "Klasse;02.08.25;09:00;10:00;Yoga Flow;4;4;8;0;Victoria;;buchbar;Yoga;group_01;;;nein;nein;nein",
+    ]
+
+    def setUp(self):
+        """Set up an export with invalid sessions and a temporary output directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.input_file = write_export(os.path.join(self.tmp_dir.name, "aktivitaetsbericht-08-2025.csv"),
+                                       EXPORT_ROWS + self.BAD_ROWS)
+        self.report, self.rejected = validation.report_paths(self.input_file, self.tmp_dir.name)
+        patcher = mock.patch.dict(config.config["processing"], {"output_directory": self.tmp_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_report(self):
+        """Return the (line, column, problem) entries of the error report."""
+        with open(self.report, encoding="utf-8") as report:
+            return [tuple(line.split(";")[i] for i in (0, 1, 3)) for line in report.read().splitlines()[1:]]
+
+    def test_report_lists_every_problem(self):
+        """Test that one pass reports all invalid sessions, in every processing mode."""
+        expected = [
+            ("8", "Startzeit", "not a time (HH:MM)"),
+            ("9", "Angemeldet", "not an integer"),
+            ("9", "Max. Teilnehmer", "must be at least 1"),
+            ("9", "Endzeit", "does not end after the start time"),
+            ("10", "Status", "unknown status"),
+            ("10", "Datum", "not a date (DD.MM.YY)"),
+            ("11", "Datum", "duplicate session (same date, times, class and trainer)"),
+        ]
+        for engine in ("columnar", "rows"):
+            with self.assertRaisesRegex(ValueError, "4 invalid sessions"):
+                processing.load_and_validate_csv(self.input_file, engine=engine)
+            self.assertEqual(self.read_report(), expected)
+        # Duplicates are also found across chunks
+        with self.assertRaisesRegex(ValueError, "4 invalid sessions"):
+            streaming.stream_process(self.input_file, chunk_size=3)
+        self.assertEqual(self.read_report(), expected)
+
+    def test_menu_survives_invalid_exports(self):
+        """Test that an invalid export ends the chosen menu option, not the interactive session."""
+        # Without the log handlers the CLI installs on import
+        with mock.patch("logging.basicConfig"), mock.patch.object(audit, "install"):
+            from modules import rechenmeister
+        with mock.patch.object(rechenmeister, "main_menu", side_effect=[2, 99]) as menu, \
+                mock.patch.object(processing, "discover_input_file", return_value=self.input_file), \
+                mock.patch.object(rechenmeister.console, "print") as printed:
+            rechenmeister.main([])
+        self.assertEqual(menu.call_count, 2)
+        self.assertTrue(any(self.report in str(call) for call in printed.call_args_list))
+
+    def test_quarantine(self):
+        """Test that quarantined sessions are set aside and the valid ones are billed."""
+        rules = {"quarantine": True, "allowed_statuses": ["buchbar", "Storniert", "Abgesagt"]}
+        with mock.patch.dict(config.config, {"validation": rules}):
+            data = processing.transform_data(processing.load_and_validate_csv(self.input_file))
+        self.assertEqual(data["totals"], {"minutes": 210, "amount_cents": 10500})
+        with open(self.rejected, encoding="utf-8") as rejected:
+            self.assertEqual(len(rejected.read().splitlines()), 1 + len(self.BAD_ROWS))
+
+class TestArchive(unittest.TestCase):
+    """Test cases for compressed archives of exports and processed files."""
+    def setUp(self):
+        """Set up a temporary export."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.input_file = write_export(os.path.join(self.tmp_dir.name, "aktivitaetsbericht-08-2025.csv"))
+
+    def processed(self, input_file, engine):
+        """Return the processed CSV content of an export."""
+        output = io.StringIO(newline="")
+        processing.write_processed(
+            processing.transform_data(processing.load_and_validate_csv(input_file, engine=engine)), output)
+        return output.getvalue()
+
+    def test_archived_export_is_read_as_stream(self):
+        """Test that compressed exports are processed exactly like the plain file."""
+        expected = {engine: self.processed(self.input_file, engine) for engine in ("columnar", "rows")}
+        content_hash = ingestion.file_hash(self.input_file)
+        for codec in ("gzip", "xz"):
+            archived = archive.compress_file(self.input_file, codec)
+            self.assertFalse(os.path.exists(self.input_file))
+            self.assertEqual(ingestion.file_period(archived), (2025, 8))
+            self.assertEqual(ingestion.file_hash(archived), content_hash)
+            for engine, content in expected.items():
+                self.assertEqual(self.processed(archived, engine), content)
+            with archive.open_binary(archived) as source, open(self.input_file, "wb") as plain:
+                plain.write(source.read())
+            os.remove(archived)
+
+    def test_min_age_and_retention(self):
+        """Test that only files old enough are archived and expired archives are deleted."""
+        recent = write_export(os.path.join(self.tmp_dir.name, "aktivitaetsbericht-09-2025.csv"))
+        month_ago = os.path.getmtime(recent) - 31 * 86400
+        os.utime(self.input_file, (month_ago, month_ago))
+        directories = [(self.tmp_dir.name, "aktivitaetsbericht-*.csv")]
+
+        archived, deleted, failures = archive.archive_files(codec="gzip", min_age_days=7, retention_days=None,
+                                                            directories=directories)
+        self.assertEqual(archived, [f"{self.input_file}.gz"])
+        self.assertEqual((deleted, failures), ([], {}))
+        self.assertEqual(os.path.getmtime(archived[0]), month_ago)
+        self.assertEqual(archive.find(self.tmp_dir.name, "aktivitaetsbericht-*.csv"), [archived[0], recent])
+
+        _, deleted, _ = archive.archive_files(codec="gzip", min_age_days=7, retention_days=30,
+                                              directories=directories)
+        self.assertEqual(deleted, archived)
+        self.assertTrue(os.path.exists(recent))
+
+class TestTariff(unittest.TestCase):
+    """Test cases for the configurable tariff rules."""
+    TARIFF = {
+        "attendance_tiers": [{"rate": 0.5, "factor": 1.2}, {"rate": 0.75, "factor": 1.5},
+                             {"rate": 1.0, "factor": 2.0, "match": "exact"}],
+        "trainer_rates": {"Victoria": 22.0},
+        "class_rates": {"Yin": 30.0},
+        "surcharges": [{"weekdays": ["sun"], "factor": 1.1}, {"from": "18:00", "to": "22:00", "factor": 1.25}],
+    }
+
+    def setUp(self):
+        """Set up a temporary export and output directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.input_file = write_export(os.path.join(self.tmp_dir.name, "aktivitaetsbericht-08-2025.csv"))
+
+    def test_default_tiers(self):
+        """Test that the default tariff only rewards exactly full and exactly half-full classes."""
+        with mock.patch.dict(config.config, {"tariff": {}}):
+            compiled = tariff.current_tariff()
+        self.assertEqual([compiled.bonus_permille(registered, 8) for registered in (3, 4, 5, 7, 8)],
+                         [1000, 1500, 1000, 1000, 2000])
+
+    def test_rules_in_both_engines(self):
+        """Test thresholds, base rates and surcharges, evaluated identically by both engines."""
+        outputs = []
+        with mock.patch.dict(config.config, {"tariff": self.TARIFF}):
+            for engine in ("rows", "columnar"):
+                output_dir = os.path.join(self.tmp_dir.name, engine)
+                with mock.patch.dict(config.config["processing"], {"output_directory": output_dir}):
+                    data = processing.transform_data(processing.load_and_validate_csv(self.input_file, engine=engine))
+                    outputs.append(processing.save_processed_data(data, self.input_file))
+        self.assertTrue(filecmp.cmp(*outputs, shallow=False))
+
+        # 4/8 at 22.00 x 1.2; 8/8 at 22.00 x 2.0; Yin 3/8 on Sunday 18:15 at 30.00 x 1.1 x 1.25
+        with open(outputs[0], encoding="utf-8") as output:
+            rates = [line.split(";")[-2] for line in output.read().splitlines()[1:-1]]
+        self.assertEqual(rates, ["26,40", "44,00", "41,25"])
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for the per-step pipeline metrics."""
+    def setUp(self):
+        """Set up a temporary export and logs directory with metrics enabled."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.input_file = write_export(os.path.join(self.tmp_dir.name, "aktivitaetsbericht-08-2025.csv"))
+        patcher = mock.patch.dict(config.config["logging"], {"directory": self.tmp_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        metrics.enable()
+        self.addCleanup(metrics.enable, None)
+        metrics.new_run()
+
+    def test_records_every_transformation(self):
+        """Test that loading and every transformation step is recorded with its row counts."""
+        processing.transform_data(processing.load_and_validate_csv(self.input_file))
+        steps = [record["step"] for record in metrics.records]
+        self.assertEqual(steps[0], "load_and_validate_csv")
+        self.assertEqual(steps[1:], [transform.__name__ for transform in processing.TRANSFORMATIONS])
+        self.assertTrue(all(record["rows_out"] == 3 for record in metrics.records))
+        # Without tracemalloc every step still reports its memory
+        self.assertTrue(all(isinstance(record["rss_delta_mib"], float) for record in metrics.records))
+        self.assertTrue(all(record["peak_mib"] is None for record in metrics.records))
+
+        with open(os.path.join(self.tmp_dir.name, config.metrics_filename), encoding="utf-8") as file:
+            lines = [json.loads(line) for line in file]
+        self.assertEqual(len(lines), len(steps))
+        self.assertEqual({line["run_id"] for line in lines}, {metrics.run_id})
+
+    def test_configured_metrics_are_not_kept_in_memory(self):
+        """Test that metrics enabled in the configuration (daemon, service) are only written out."""
+        metrics.enable(None)
+        with mock.patch.dict(config.config["metrics"], {"enabled": True}):
+            metrics.new_run()
+            processing.transform_data(processing.load_and_validate_csv(self.input_file))
+        self.assertEqual(metrics.records, [])
+        with open(os.path.join(self.tmp_dir.name, config.metrics_filename), encoding="utf-8") as file:
+            self.assertEqual(len(file.readlines()), len(processing.TRANSFORMATIONS) + 1)
+
+class TestGeneration(unittest.TestCase):
+    """Test cases for the generation functionality of Rechenmeister."""
+    def setUp(self):
+        """Set up a temporary export and output directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.input_file = write_export(os.path.join(self.tmp_dir.name, "aktivitaetsbericht-08-2025.csv"))
+
+    def test_in_memory_handoff_matches_csv(self):
+        """Test that the invoice rows from memory equal the rows read back from the processed CSV."""
+        columns = ["Datum", "Name", "Stundenbetrag"]
+        for engine in ("rows", "columnar"):
+            with mock.patch.dict(config.config["processing"], {"output_directory": self.tmp_dir.name}):
+                data = processing.transform_data(processing.load_and_validate_csv(self.input_file, engine=engine))
+                csv_path = processing.save_processed_data(data, self.input_file)
+            from_csv = generation.load_dataframe(csv_path).reindex(columns=columns).fillna("")
+            from_memory = generation.invoice_frame(data)
+            self.assertEqual(from_memory.astype(str).values.tolist(), from_csv.astype(str).values.tolist())
+
+    def test_paginated_tables(self):
+        """Test that the invoice table is split into page-sized tables that repeat the header row."""
+        import pandas as pd
+        sessions = pd.DataFrame({"Datum": ["01.08.25", "02.08.25"] * 50, "Name": ["Yoga", "Pilates"] * 50,
+                                 "Stundenbetrag": ["22,00"] * 100})
+        dataframe = pd.concat([sessions, pd.DataFrame([[records.SUMMARY_LABEL, "", "2200,00"]],
+                                                      columns=sessions.columns)], ignore_index=True)
+        tables = list(generation.build_pdf_tables(dataframe, first_page_rows=30, rows_per_page=40))
+        self.assertEqual([len(table._cellvalues) for table in tables], [31, 41, 32])
+        for table in tables:
+            self.assertEqual(list(table._cellvalues[0]), ["Datum", "Name", "Stundenbetrag"])
+        self.assertEqual(list(tables[-1]._cellvalues[-1]), [records.SUMMARY_LABEL, "Summe", "2200,00"])
+
+        header, rows = generation.table_rows(dataframe, "class")
+        self.assertEqual(header, ["Name", "Einheiten", "Stundenbetrag"])
+        self.assertEqual(rows, [("Pilates", "50", "1100,00"), ("Yoga", "50", "1100,00"),
+                                ("Summe", "100", "2200,00")])
+
+        pdf_path = os.path.join(self.tmp_dir.name, "invoice.pdf")
+        generation.render_invoice(dataframe, pdf_path, "Stundenabrechnung", layout="day")
+        self.assertTrue(os.path.getsize(pdf_path) > 0)
+
+        # The page tables are created while the pages are laid out, not all before the first page
+        template, page_tables, pages_done = generation.InvoiceTemplate(), generation.page_tables, []
+        def counted_tables(*args):
+            for table in page_tables(*args):
+                pages_done.append(footer.call_count)
+                yield table
+        with mock.patch.object(template, "draw_footer") as footer, \
+                mock.patch.object(generation, "page_tables", counted_tables):
+            template.render([(pd.concat([sessions] * 10, ignore_index=True), "Stundenabrechnung")], pdf_path)
+        self.assertEqual(footer.call_count, len(pages_done))
+        self.assertGreater(pages_done[-1], len(pages_done) // 2)
+
+    def test_render_invoices_with_template(self):
+        """Test that one compiled template renders separate invoices and a merged one with a bookmark each."""
+        data = processing.transform_data(processing.load_and_validate_csv(self.input_file, engine="columnar"))
+        dataframe = generation.invoice_frame(data, ["Datum", "Anmeldequote", "Stundenbetrag"])
+        header, rows = generation.table_rows(dataframe, columns=["Datum", "Anmeldequote", "Stundenbetrag"])
+        self.assertEqual(header, ["Datum", "Anmeldequote", "Stundenbetrag"])
+        self.assertEqual(rows[-1], (records.SUMMARY_LABEL, "", "105,00"))
+
+        template = generation.invoice_template()
+        self.assertIs(generation.invoice_template(), template)
+        invoices = [(dataframe, os.path.join(self.tmp_dir.name, f"invoice-{trainer}.pdf"), f"Rechnung {trainer}")
+                    for trainer in ("A", "B")]
+        paths = generation.render_invoices(invoices)
+        self.assertEqual(paths, [path for _, path, _ in invoices])
+
+        merged_path = os.path.join(self.tmp_dir.name, "invoices.pdf")
+        self.assertEqual(generation.render_invoices(invoices, merged_path=merged_path), [merged_path])
+        with open(merged_path, "rb") as pdf:
+            content = pdf.read()
+        self.assertIn(b"/Outlines", content)
+        self.assertEqual(content.count(b"/Title (Rechnung "), 2)
+
+    def test_sidecar_roundtrip(self):
+        """Test that the binary sidecar reproduces the processed CSV and is ignored once the CSV changes."""
+        for engine in ("rows", "columnar"):
+            with mock.patch.dict(config.config["processing"], {"output_directory": self.tmp_dir.name}):
+                data = processing.transform_data(processing.load_and_validate_csv(self.input_file, engine=engine))
+                csv_path = processing.save_processed_data(data, self.input_file)
+
+            loaded = sidecar.load_sidecar(csv_path)
+            buffer = io.StringIO(newline="")
+            columnar.write_rows(loaded, buffer)
+            with open(csv_path, newline="", encoding="utf-8") as csvfile:
+                self.assertEqual(buffer.getvalue(), csvfile.read())
+            # Mapped, not read: values keep their stored dtype and raw columns their codes
+            self.assertIsInstance(loaded["values"]["minutes"], np.memmap)
+            self.assertEqual(loaded["values"]["minutes"].dtype, np.uint8)
+            self.assertEqual(loaded["frame"]["Name"].dtype, "category")
+            self.assertEqual(generation.invoice_frame(loaded).values.tolist(),
+                             generation.invoice_frame(data).values.tolist())
+
+        with open(csv_path, "a", encoding="utf-8") as csvfile:
+            csvfile.write("\n")
+        self.assertIsNone(sidecar.load_sidecar(csv_path))
+
+class TestIncremental(unittest.TestCase):
+    """Test cases for incremental processing of growing exports."""
+    def setUp(self):
+        """Set up a temporary export and output directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.input_file = os.path.join(self.tmp_dir.name, "aktivitaetsbericht-08-2025.csv")
+        patcher = mock.patch.dict(config.config["processing"], {"output_directory": self.tmp_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_growing_export_matches_full_run(self):
+        """Test that merging new sessions gives the same file as processing everything."""
+        write_export(self.input_file, EXPORT_ROWS[:3])
+        incremental.process_incremental(self.input_file)
+        write_export(self.input_file)
+        output_file, changed = incremental.process_incremental(self.input_file)
+        self.assertTrue(changed)
+
+        data = processing.transform_data(processing.load_and_validate_csv(self.input_file))
+        full_output = processing.save_processed_data(data, self.input_file, output_name="full.csv")
+        self.assertTrue(filecmp.cmp(output_file, full_output, shallow=False))
+
+    def test_unchanged_rerun(self):
+        """Test that a rerun on the same export reports no change and keeps the invoice."""
+        write_export(self.input_file)
+        output_file, _ = incremental.process_incremental(self.input_file)
+        _, changed = incremental.process_incremental(self.input_file)
+        self.assertFalse(changed)
+
+        pdf_path = os.path.join(self.tmp_dir.name, "invoice.pdf")
+        self.assertFalse(incremental.invoice_is_current(output_file, pdf_path))
+        open(pdf_path, "wb").close()
+        incremental.record_invoice(output_file, pdf_path)
+        self.assertTrue(incremental.invoice_is_current(output_file, pdf_path))
+
+class TestHistory(unittest.TestCase):
+    """Test cases for the historical session store."""
+    def setUp(self):
+        """Set up a temporary export and output directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.input_file = write_export(os.path.join(self.tmp_dir.name, "aktivitaetsbericht-08-2025.csv"))
+        patcher = mock.patch.dict(config.config["processing"], {"output_directory": self.tmp_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_months_are_replaced_and_queried(self):
+        """Test that reprocessing a month replaces its sessions and that reports filter by date."""
+        for engine in ("rows", "columnar"):
+            data = processing.transform_data(processing.load_and_validate_csv(self.input_file, engine=engine))
+            processing.save_processed_data(data, self.input_file)
+
+        self.assertEqual(history.query_totals(), [("Victoria", 3, 210, 10500)])
+        connection = history.connect()
+        self.assertEqual(connection.execute("SELECT DISTINCT period FROM sessions").fetchall(), [("2025-08",)])
+        connection.close()
+        self.assertEqual(history.query_totals(date(2025, 8, 3), date(2025, 8, 31), group_by="class"),
+                         [("Yin", 1, 75, 2500)])
+        self.assertEqual([row[1:3] for row in history.query_bonus_distribution()],
+                         [(1000, 1), (1500, 1), (2000, 1)])
+
+    def test_failed_stream_keeps_stored_month(self):
+        """Test that a streaming run rejected after some chunks leaves the stored month unchanged."""
+        streaming.stream_process(self.input_file, chunk_size=2)
+        self.assertEqual(history.query_totals(), [("Victoria", 3, 210, 10500)])
+
+        rows = EXPORT_ROWS[:-1] + [EXPORT_ROWS[-1].replace("Abgesagt", "buchbar").replace("13:30", "11:30")]
+        write_export(self.input_file, rows)
+        with self.assertRaises(ValueError):
+            streaming.stream_process(self.input_file, chunk_size=2)
+        self.assertEqual(history.query_totals(), [("Victoria", 3, 210, 10500)])
+        connection = history.connect()
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM staged_sessions").fetchone(), (0,))
+        connection.close()
+
+    def test_months_are_keyed_by_period_and_trainer(self):
+        """Test that fan-out and single runs of a month replace each other's sessions instead of adding up."""
+        with mock.patch.dict(config.config["generation"], {"output_directory": self.tmp_dir.name}):
+            fanout.process_all_trainers(self.input_file, trainers=["Victoria", "Teacher01"], max_workers=1)
+            self.assertEqual(history.query_totals(), [("Teacher01", 1, 60, 4000), ("Victoria", 3, 210, 10500)])
+
+            from modules import pipeline
+            with mock.patch.object(generation, "generate_invoice"):
+                pipeline.run_pipeline(ingest=False, input_file=self.input_file)
+        self.assertEqual(history.query_totals(), [("Teacher01", 1, 60, 4000), ("Victoria", 3, 210, 10500)])
+        self.assertEqual(history.database_path(config.snapshot()),
+                         os.path.join(self.tmp_dir.name, config.history_database))
+
+class TestFanout(unittest.TestCase):
+    """Test cases for billing every trainer of an export in one run."""
+    def setUp(self):
+        """Set up a temporary export and output directories."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.input_file = write_export(os.path.join(self.tmp_dir.name, "aktivitaetsbericht-08-2025.csv"))
+
+    def test_split_by_trainer(self):
+        """Test that the export is grouped by trainer without cancelled classes."""
+        _, groups = fanout.split_by_trainer(self.input_file)
+        self.assertEqual(sorted(groups), ["Teacher01", "Victoria"])
+        self.assertEqual(len(groups["Victoria"]), 3)
+
+    def test_configured_trainers(self):
+        """Test that one CSV and one PDF is written per configured trainer."""
+        with mock.patch.dict(config.config["processing"], {"output_directory": self.tmp_dir.name}), \
+                mock.patch.dict(config.config["generation"], {"output_directory": self.tmp_dir.name}):
+            results, failures = fanout.process_all_trainers(self.input_file, trainers=["Teacher01"],
+                                                            max_workers=1)
+        self.assertEqual(failures, {})
+        self.assertEqual(list(results), ["Teacher01"])
+        for path in results["Teacher01"]:
+            self.assertTrue(os.path.exists(path))
+        # Per-trainer files must not be mistaken for the processed file of the single-trainer workflow
+        self.assertEqual(os.path.dirname(results["Teacher01"][0]), os.path.join(self.tmp_dir.name, "trainers"))
+
+    def test_trainer_slugs_are_distinct(self):
+        """Test that trainers whose names share a slug get numbered slugs instead of overwriting each other."""
+        self.assertEqual(fanout.trainer_slugs(["anna-maria", "Anna Maria", "Victoria"]),
+                         {"Anna Maria": "anna-maria", "Victoria": "victoria", "anna-maria": "anna-maria-2"})
+
+    def test_merged_invoices(self):
+        """Test that all trainers are invoiced in one merged PDF when merge_invoices is enabled."""
+        with mock.patch.dict(config.config["processing"], {"output_directory": self.tmp_dir.name}), \
+                mock.patch.dict(config.config["generation"], {"output_directory": self.tmp_dir.name,
+                                                              "merge_invoices": True}):
+            results, failures = fanout.process_all_trainers(self.input_file, max_workers=1)
+        self.assertEqual(failures, {})
+        self.assertEqual(list(results), ["Teacher01", "Victoria"])
+        self.assertEqual({pdf_path for _, pdf_path in results.values()},
+                         {os.path.join(self.tmp_dir.name, "invoices-08-2025.pdf")})
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir.name, "invoice-victoria-08-2025.pdf")))
+
+class TestBatch(unittest.TestCase):
+    """Test cases for processing every pending export in one run."""
+    def setUp(self):
+        """Set up two monthly exports, a broken one and temporary output directories."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.exports = [write_export(os.path.join(self.tmp_dir.name, f"aktivitaetsbericht-{month}-2025.csv"))
+                        for month in ("08", "07")]
+        self.broken = os.path.join(self.tmp_dir.name, "aktivitaetsbericht-09-2025.csv")
+        with open(self.broken, "w", encoding="utf-8") as export:
+            export.write("Typ;Datum\r\nKlasse;01.09.25\r\n")
+
+    def test_discover_input_files(self):
+        """Test that all exports are found, oldest month first."""
+        found = processing.discover_input_files(self.tmp_dir.name)
+        self.assertEqual([os.path.basename(path)[-11:] for path in found],
+                         ["07-2025.csv", "08-2025.csv", "09-2025.csv"])
+
+    def test_batch_names_invoices_by_month(self):
+        """Test that every export gets an invoice of its own month and a broken one does not stop the batch."""
+        with mock.patch.dict(config.config["processing"], {"output_directory": self.tmp_dir.name}), \
+                mock.patch.dict(config.config["generation"], {"output_directory": self.tmp_dir.name}):
+            results, failures = batch.process_batch(self.exports + [self.broken], executor=ThreadPoolExecutor(2))
+        self.assertEqual(list(failures), [self.broken])
+        self.assertEqual([os.path.basename(pdf) for _, pdf in results.values()],
+                         ["invoice-07-2025.pdf", "invoice-08-2025.pdf"])
+        for csv_path, pdf_path in results.values():
+            self.assertTrue(os.path.exists(csv_path))
+            self.assertTrue(os.path.exists(pdf_path))
+
+class TestBenchmarks(unittest.TestCase):
+    """Test cases for the synthetic export generator and the benchmark harness."""
+    def setUp(self):
+        """Set up a temporary working directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def test_synthetic_export_is_processable(self):
+        """Test that a synthetic export fills every column processing reads."""
+        from benchmarks.synthetic_export import generate_export
+        input_file = generate_export(os.path.join(self.tmp_dir.name, "export.csv"), 500, trainers=3)
+        data = processing.transform_data(processing.load_and_validate_csv(input_file))
+        self.assertGreater(len(data["frame"]), 0)
+        self.assertEqual(set(data["frame"]["Trainer"]), {config.trainer})
+
+    def test_benchmark_times_every_stage(self):
+        """Test that the harness reports every transformation and output step."""
+        from benchmarks.run_benchmarks import benchmark_size
+        output_directory = config.processing_output_directory
+        timings = benchmark_size(200, self.tmp_dir.name)
+        for stage in ("load_and_validate_csv", "add_duration_calculations", "format_for_excel",
+                      "save_processed_data", "build_pdf_tables", "doc.build"):
+            self.assertIn(stage, timings)
+        self.assertEqual(config.processing_output_directory, output_directory)
+
+        # Skipping the PDF steps is opt-in
+        timings = benchmark_size(200, self.tmp_dir.name, pdf_limit=100)
+        self.assertNotIn("doc.build", timings)
+
+class TestStartup(unittest.TestCase):
+    """Test cases for the cold-start cost of the CLI."""
+    def test_menu_does_not_load_heavy_libraries(self):
+        """Test that importing the CLI does not load pandas, NumPy or reportlab."""
+        from benchmarks.startup import loaded_heavy_modules
+        self.assertEqual(loaded_heavy_modules(), [])
+
 if __name__ == "__main__":
     unittest.main()